@@ -0,0 +1,228 @@
+"""
+历史记录统计汇总
+travel_history 上的 INSERT / DELETE / UPDATE 触发器在同一事务内增量维护 analytics_counts，
+看板查询只读这张小表（按维度的计数和预算合计），耗时与历史记录数量无关，也不会全表扫描阻塞写入。
+
+维度：
+- total: 总量（key 为空串）
+- destination: 目的地
+- budget: 预算档位（key 为档位下限）
+- trip_days: 行程天数（超过 MAX_TRIP_DAYS 按 MAX_TRIP_DAYS 统计，日期无法解析时为 0）
+- day: 创建日期（YYYY-MM-DD）
+
+CLI 用法（全量重建，用于回填或修改了统计口径后）:
+    python analytics.py --rebuild
+"""
+import argparse
+import asyncio
+import logging
+from datetime import date, timedelta
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+BUDGET_BUCKETS = (0, 1000, 3000, 5000, 10000, 20000, 50000)  # 预算档位下限（元）
+MAX_TRIP_DAYS = 30
+
+
+def _budget_bucket(row: str) -> str:
+    cases = " ".join(
+        f"WHEN {row}.budget >= {lower} THEN {lower}" for lower in reversed(BUDGET_BUCKETS[1:])
+    )
+    return f"CASE {cases} ELSE {BUDGET_BUCKETS[0]} END"
+
+
+# 维度 -> 计算 key 的 SQL 表达式（{row} 为 NEW / OLD / travel_history）
+DIMENSIONS = {
+    "total": "''",
+    "destination": "{row}.destination",
+    "budget": _budget_bucket("{row}"),
+    "trip_days": (
+        f"MIN(MAX(COALESCE(CAST(julianday({{row}}.end_date) - julianday({{row}}.start_date) AS INTEGER) + 1, 0), 0), "
+        f"{MAX_TRIP_DAYS})"
+    ),
+    "day": "substr({row}.created_at, 1, 10)",
+}
+
+# 影响统计结果的列（UPDATE 触发器只关注这些列，正文迁移等更新不会触发）
+TRACKED_COLUMNS = "destination, budget, start_date, end_date, created_at"
+
+
+def _add_statements(row: str) -> str:
+    return "\n".join(
+        f"""
+            INSERT INTO analytics_counts (dimension, key, plan_count, budget_sum)
+            VALUES ('{dimension}', {expr.format(row=row)}, 1, {row}.budget)
+            ON CONFLICT (dimension, key) DO UPDATE SET
+                plan_count = plan_count + 1,
+                budget_sum = budget_sum + excluded.budget_sum;"""
+        for dimension, expr in DIMENSIONS.items()
+    )
+
+
+def _remove_statements(row: str) -> str:
+    statements = []
+    for dimension, expr in DIMENSIONS.items():
+        key = expr.format(row=row)
+        statements.append(f"""
+            UPDATE analytics_counts SET plan_count = plan_count - 1, budget_sum = budget_sum - {row}.budget
+            WHERE dimension = '{dimension}' AND key = {key};""")
+        if dimension != "total":
+            # 计数归零的 key（例如目的地的最后一条记录被删除）直接移除
+            statements.append(f"""
+            DELETE FROM analytics_counts WHERE dimension = '{dimension}' AND key = {key} AND plan_count <= 0;""")
+    return "\n".join(statements)
+
+
+async def create_tables(db: aiosqlite.Connection):
+    """创建汇总表，并重建触发器（统计口径修改后需执行 --rebuild）"""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_counts (
+            dimension TEXT NOT NULL,
+            key NOT NULL,
+            plan_count INTEGER NOT NULL DEFAULT 0,
+            budget_sum INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, key)
+        ) WITHOUT ROWID
+    """)
+    # 热门目的地按计数取前 N 条
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_analytics_rank ON analytics_counts (dimension, plan_count)"
+    )
+
+    for name in ("analytics_insert", "analytics_delete", "analytics_update"):
+        await db.execute(f"DROP TRIGGER IF EXISTS {name}")
+    await db.execute(f"""
+        CREATE TRIGGER analytics_insert AFTER INSERT ON travel_history
+        BEGIN
+            {_add_statements("NEW")}
+        END
+    """)
+    await db.execute(f"""
+        CREATE TRIGGER analytics_delete AFTER DELETE ON travel_history
+        BEGIN
+            {_remove_statements("OLD")}
+        END
+    """)
+    await db.execute(f"""
+        CREATE TRIGGER analytics_update AFTER UPDATE OF {TRACKED_COLUMNS} ON travel_history
+        BEGIN
+            {_remove_statements("OLD")}
+            {_add_statements("NEW")}
+        END
+    """)
+
+    # 新建的汇总表需要回填已有记录
+    cursor = await db.execute("SELECT 1 FROM analytics_counts WHERE dimension = 'total'")
+    if await cursor.fetchone() is None:
+        cursor = await db.execute("SELECT 1 FROM travel_history LIMIT 1")
+        if await cursor.fetchone() is not None:
+            await rebuild(db)
+
+
+async def rebuild(db: aiosqlite.Connection) -> int:
+    """全量重建汇总表（调用方负责提交事务），返回记录数"""
+    await db.execute("DELETE FROM analytics_counts")
+    for dimension, expr in DIMENSIONS.items():
+        key = expr.format(row="travel_history")
+        await db.execute(f"""
+            INSERT INTO analytics_counts (dimension, key, plan_count, budget_sum)
+            SELECT '{dimension}', {key}, COUNT(*), COALESCE(SUM(budget), 0)
+            FROM travel_history GROUP BY {key}
+        """)
+    cursor = await db.execute("SELECT plan_count FROM analytics_counts WHERE dimension = 'total'")
+    row = await cursor.fetchone()
+    total = row[0] if row else 0
+    logger.info("统计汇总已重建（%d 条记录）", total)
+    return total
+
+
+async def summary(db: aiosqlite.Connection, top: int = 10, days: int = 30) -> dict:
+    """
+    读取看板数据（只查询汇总表）
+
+    Args:
+        top: 热门目的地数量
+        days: 每日规划量的天数（含今天）
+    """
+    cursor = await db.execute(
+        "SELECT plan_count, budget_sum FROM analytics_counts WHERE dimension = 'total'"
+    )
+    row = await cursor.fetchone()
+    total, budget_sum = (row[0], row[1]) if row else (0, 0)
+
+    cursor = await db.execute(
+        """
+        SELECT key, plan_count, budget_sum FROM analytics_counts
+        WHERE dimension = 'destination' ORDER BY plan_count DESC LIMIT ?
+        """,
+        (top,)
+    )
+    destinations = [
+        {"destination": key, "plan_count": count, "avg_budget": round(amount / count)}
+        for key, count, amount in await cursor.fetchall()
+    ]
+
+    cursor = await db.execute(
+        "SELECT key, plan_count FROM analytics_counts WHERE dimension = 'budget'"
+    )
+    bucket_counts = dict(await cursor.fetchall())
+    uppers = list(BUDGET_BUCKETS[1:]) + [None]
+    budgets = [
+        {"min": lower, "max": upper, "plan_count": bucket_counts.get(lower, 0)}
+        for lower, upper in zip(BUDGET_BUCKETS, uppers)
+    ]
+
+    cursor = await db.execute(
+        "SELECT key, plan_count FROM analytics_counts WHERE dimension = 'trip_days' ORDER BY key"
+    )
+    trip_days = [{"days": key, "plan_count": count} for key, count in await cursor.fetchall()]
+
+    # 补齐没有规划的日期，方便前端直接画折线
+    first_day = date.today() - timedelta(days=max(days, 1) - 1)
+    cursor = await db.execute(
+        "SELECT key, plan_count FROM analytics_counts WHERE dimension = 'day' AND key >= ?",
+        (first_day.isoformat(),)
+    )
+    day_counts = dict(await cursor.fetchall())
+    daily = []
+    for offset in range(max(days, 1)):
+        day = (first_day + timedelta(days=offset)).isoformat()
+        daily.append({"date": day, "plan_count": day_counts.get(day, 0)})
+
+    return {
+        "total_plans": total,
+        "avg_budget": round(budget_sum / total) if total else 0,
+        "top_destinations": destinations,
+        "budget_distribution": budgets,
+        "trip_days": trip_days,  # days 为 0 表示日期无法解析，为 MAX_TRIP_DAYS 表示不少于该天数
+        "daily_volume": daily,
+    }
+
+
+# ========== CLI ==========
+
+async def _main(args):
+    from database import DATABASE_PATH, init_db
+
+    await init_db()
+    if args.rebuild:
+        async with aiosqlite.connect(DATABASE_PATH) as db:
+            total = await rebuild(db)
+            await db.commit()
+        print(f"已重建统计汇总：{total} 条记录")
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        result = await summary(db, top=args.top, days=args.days)
+    print(f"规划总数 {result['total_plans']}，平均预算 {result['avg_budget']} 元")
+    for item in result["top_destinations"]:
+        print(f"  {item['destination']}: {item['plan_count']} 条，平均 {item['avg_budget']} 元")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="历史记录统计汇总")
+    parser.add_argument("--rebuild", action="store_true", help="从 travel_history 全量重建汇总表")
+    parser.add_argument("--top", type=int, default=10, help="显示的热门目的地数量")
+    parser.add_argument("--days", type=int, default=30, help="每日规划量的天数")
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    asyncio.run(_main(parser.parse_args()))
@@ -6,17 +6,33 @@ from langchain_openai import ChatOpenAI
 load_dotenv()
 
 # 2. 配置你的 LLM（从 .env 读取敏感信息）
-llm = ChatOpenAI(
-    openai_api_key=os.getenv("OPENAI_API_KEY"),
-    openai_api_base=os.getenv("OPENAI_API_BASE"),
-    model=os.getenv("OPENAI_MODEL", "gemini-3-flash-preview"),
-    temperature=0.7
-)
-
-# 3. 测试一下 (冒烟测试)
-try:
-    print("正在连接 API...")
-    response = llm.invoke("你好，请回复'连接成功'四个字。")
-    print(f"{response.content}")
-except Exception as e:
-    print(f"配置出错啦: {e}")
+def _build_llm(http_async_client=None) -> ChatOpenAI:
+    return ChatOpenAI(
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        openai_api_base=os.getenv("OPENAI_API_BASE"),
+        model=os.getenv("OPENAI_MODEL", "gemini-3-flash-preview"),
+        temperature=0.7,
+        # 重试由 resilience.py 按阶段策略控制，避免与客户端内置重试叠加
+        max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "0")),
+        # 为 None 时使用 SDK 默认客户端
+        http_async_client=http_async_client
+    )
+
+
+llm = _build_llm()
+
+
+def bind_http_client(client=None):
+    """让 llm 的异步调用走指定的 HTTP 客户端（lifespan 中绑定共享连接池，关闭前传 None 解绑）"""
+    global llm
+    llm = _build_llm(client)
+
+
+# 3. 测试一下 (冒烟测试：python apiset.py)
+if __name__ == "__main__":
+    try:
+        print("正在连接 API...")
+        response = llm.invoke("你好，请回复'连接成功'四个字。")
+        print(f"{response.content}")
+    except Exception as e:
+        print(f"配置出错啦: {e}")
@@ -0,0 +1,270 @@
+"""
+静态资源管线
+启动时为前端资源生成带内容哈希的文件名和 gzip / brotli 预压缩版本：
+- /assets/<name>.<hash>.<ext>: 内容不变则 URL 不变，Cache-Control: immutable，可永久缓存
+- /: HTML 外壳引用带哈希的文件名，Cache-Control: no-cache，通过 ETag 重新验证（未变化时返回 304）
+- /static/<name>: 已指纹化的资源重定向到 /assets/ 下的带哈希地址；其它文件（开发用页面等）
+  按 no-cache + ETag 返回，不会被浏览器按启发式规则缓存成旧版本
+
+开发时设置 ASSET_RELOAD=1，外壳请求会检查源文件是否变化（最多每 ASSET_RELOAD_INTERVAL 秒一次 stat）并重建；
+默认只在启动时构建，请求路径上没有文件系统访问。
+
+两者都按 Accept-Encoding 协商压缩格式（br > gzip > 原文），使用强 ETag。
+brotli 为可选依赖，未安装时只生成 gzip。
+
+CLI 用法（输出到目录，供 nginx / CDN 直接托管）:
+    python assets.py build -o dist
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import RedirectResponse, Response
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.getenv("STATIC_DIR", "static")
+ASSET_RELOAD = os.getenv("ASSET_RELOAD", "0") == "1"  # 开发模式：源文件变化后自动重建
+ASSET_RELOAD_INTERVAL = float(os.getenv("ASSET_RELOAD_INTERVAL", "1"))
+ASSET_PREFIX = "/assets/"
+SHELL = "index.html"
+BUNDLED = ("style.css", "markdown.js", "app.js")  # 由外壳引用、需要指纹化的资源
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+MIN_COMPRESS_SIZE = 256  # 小于该大小不压缩
+
+ENCODINGS = ("br", "gzip")  # 协商优先级
+SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+# 外壳中对 /static/<name> 的引用
+_STATIC_REF = re.compile(r'(src|href)="/static/([^"?#]+)"')
+
+
+@dataclass
+class Asset:
+    """一个已构建的资源：原文及各压缩版本"""
+    name: str  # 对外文件名（带哈希）
+    media_type: str
+    digest: str  # 内容哈希，用作 ETag
+    variants: Dict[str, bytes]  # 编码 -> 内容（identity 为原文）
+    cache_control: str
+
+    def etag(self, encoding: str) -> str:
+        # 不同编码是不同的表示，强 ETag 必须不同
+        return f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+
+
+def _media_type(name: str) -> str:
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if media_type.startswith("text/") or media_type == "application/javascript":
+        media_type += "; charset=utf-8"
+    return media_type
+
+
+def _compress(data: bytes) -> Dict[str, bytes]:
+    """生成压缩版本；压缩后不更小的版本丢弃"""
+    variants = {"identity": data}
+    if len(data) < MIN_COMPRESS_SIZE:
+        return variants
+    # mtime=0 使输出可复现
+    candidates = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        candidates["br"] = brotli.compress(data, quality=11)
+    for encoding, body in candidates.items():
+        if len(body) < len(data):
+            variants[encoding] = body
+    return variants
+
+
+def _fingerprint(name: str, digest: str) -> str:
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{digest[:10]}{ext}"
+
+
+def negotiate(accept_encoding: str, available) -> str:
+    """按 Accept-Encoding 选择编码（q=0 表示拒绝），没有可用压缩版本时返回 identity"""
+    accepted: Dict[str, float] = {}
+    for part in (accept_encoding or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+
+    best, best_q = "identity", 0.0
+    for encoding in ENCODINGS:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if encoding in available and q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 使用弱比较"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class AssetBundle:
+    """内存中的资源集合；开发模式下源文件修改时间变化后自动重建"""
+
+    def __init__(self, static_dir: str = STATIC_DIR, reload: bool = ASSET_RELOAD,
+                 reload_interval: float = ASSET_RELOAD_INTERVAL):
+        self.static_dir = static_dir
+        self.reload = reload
+        self.reload_interval = reload_interval
+        self.assets: Dict[str, Asset] = {}  # 带哈希的文件名 -> 资源
+        self.manifest: Dict[str, str] = {}  # 源文件名 -> 带哈希的文件名
+        self.shell: Optional[Asset] = None
+        self._mtimes: Dict[str, float] = {}
+        self._checked_at = 0.0
+        self._others: Dict[str, Tuple[float, Asset]] = {}  # 未指纹化的其它文件：名称 -> (mtime, 资源)
+
+    def _sources(self):
+        return (SHELL,) + BUNDLED
+
+    def _current_mtimes(self) -> Dict[str, float]:
+        mtimes = {}
+        for name in self._sources():
+            try:
+                mtimes[name] = os.stat(os.path.join(self.static_dir, name)).st_mtime
+            except FileNotFoundError:
+                mtimes[name] = 0.0
+        return mtimes
+
+    def refresh_if_changed(self):
+        """启动时调用；开发模式下外壳请求也会调用（见 shell_response）。只做几次 stat，源文件变化时重建"""
+        self._checked_at = time.monotonic()
+        mtimes = self._current_mtimes()
+        if mtimes != self._mtimes:
+            self.build()
+            self._mtimes = mtimes
+
+    def build(self):
+        assets, manifest = {}, {}
+        for name in BUNDLED:
+            path = os.path.join(self.static_dir, name)
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()[:16]
+            hashed = _fingerprint(name, digest)
+            assets[hashed] = Asset(hashed, _media_type(name), digest, _compress(data), IMMUTABLE)
+            manifest[name] = hashed
+
+        with open(os.path.join(self.static_dir, SHELL), encoding="utf-8") as f:
+            html = f.read()
+        # 只替换已指纹化的资源，其它 /static 引用保持不变
+        html = _STATIC_REF.sub(
+            lambda m: f'{m.group(1)}="{ASSET_PREFIX}{manifest[m.group(2)]}"' if m.group(2) in manifest else m.group(0),
+            html
+        )
+        data = html.encode("utf-8")
+        shell = Asset(SHELL, _media_type(SHELL), hashlib.sha256(data).hexdigest()[:16], _compress(data), REVALIDATE)
+
+        self.assets, self.manifest, self.shell = assets, manifest, shell
+        logger.info(
+            "静态资源已构建: %s",
+            ", ".join(f"{name} {len(a.variants['identity'])}B/{min(len(v) for v in a.variants.values())}B"
+                      for name, a in list(assets.items()) + [(SHELL, shell)])
+        )
+
+    def respond(self, asset: Asset, request: Request) -> Response:
+        encoding = negotiate(request.headers.get("accept-encoding", ""), asset.variants)
+        etag = asset.etag(encoding)
+        headers = {"ETag": etag, "Cache-Control": asset.cache_control, "Vary": "Accept-Encoding"}
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(asset.variants[encoding], media_type=asset.media_type, headers=headers)
+
+    def shell_response(self, request: Request) -> Response:
+        # 生产环境只在启动时构建；开发模式按间隔检查源文件，避免每个请求都 stat
+        if self.shell is None or (self.reload and time.monotonic() - self._checked_at >= self.reload_interval):
+            self.refresh_if_changed()
+        return self.respond(self.shell, request)
+
+    def static_response(self, name: str, request: Request) -> Response:
+        """旧的 /static 地址：指纹化资源重定向到带哈希的地址，其它文件按需重新验证"""
+        if self.shell is None:
+            self.refresh_if_changed()
+        if name == SHELL:
+            return RedirectResponse("/", status_code=301)
+        if name in self.manifest:
+            return RedirectResponse(ASSET_PREFIX + self.manifest[name], status_code=301)
+
+        root = os.path.realpath(self.static_dir)
+        path = os.path.realpath(os.path.join(root, name))
+        if os.path.dirname(path) != root or not os.path.isfile(path):
+            return Response(status_code=404)
+        mtime = os.stat(path).st_mtime
+        cached = self._others.get(name)
+        if cached is None or cached[0] != mtime:
+            with open(path, "rb") as f:
+                data = f.read()
+            asset = Asset(name, _media_type(name), hashlib.sha256(data).hexdigest()[:16], _compress(data), REVALIDATE)
+            cached = self._others[name] = (mtime, asset)
+        return self.respond(cached[1], request)
+
+    def asset_response(self, name: str, request: Request) -> Response:
+        asset = self.assets.get(name)
+        if asset is None:
+            return Response(status_code=404)
+        return self.respond(asset, request)
+
+    def write(self, out_dir: str):
+        """把构建结果（含 .gz / .br 和 manifest.json）写入目录"""
+        os.makedirs(out_dir, exist_ok=True)
+        for asset in list(self.assets.values()) + [self.shell]:
+            for encoding, body in asset.variants.items():
+                with open(os.path.join(out_dir, asset.name + SUFFIXES.get(encoding, "")), "wb") as f:
+                    f.write(body)
+        with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+
+
+asset_bundle = AssetBundle()
+
+
+# ========== CLI ==========
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="构建指纹化、预压缩的静态资源")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build", help="构建并写入输出目录")
+    build_cmd.add_argument("-o", "--output", default="dist", help="输出目录")
+    build_cmd.add_argument("--static-dir", default=STATIC_DIR, help="源目录")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    bundle = AssetBundle(args.static_dir)
+    bundle.build()
+    bundle.write(args.output)
+    print(f"已写入 {args.output}/（brotli: {'是' if brotli else '否，未安装'}）")
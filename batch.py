@@ -0,0 +1,270 @@
+"""
+批量旅行规划模块
+从 JSONL 读取 (departure, destination, start_date, end_date, budget) 行，
+去重后用有界的 asyncio worker 池并发调用 plan_travel，
+按批量事务写入 travel_history，并支持断点续跑。
+
+批量任务与在线请求只共享 resilience 中的 LLM 并发槽位，不计入在线负载
+（load_controller 的排队深度），避免离线任务把在线请求推入降级模式。
+
+CLI 用法:
+    python batch.py rows.jsonl -o results.jsonl --workers 4
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sys
+from typing import AsyncIterable, AsyncIterator, Iterable, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from database import init_db, save_batch_results, mark_batch_failed, get_batch_done, get_plan_by_id
+from schemas import TravelRequest
+from travel_agent import plan_travel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "8"))  # /batch 接口允许的最大并发 worker 数
+FLUSH_SIZE = 20  # 每攒够多少条结果写一次数据库
+FLUSH_INTERVAL = 5.0  # 或者距上次写入超过多少秒
+
+
+def row_key(request: TravelRequest) -> str:
+    """规范化后的行指纹（用于去重和断点续跑）"""
+    normalized = json.dumps(
+        [request.departure.strip(), request.destination.strip(),
+         request.start_date, request.end_date, request.budget],
+        ensure_ascii=False
+    )
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+class _JsonlParser:
+    """逐行解析 JSONL 并去重（同步 / 异步输入共用）"""
+
+    def __init__(self):
+        self.rows: List[Tuple[str, TravelRequest]] = []
+        self.events: List[dict] = []
+        self._seen = set()
+
+    def feed(self, line_no: int, line: str):
+        line = line.strip()
+        if not line:
+            return
+        try:
+            request = TravelRequest(**json.loads(line))
+        except (json.JSONDecodeError, TypeError, ValidationError) as e:
+            self.events.append({"type": "row", "line": line_no, "status": "invalid", "error": str(e)})
+            return
+        key = row_key(request)
+        if key in self._seen:
+            self.events.append({"type": "row", "line": line_no, "key": key, "status": "duplicate"})
+            return
+        self._seen.add(key)
+        self.rows.append((key, request))
+
+
+def parse_jsonl(lines: Iterable[str]) -> Tuple[List[Tuple[str, TravelRequest]], List[dict]]:
+    """
+    解析 JSONL 并去重
+
+    Returns:
+        (去重后的 [(row_key, request)], 解析失败/重复行的事件列表)
+    """
+    parser = _JsonlParser()
+    for line_no, line in enumerate(lines, start=1):
+        parser.feed(line_no, line)
+    return parser.rows, parser.events
+
+
+async def aparse_jsonl(lines: AsyncIterable[str]) -> Tuple[List[Tuple[str, TravelRequest]], List[dict]]:
+    """parse_jsonl 的异步版本（逐行消费，不需要先把整个输入读入内存）"""
+    parser = _JsonlParser()
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        parser.feed(line_no, line)
+    return parser.rows, parser.events
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """把字节块流切分为文本行（按 \\n 切分后再解码，多字节字符跨块也不会被截断）"""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8", errors="replace")
+    if pending:
+        yield pending.decode("utf-8", errors="replace")
+
+
+def _request_id(batch_id: str, key: str) -> str:
+    """批量任务中单行对应的检查点线程 ID"""
+    return f"batch:{batch_id}:{key}"
+
+
+def default_batch_id(rows: List[Tuple[str, TravelRequest]]) -> str:
+    """同一批输入得到同一个 batch_id，重新提交即可续跑"""
+    digest = hashlib.sha1("\n".join(sorted(key for key, _ in rows)).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+async def run_batch(
+    lines: Iterable[str],
+    batch_id: Optional[str] = None,
+    workers: int = DEFAULT_WORKERS
+) -> AsyncIterator[dict]:
+    """
+    执行批量规划，逐条产出进度 / 结果事件（可直接序列化为 JSONL）
+
+    事件类型：
+        start    - 批量任务开始（batch_id、总行数、已完成行数）
+        row      - 单行结果（status: done / resumed / failed / duplicate / invalid）
+        progress - 累计进度
+        summary  - 结束汇总
+    """
+    rows, parse_events = parse_jsonl(lines)
+    async for event in run_parsed_batch(rows, parse_events, batch_id, workers):
+        yield event
+
+
+async def run_parsed_batch(
+    rows: List[Tuple[str, TravelRequest]],
+    parse_events: List[dict],
+    batch_id: Optional[str] = None,
+    workers: int = DEFAULT_WORKERS
+) -> AsyncIterator[dict]:
+    """执行已解析（parse_jsonl / aparse_jsonl）的批量任务，事件同 run_batch"""
+    batch_id = batch_id or default_batch_id(rows)
+    done = await get_batch_done(batch_id)
+    pending = [(key, req) for key, req in rows if key not in done]
+
+    yield {"type": "start", "batch_id": batch_id, "total": len(rows), "resumed": len(rows) - len(pending)}
+    for event in parse_events:
+        yield event
+
+    # 已完成的行直接回放结果
+    for key, req in rows:
+        if key in done:
+            record = await get_plan_by_id(done[key])
+            yield {
+                "type": "row", "key": key, "status": "resumed", "plan_id": done[key],
+                "destination": req.destination, "plan": record.plan_content if record else ""
+            }
+
+    stats = {"done": len(rows) - len(pending), "failed": 0, "total": len(rows)}
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in pending:
+        queue.put_nowait(item)
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def worker():
+        while True:
+            try:
+                key, req = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                # 每行使用固定的检查点线程，任务被杀后续跑时从该行最后完成的节点继续
+                plan = await plan_travel(
+                    budget=req.budget,
+                    destination=req.destination,
+                    start_date=req.start_date,
+                    end_date=req.end_date,
+                    departure=req.departure,
+                    request_id=_request_id(batch_id, key)
+                )
+                await results.put((key, req, plan, None))
+            except Exception as e:
+                await results.put((key, req, None, str(e)))
+
+    tasks = [asyncio.create_task(worker()) for _ in range(max(1, min(workers, len(pending))))]
+    buffer = []
+
+    async def flush():
+        """把缓冲的成功结果在一个事务里写入，并记录进度"""
+        payload = [
+            {
+                "row_key": key, "departure": req.departure, "destination": req.destination,
+                "budget": req.budget, "start_date": req.start_date, "end_date": req.end_date,
+                "plan_content": plan, "request_id": _request_id(batch_id, key)
+            }
+            for key, req, plan in buffer
+        ]
+        plan_ids = await save_batch_results(batch_id, payload)
+        events = [
+            {"type": "row", "key": key, "status": "done", "plan_id": plan_id,
+             "destination": req.destination, "plan": plan}
+            for (key, req, plan), plan_id in zip(buffer, plan_ids)
+        ]
+        buffer.clear()
+        return events
+
+    try:
+        remaining = len(pending)
+        while remaining:
+            try:
+                key, req, plan, error = await asyncio.wait_for(results.get(), FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                # 长时间没有新结果时也把已有结果落盘，保证断点尽量新
+                if buffer:
+                    for event in await flush():
+                        yield event
+                    yield {"type": "progress", **stats}
+                continue
+
+            remaining -= 1
+            if error is None:
+                buffer.append((key, req, plan))
+                stats["done"] += 1
+            else:
+                stats["failed"] += 1
+                await mark_batch_failed(batch_id, key, error)
+                yield {"type": "row", "key": key, "status": "failed",
+                       "destination": req.destination, "error": error}
+
+            if len(buffer) >= FLUSH_SIZE or not remaining:
+                if buffer:
+                    for event in await flush():
+                        yield event
+                yield {"type": "progress", **stats}
+    finally:
+        # 调用方中途断开时取消剩余任务；已落盘的进度不受影响
+        for task in tasks:
+            task.cancel()
+        if buffer:
+            await flush()
+
+    yield {"type": "summary", "batch_id": batch_id, **stats}
+
+
+# ========== CLI ==========
+
+async def _main(args):
+    await init_db()
+    out = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    try:
+        # 逐行读取输入文件，不先读成整个列表
+        with open(args.input, encoding="utf-8") as f:
+            async for event in run_batch(f, batch_id=args.batch_id, workers=args.workers):
+                out.write(json.dumps(event, ensure_ascii=False) + "\n")
+                out.flush()
+                if out is not sys.stdout and event["type"] in ("progress", "summary"):
+                    print(json.dumps(event, ensure_ascii=False), file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="从 JSONL 批量生成旅行规划")
+    parser.add_argument("input", help="输入 JSONL 文件，每行一个 TravelRequest")
+    parser.add_argument("-o", "--output", help="结果 JSONL 输出文件（默认输出到 stdout）")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="并发 worker 数")
+    parser.add_argument("--batch-id", help="批量任务 ID（默认由输入内容生成，重跑同一文件会续跑）")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,171 @@
+"""
+流式管线 A/B 对比
+对同一批请求分别用 two_pass（方案 + 定稿）和 fused（单次定稿）模式跑 plan_travel_stream，
+统计首字时间（TTFT）、总耗时和预算准确度（本地解析 "预算明细" 段落，不额外调用 LLM）。
+对比期间关闭相似历史方案的复用和参考注入，避免缓存方案影响两种模式的结果。
+
+CLI 用法:
+    python bench_pipeline.py --runs 3
+    python bench_pipeline.py rows.jsonl --runs 2 -o bench.jsonl
+"""
+import argparse
+import asyncio
+import json
+import re
+import sys
+import time
+from typing import Dict, List, Optional
+
+from database import init_db
+from load_control import percentile
+from schemas import TravelRequest
+from travel_agent import plan_travel_stream, PIPELINE_TWO_PASS, PIPELINE_FUSED
+
+BUDGET_CATEGORIES = ("交通", "住宿", "餐饮", "门票", "其他")
+
+DEFAULT_CASES = [
+    TravelRequest(budget=5000, departure="上海", destination="北京", start_date="2026-11-01", end_date="2026-11-04"),
+    TravelRequest(budget=3000, departure="广州", destination="成都", start_date="2026-12-05", end_date="2026-12-07"),
+    TravelRequest(budget=8000, departure="北京", destination="三亚", start_date="2027-01-10", end_date="2027-01-15"),
+]
+
+_SECTION_END = re.compile(r"\n#{1,3} ")
+_AMOUNT = re.compile(r"(\d[\d,]*(?:\.\d+)?)\s*(?:元|块|RMB|¥)?")
+
+
+def parse_budget_section(plan: str) -> Dict[str, int]:
+    """从定稿文本的 "预算明细" 段落中提取各类别金额（每类取第一个数字）"""
+    start = plan.find("预算明细")
+    if start == -1:
+        return {}
+    section = plan[start:]
+    end = _SECTION_END.search(section, 1)
+    if end:
+        section = section[:end.start()]
+
+    amounts = {}
+    for line in section.splitlines():
+        for category in BUDGET_CATEGORIES:
+            if category in line and category not in amounts:
+                match = _AMOUNT.search(line, line.index(category) + len(category))
+                if match:
+                    amounts[category] = int(float(match.group(1).replace(",", "")))
+                break
+    return amounts
+
+
+def budget_accuracy(plan: str, budget: int) -> dict:
+    """预算准确度：各项合计与用户预算的相对偏差、是否超支"""
+    amounts = parse_budget_section(plan)
+    total = sum(amounts.values())
+    return {
+        "budget_parsed": len(amounts),
+        "budget_total": total,
+        "budget_error": round(abs(total - budget) / budget, 4) if amounts else None,
+        "over_budget": total > budget if amounts else None,
+    }
+
+
+async def run_once(request: TravelRequest, pipeline: str) -> dict:
+    """跑一次流式规划并记录耗时指标"""
+    started = time.perf_counter()
+    ttft: Optional[float] = None
+    plan = ""
+    error = None
+    try:
+        async for event in plan_travel_stream(
+            request.budget, request.departure, request.destination,
+            request.start_date, request.end_date, pipeline, reuse_history=False
+        ):
+            data = json.loads(event.replace("data: ", "", 1).strip())
+            if data["type"] == "chunk" and ttft is None:
+                ttft = time.perf_counter() - started
+            elif data["type"] == "done":
+                plan = data["content"]
+    except Exception as e:
+        error = str(e)
+
+    return {
+        "pipeline": pipeline,
+        "destination": request.destination,
+        "budget": request.budget,
+        "ttft": round(ttft, 3) if ttft is not None else None,
+        "total": round(time.perf_counter() - started, 3),
+        "chars": len(plan),
+        "error": error,
+        **budget_accuracy(plan, request.budget),
+    }
+
+
+def summarize(records: List[dict], pipeline: str) -> dict:
+    """按模式汇总：TTFT / 总耗时 / 预算偏差的 p50 与 p95（与负载控制同为最近秩法）、超支率"""
+    ok = [r for r in records if r["pipeline"] == pipeline and r["error"] is None]
+    ttfts = [r["ttft"] for r in ok if r["ttft"] is not None]
+    totals = [r["total"] for r in ok]
+    parsed = [r for r in ok if r["budget_error"] is not None]
+    errors = [r["budget_error"] for r in parsed]
+    return {
+        "pipeline": pipeline,
+        "runs": len([r for r in records if r["pipeline"] == pipeline]),
+        "errors": len([r for r in records if r["pipeline"] == pipeline and r["error"]]),
+        "ttft_p50": round(percentile(ttfts, 0.5), 3) if ttfts else None,
+        "ttft_p95": round(percentile(ttfts, 0.95), 3) if ttfts else None,
+        "total_p50": round(percentile(totals, 0.5), 3) if totals else None,
+        "total_p95": round(percentile(totals, 0.95), 3) if totals else None,
+        "budget_error_p50": round(percentile(errors, 0.5), 4) if errors else None,
+        "budget_error_p95": round(percentile(errors, 0.95), 4) if errors else None,
+        "over_budget_rate": round(sum(r["over_budget"] for r in parsed) / len(parsed), 3) if parsed else None,
+        "budget_parse_rate": round(len(parsed) / len(ok), 3) if ok else None,
+    }
+
+
+async def run_bench(cases: List[TravelRequest], runs: int, pipelines: List[str]) -> List[dict]:
+    """依次执行对比；每轮交替模式顺序，避免缓存 / 预热偏向某一方"""
+    records = []
+    for round_no in range(runs):
+        order = pipelines if round_no % 2 == 0 else list(reversed(pipelines))
+        for request in cases:
+            for pipeline in order:
+                record = await run_once(request, pipeline)
+                record["round"] = round_no
+                records.append(record)
+                print(json.dumps(record, ensure_ascii=False), file=sys.stderr)
+    return records
+
+
+# ========== CLI ==========
+
+def _print_table(summaries: List[dict]):
+    columns = ["pipeline", "runs", "errors", "ttft_p50", "ttft_p95", "total_p50", "total_p95",
+               "budget_error_p50", "budget_error_p95", "over_budget_rate", "budget_parse_rate"]
+    widths = [max(len(c), *(len(str(s[c])) for s in summaries)) for c in columns]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for s in summaries:
+        print("  ".join(str(s[c]).ljust(w) for c, w in zip(columns, widths)))
+
+
+async def _main(args):
+    # 全新数据库上也能运行（调研缓存、历史记录等表）
+    await init_db()
+    if args.input:
+        with open(args.input, encoding="utf-8") as f:
+            cases = [TravelRequest(**json.loads(line)) for line in f if line.strip()]
+    else:
+        cases = DEFAULT_CASES
+
+    pipelines = [p.strip() for p in args.pipelines.split(",") if p.strip()]
+    records = await run_bench(cases, args.runs, pipelines)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    _print_table([summarize(records, p) for p in pipelines])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比 two_pass 与 fused 流式管线的延迟和预算准确度")
+    parser.add_argument("input", nargs="?", help="请求 JSONL（每行一个 TravelRequest），默认使用内置样例")
+    parser.add_argument("--runs", type=int, default=3, help="每个请求每种模式的运行轮数")
+    parser.add_argument("--pipelines", default=f"{PIPELINE_TWO_PASS},{PIPELINE_FUSED}", help="参与对比的模式，逗号分隔")
+    parser.add_argument("-o", "--output", help="逐次运行记录输出文件（JSONL）")
+    asyncio.run(_main(parser.parse_args()))
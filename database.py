@@ -3,12 +3,37 @@
 使用 SQLite + aiosqlite 异步操作
 """
 import aiosqlite
+import asyncio
+import logging
 from datetime import datetime
-from typing import List, Optional
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
 from pydantic import BaseModel
 
+import analytics
+import plan_store
+
+logger = logging.getLogger(__name__)
+
 DATABASE_PATH = "travel_history.db"
 
+# 规划写入 / 删除的监听器（例如相似方案索引的增量更新）
+PLAN_SAVED = "saved"
+PLAN_DELETED = "deleted"
+_plan_listeners: List[Callable[[str, dict], None]] = []
+
+
+def add_plan_listener(listener: Callable[[str, dict], None]):
+    """注册监听器：listener(event, record)，event 为 saved / deleted"""
+    _plan_listeners.append(listener)
+
+
+def _notify(event: str, record: dict):
+    for listener in _plan_listeners:
+        try:
+            listener(event, record)
+        except Exception as e:
+            logger.warning("规划监听器处理 %s 事件失败: %s", event, e)
+
 
 class TravelRecord(BaseModel):
     """旅行记录模型"""
@@ -20,6 +45,7 @@ class TravelRecord(BaseModel):
     end_date: str
     plan_content: str
     created_at: str
+    request_id: str = ""  # 对应的 LangGraph 检查点线程 ID
 
 
 async def init_db():
@@ -35,7 +61,9 @@ async def init_db():
                 start_date TEXT NOT NULL,
                 end_date TEXT NOT NULL,
                 plan_content TEXT NOT NULL,
-                created_at TEXT NOT NULL
+                created_at TEXT NOT NULL,
+                request_id TEXT DEFAULT '',
+                plan_hash TEXT DEFAULT ''
             )
         """)
         
@@ -44,8 +72,102 @@ async def init_db():
             await db.execute("ALTER TABLE travel_history ADD COLUMN departure TEXT DEFAULT ''")
         except:
             pass  # 列已存在
-            
+        
+        # 尝试添加 request_id 列（关联 LangGraph 检查点，用于重新定稿）
+        try:
+            await db.execute("ALTER TABLE travel_history ADD COLUMN request_id TEXT DEFAULT ''")
+        except:
+            pass  # 列已存在
+        
+        # 尝试添加 plan_hash 列（正文迁移到 plan_blobs 后只保存内容哈希）
+        try:
+            await db.execute("ALTER TABLE travel_history ADD COLUMN plan_hash TEXT DEFAULT ''")
+        except:
+            pass  # 列已存在
+        
+        # 删除记录时检查正文是否仍被引用（plan_store.delete_orphans），避免全表扫描
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_history_plan_hash ON travel_history(plan_hash)")
+        # 按幂等键查找已保存的规划（/travel-plan 重复提交同一 request_id）
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_history_request_id ON travel_history(request_id)")
+        
+        # 规划正文：内容寻址 + 共享字典压缩，旧的明文正文在此迁移
+        await plan_store.create_tables(db)
+        await plan_store.ensure_dictionary(db)
+        migrated = await plan_store.migrate_plans(db)
+        
+        # 统计汇总表：由触发器随 travel_history 的写入 / 删除增量维护
+        await analytics.create_tables(db)
+        
+        # 目的地知识库：按 (目的地, 月份) 预计算的调研结果
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS destination_research (
+                destination TEXT NOT NULL,
+                month TEXT NOT NULL,
+                research TEXT NOT NULL,
+                version INTEGER NOT NULL DEFAULT 1,
+                refreshed_at TEXT NOT NULL,
+                PRIMARY KEY (destination, month)
+            )
+        """)
+        
+        # 知识库补充：按 (出发地, 目的地) 缓存的交通搜索结果
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS departure_transport (
+                departure TEXT NOT NULL,
+                destination TEXT NOT NULL,
+                search_results TEXT NOT NULL,
+                refreshed_at TEXT NOT NULL,
+                PRIMARY KEY (departure, destination)
+            )
+        """)
+        
+        # 批量任务进度表（用于断点续跑）
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS batch_progress (
+                batch_id TEXT NOT NULL,
+                row_key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                plan_id INTEGER,
+                error TEXT DEFAULT '',
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (batch_id, row_key)
+            )
+        """)
+
+        await db.commit()
+
+        if migrated:
+            # 回收明文正文占用的页，让数据库文件真正变小
+            await db.execute("VACUUM")
+            logger.info("已迁移 %d 条规划正文到压缩存储", migrated)
+
+
+async def refresh_plan_dictionary() -> Optional[int]:
+    """按需重新训练正文压缩字典（独立连接和事务，训练在线程池中执行），返回当前字典 ID"""
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        dict_id = await plan_store.ensure_dictionary(db)
         await db.commit()
+    return dict_id
+
+
+# 后台维护任务的引用（避免任务被垃圾回收）
+_maintenance_tasks: set = set()
+
+
+def _schedule_dictionary_check():
+    """写入足够多的正文后，在后台检查是否需要重新训练字典（不阻塞当前请求）"""
+    if not plan_store.retrain_check_due():
+        return
+
+    async def run():
+        try:
+            await refresh_plan_dictionary()
+        except Exception as e:
+            logger.warning("重新训练压缩字典失败: %s", e)
+
+    task = asyncio.create_task(run())
+    _maintenance_tasks.add(task)
+    task.add_done_callback(_maintenance_tasks.discard)
 
 
 async def save_plan(
@@ -54,39 +176,142 @@ async def save_plan(
     start_date: str,
     end_date: str,
     plan_content: str,
-    departure: str = ""
+    departure: str = "",
+    request_id: str = ""
 ) -> int:
     """保存旅行规划到数据库"""
     async with aiosqlite.connect(DATABASE_PATH) as db:
+        digest = await plan_store.put_plan(db, plan_content)
         cursor = await db.execute(
             """
             INSERT INTO travel_history 
-            (departure, destination, budget, start_date, end_date, plan_content, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+            (departure, destination, budget, start_date, end_date, plan_content, created_at, request_id, plan_hash)
+            VALUES (?, ?, ?, ?, ?, '', ?, ?, ?)
             """,
-            (departure, destination, budget, start_date, end_date, plan_content, 
-             datetime.now().isoformat())
+            (departure, destination, budget, start_date, end_date, 
+             datetime.now().isoformat(), request_id, digest)
         )
         await db.commit()
-        return cursor.lastrowid
+    _schedule_dictionary_check()
+    _notify(PLAN_SAVED, {
+        "id": cursor.lastrowid, "departure": departure, "destination": destination, "budget": budget,
+        "start_date": start_date, "end_date": end_date, "plan_content": plan_content
+    })
+    return cursor.lastrowid
+
+
+async def _to_records(db: aiosqlite.Connection, rows, include_plan: bool = True) -> List[TravelRecord]:
+    """把查询行转换为记录，并从 plan_blobs 解压正文（未迁移的行直接使用明文）"""
+    plans = await plan_store.load_plans(db, [row["plan_hash"] for row in rows]) if include_plan else {}
+    records = []
+    for row in rows:
+        data = dict(row)
+        digest = data.pop("plan_hash")
+        if not include_plan:
+            data["plan_content"] = ""
+        elif digest:
+            data["plan_content"] = plans.get(digest, data["plan_content"])
+        records.append(TravelRecord(**data))
+    return records
+
 
+async def get_history(
+    limit: int = 20,
+    cursor: Optional[int] = None,
+    include_plan: bool = True
+) -> Tuple[List[TravelRecord], Optional[int]]:
+    """
+    获取历史记录列表（按 id 倒序的键集分页）
 
-async def get_history(limit: int = 20) -> List[TravelRecord]:
-    """获取历史记录列表"""
+    Args:
+        limit: 每页条数
+        cursor: 上一页返回的 next_cursor（只返回 id 小于它的记录）
+        include_plan: 是否解压并返回正文；列表展示时传 False，plan_content 为空
+
+    Returns:
+        (记录列表, 下一页游标；没有更多记录时为 None)
+    """
     async with aiosqlite.connect(DATABASE_PATH) as db:
         db.row_factory = aiosqlite.Row
-        cursor = await db.execute(
+        cur = await db.execute(
             """
             SELECT id, COALESCE(departure, '') as departure, destination, 
-                   budget, start_date, end_date, plan_content, created_at
+                   budget, start_date, end_date, plan_content, created_at,
+                   COALESCE(request_id, '') as request_id, plan_hash
             FROM travel_history 
-            ORDER BY created_at DESC 
+            WHERE id < ?
+            ORDER BY id DESC 
             LIMIT ?
             """,
-            (limit,)
+            (cursor if cursor is not None else 2 ** 63 - 1, limit)
         )
-        rows = await cursor.fetchall()
-        return [TravelRecord(**dict(row)) for row in rows]
+        rows = await cur.fetchall()
+        records = await _to_records(db, rows, include_plan)
+        next_cursor = rows[-1]["id"] if len(rows) == limit else None
+        return records, next_cursor
+
+
+async def iter_history(
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None,
+    destination: Optional[str] = None,
+    include_plan: bool = True,
+    chunk_size: int = 500
+) -> AsyncIterator[List[dict]]:
+    """
+    按 id 顺序分块读取历史记录（用于导出）
+
+    每块是一次独立的键集分页查询（id > 上一块最后的 id），
+    内存占用只与 chunk_size 有关，也不会在整个导出期间占用读锁阻塞写入。
+
+    Args:
+        created_from: 创建时间下限（含），ISO 日期或时间
+        created_to: 创建时间上限（不含），ISO 日期或时间
+        destination: 目的地精确匹配
+        include_plan: 是否解压并返回正文
+    """
+    conditions = ["id > ?"]
+    params: list = []
+    if created_from:
+        conditions.append("created_at >= ?")
+        params.append(created_from)
+    if created_to:
+        conditions.append("created_at < ?")
+        params.append(created_to)
+    if destination:
+        conditions.append("destination = ?")
+        params.append(destination)
+    sql = f"""
+        SELECT id, COALESCE(departure, '') as departure, destination,
+               budget, start_date, end_date, plan_content, created_at,
+               COALESCE(request_id, '') as request_id, plan_hash
+        FROM travel_history WHERE {' AND '.join(conditions)}
+        ORDER BY id LIMIT ?
+    """
+
+    last_id = 0
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        db.row_factory = aiosqlite.Row
+        while True:
+            cursor = await db.execute(sql, (last_id, *params, chunk_size))
+            rows = await cursor.fetchall()
+            if not rows:
+                return
+            plans = await plan_store.load_plans(db, [row["plan_hash"] for row in rows]) if include_plan else {}
+            chunk = []
+            for row in rows:
+                data = dict(row)
+                digest = data.pop("plan_hash")
+                if include_plan:
+                    if digest:
+                        data["plan_content"] = plans.get(digest, data["plan_content"])
+                else:
+                    del data["plan_content"]
+                chunk.append(data)
+            last_id = rows[-1]["id"]
+            yield chunk
+            if len(rows) < chunk_size:
+                return
 
 
 async def get_plan_by_id(plan_id: int) -> Optional[TravelRecord]:
@@ -96,23 +321,127 @@ async def get_plan_by_id(plan_id: int) -> Optional[TravelRecord]:
         cursor = await db.execute(
             """
             SELECT id, COALESCE(departure, '') as departure, destination,
-                   budget, start_date, end_date, plan_content, created_at
+                   budget, start_date, end_date, plan_content, created_at,
+                   COALESCE(request_id, '') as request_id, plan_hash
             FROM travel_history WHERE id = ?
             """,
             (plan_id,)
         )
         row = await cursor.fetchone()
         if row:
-            return TravelRecord(**dict(row))
+            return (await _to_records(db, [row]))[0]
+        return None
+
+
+async def get_plan_by_request_id(request_id: str) -> Optional[TravelRecord]:
+    """根据 request_id（幂等键）获取最新保存的规划"""
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(
+            """
+            SELECT id, COALESCE(departure, '') as departure, destination,
+                   budget, start_date, end_date, plan_content, created_at,
+                   COALESCE(request_id, '') as request_id, plan_hash
+            FROM travel_history WHERE request_id = ? ORDER BY id DESC LIMIT 1
+            """,
+            (request_id,)
+        )
+        row = await cursor.fetchone()
+        if row:
+            return (await _to_records(db, [row]))[0]
         return None
 
 
 async def delete_plan(plan_id: int) -> bool:
     """删除旅行规划"""
     async with aiosqlite.connect(DATABASE_PATH) as db:
+        row = await (await db.execute(
+            "SELECT plan_hash FROM travel_history WHERE id = ?", (plan_id,)
+        )).fetchone()
         cursor = await db.execute(
             "DELETE FROM travel_history WHERE id = ?",
             (plan_id,)
         )
+        if row:
+            # 正文可能被其他记录共享，只删除已无引用的
+            await plan_store.delete_orphans(db, [row[0]])
         await db.commit()
-        return cursor.rowcount > 0
+    if cursor.rowcount > 0:
+        _notify(PLAN_DELETED, {"id": plan_id})
+    return cursor.rowcount > 0
+
+
+async def get_analytics(top: int = 10, days: int = 30) -> dict:
+    """读取统计看板数据（只查询触发器维护的汇总表）"""
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        return await analytics.summary(db, top=top, days=days)
+
+
+# ========== 批量任务 ==========
+
+async def save_batch_results(batch_id: str, results: List[dict]) -> List[int]:
+    """
+    在同一个事务中批量写入规划并记录批量任务进度
+    
+    Args:
+        batch_id: 批量任务 ID
+        results: [{"row_key", "departure", "destination", "budget",
+                   "start_date", "end_date", "plan_content", "request_id"}, ...]
+    
+    Returns:
+        与 results 顺序一致的 plan_id 列表
+    """
+    plan_ids = []
+    now = datetime.now().isoformat()
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        for r in results:
+            digest = await plan_store.put_plan(db, r["plan_content"])
+            cursor = await db.execute(
+                """
+                INSERT INTO travel_history 
+                (departure, destination, budget, start_date, end_date, plan_content, created_at, request_id, plan_hash)
+                VALUES (?, ?, ?, ?, ?, '', ?, ?, ?)
+                """,
+                (r["departure"], r["destination"], r["budget"], r["start_date"],
+                 r["end_date"], now, r.get("request_id", ""), digest)
+            )
+            plan_ids.append(cursor.lastrowid)
+        
+        await db.executemany(
+            """
+            INSERT OR REPLACE INTO batch_progress 
+            (batch_id, row_key, status, plan_id, error, updated_at)
+            VALUES (?, ?, 'done', ?, '', ?)
+            """,
+            [(batch_id, r["row_key"], plan_id, now) for r, plan_id in zip(results, plan_ids)]
+        )
+        await db.commit()
+    _schedule_dictionary_check()
+    for r, plan_id in zip(results, plan_ids):
+        _notify(PLAN_SAVED, {**r, "id": plan_id})
+    return plan_ids
+
+
+async def mark_batch_failed(batch_id: str, row_key: str, error: str):
+    """记录批量任务中失败的行（续跑时会重新执行）"""
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        await db.execute(
+            """
+            INSERT OR REPLACE INTO batch_progress 
+            (batch_id, row_key, status, plan_id, error, updated_at)
+            VALUES (?, ?, 'failed', NULL, ?, ?)
+            """,
+            (batch_id, row_key, error, datetime.now().isoformat())
+        )
+        await db.commit()
+
+
+async def get_batch_done(batch_id: str) -> Dict[str, int]:
+    """获取批量任务中已完成的行：row_key -> plan_id"""
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        cursor = await db.execute(
+            "SELECT row_key, plan_id FROM batch_progress WHERE batch_id = ? AND status = 'done'",
+            (batch_id,)
+        )
+        rows = await cursor.fetchall()
+        return {row_key: plan_id for row_key, plan_id in rows}
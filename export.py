@@ -0,0 +1,158 @@
+"""
+历史记录批量导出
+按块读取 travel_history，逐块编码为 NDJSON / CSV，可选实时 gzip 压缩，
+内存占用与表大小无关。
+
+CLI 用法:
+    python export.py -o history.ndjson
+    python export.py --format csv --gzip --from 2026-01-01 --to 2026-02-01 -o jan.csv.gz
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import sys
+import zlib
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, Optional
+
+from database import init_db, iter_history
+
+FORMAT_NDJSON = "ndjson"
+FORMAT_CSV = "csv"
+
+MEDIA_TYPES = {
+    FORMAT_NDJSON: "application/x-ndjson",
+    FORMAT_CSV: "text/csv; charset=utf-8",
+}
+
+COLUMNS = ["id", "departure", "destination", "budget", "start_date", "end_date",
+           "created_at", "request_id", "plan_content"]
+
+
+def validate_date_range(created_from: Optional[str], created_to: Optional[str]):
+    """
+    在开始流式输出之前校验日期范围（YYYY-MM-DD 或 ISO 时间）
+
+    Raises:
+        ValueError: 日期格式无效
+    """
+    for name, value in (("created_from", created_from), ("created_to", created_to)):
+        if not value:
+            continue
+        try:
+            date.fromisoformat(value) if len(value) == 10 else datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"{name} 不是有效日期（YYYY-MM-DD）: {value}")
+
+
+def date_upper_bound(value: Optional[str]) -> Optional[str]:
+    """把包含式的结束日期（YYYY-MM-DD）转换为不含的上界；带时间的值原样使用"""
+    if not value or len(value) != 10:
+        return value
+    return (date.fromisoformat(value) + timedelta(days=1)).isoformat()
+
+
+def _encode_chunk(rows: list, fmt: str, columns: list, header: bool) -> str:
+    if fmt == FORMAT_NDJSON:
+        return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+async def export_history(
+    fmt: str = FORMAT_NDJSON,
+    gzip: bool = False,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None,
+    destination: Optional[str] = None,
+    include_plan: bool = True,
+    chunk_size: int = 500
+) -> AsyncIterator[bytes]:
+    """
+    流式导出历史记录
+
+    Args:
+        fmt: ndjson 或 csv
+        gzip: 是否输出 gzip 流
+        created_from / created_to: 创建日期范围（均包含，YYYY-MM-DD）
+        destination: 只导出该目的地
+        include_plan: 是否包含规划正文
+
+    Yields:
+        编码（及压缩）后的字节块
+    """
+    columns = COLUMNS if include_plan else COLUMNS[:-1]
+    # wbits=31 生成带 gzip 头的流，可直接保存为 .gz 文件
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+    first = True
+
+    async for rows in iter_history(
+        created_from=created_from,
+        created_to=date_upper_bound(created_to),
+        destination=destination,
+        include_plan=include_plan,
+        chunk_size=chunk_size
+    ):
+        data = _encode_chunk(rows, fmt, columns, header=first).encode("utf-8")
+        first = False
+        if compressor:
+            data = compressor.compress(data)
+        if data:
+            yield data
+
+    if first and fmt == FORMAT_CSV:
+        # 没有数据时也输出表头
+        data = _encode_chunk([], fmt, columns, header=True).encode("utf-8")
+        yield compressor.compress(data) + compressor.flush() if compressor else data
+    elif compressor:
+        yield compressor.flush()
+
+
+def export_filename(fmt: str, gzip: bool) -> str:
+    name = f"travel_history_{date.today().isoformat()}.{fmt}"
+    return name + ".gz" if gzip else name
+
+
+# ========== CLI ==========
+
+async def _main(args):
+    await init_db()
+    try:
+        validate_date_range(args.created_from, args.created_to)
+    except ValueError as e:
+        sys.exit(str(e))
+    gzip = args.gzip or bool(args.output and args.output.endswith(".gz"))
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        async for data in export_history(
+            fmt=args.format,
+            gzip=gzip,
+            created_from=args.created_from,
+            created_to=args.created_to,
+            destination=args.destination,
+            include_plan=not args.no_plan,
+            chunk_size=args.chunk_size
+        ):
+            out.write(data)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="导出旅行历史记录（NDJSON / CSV）")
+    parser.add_argument("-o", "--output", help="输出文件（默认 stdout；以 .gz 结尾时自动压缩）")
+    parser.add_argument("--format", choices=[FORMAT_NDJSON, FORMAT_CSV], default=FORMAT_NDJSON)
+    parser.add_argument("--gzip", action="store_true", help="输出 gzip 压缩流")
+    parser.add_argument("--from", dest="created_from", help="创建日期下限（含），YYYY-MM-DD")
+    parser.add_argument("--to", dest="created_to", help="创建日期上限（含），YYYY-MM-DD")
+    parser.add_argument("--destination", help="只导出该目的地")
+    parser.add_argument("--no-plan", action="store_true", help="不导出规划正文")
+    parser.add_argument("--chunk-size", type=int, default=500, help="每次读取的行数")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,271 @@
+"""
+LangGraph 检查点存储（SQLite）
+每个 request_id（thread_id）只保留最新一个检查点，压缩存储并按 TTL 过期。
+失败重试或任务重启时从最后完成的节点继续，而不是从头重跑整个流程。
+"""
+import os
+import time
+import zlib
+from typing import Any, AsyncIterator, Optional, Sequence
+
+import aiosqlite
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+from database import DATABASE_PATH
+
+CHECKPOINT_TTL_SECONDS = float(os.getenv("CHECKPOINT_TTL_HOURS", "24")) * 3600
+PURGE_EVERY = 100  # 每写入多少次检查点清理一次过期数据
+
+
+class SqliteCheckpointSaver(BaseCheckpointSaver[str]):
+    """只保留最新检查点的紧凑型异步 SQLite 检查点存储"""
+
+    def __init__(self, db_path: str = DATABASE_PATH, ttl_seconds: float = CHECKPOINT_TTL_SECONDS):
+        super().__init__()
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self._initialized = False
+        self._puts = 0
+
+    # ---------- 存储细节 ----------
+
+    def _dump(self, value: Any) -> tuple:
+        type_, data = self.serde.dumps_typed(value)
+        return type_, zlib.compress(data)
+
+    def _load(self, type_: str, data: bytes) -> Any:
+        return self.serde.loads_typed((type_, zlib.decompress(data)))
+
+    async def _connect(self) -> aiosqlite.Connection:
+        db = await aiosqlite.connect(self.db_path)
+        if not self._initialized:
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS graph_checkpoints (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    parent_id TEXT,
+                    type TEXT NOT NULL,
+                    checkpoint BLOB NOT NULL,
+                    metadata_type TEXT NOT NULL,
+                    metadata BLOB NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (thread_id, checkpoint_ns)
+                )
+            """)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS graph_writes (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    channel TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    task_path TEXT DEFAULT '',
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                )
+            """)
+            await db.commit()
+            self._initialized = True
+        return db
+
+    async def purge_expired(self) -> int:
+        """删除超过 TTL 的检查点及其挂起写入，返回删除的检查点数量"""
+        cutoff = time.time() - self.ttl_seconds
+        db = await self._connect()
+        try:
+            cursor = await db.execute("DELETE FROM graph_checkpoints WHERE updated_at < ?", (cutoff,))
+            await db.execute("""
+                DELETE FROM graph_writes WHERE NOT EXISTS (
+                    SELECT 1 FROM graph_checkpoints c
+                    WHERE c.thread_id = graph_writes.thread_id
+                      AND c.checkpoint_ns = graph_writes.checkpoint_ns
+                      AND c.checkpoint_id = graph_writes.checkpoint_id
+                )
+            """)
+            await db.commit()
+            return cursor.rowcount
+        finally:
+            await db.close()
+
+    # ---------- BaseCheckpointSaver 异步接口 ----------
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        db = await self._connect()
+        try:
+            cursor = await db.execute(
+                """
+                SELECT checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata, updated_at
+                FROM graph_checkpoints WHERE thread_id = ? AND checkpoint_ns = ?
+                """,
+                (thread_id, checkpoint_ns)
+            )
+            row = await cursor.fetchone()
+            if row is None:
+                return None
+            checkpoint_id, parent_id, type_, checkpoint, meta_type, metadata, updated_at = row
+            # 只保留最新检查点：请求更早的检查点或已过期时视为不存在
+            requested_id = get_checkpoint_id(config)
+            if requested_id and requested_id != checkpoint_id:
+                return None
+            if updated_at < time.time() - self.ttl_seconds:
+                return None
+
+            cursor = await db.execute(
+                """
+                SELECT task_id, channel, type, value FROM graph_writes
+                WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+                ORDER BY task_path, task_id, idx
+                """,
+                (thread_id, checkpoint_ns, checkpoint_id)
+            )
+            writes = await cursor.fetchall()
+        finally:
+            await db.close()
+
+        return CheckpointTuple(
+            config={"configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint_id,
+            }},
+            checkpoint=self._load(type_, checkpoint),
+            metadata=self._load(meta_type, metadata),
+            parent_config=(
+                {"configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": parent_id,
+                }}
+                if parent_id else None
+            ),
+            pending_writes=[
+                (task_id, channel, self._load(w_type, value))
+                for task_id, channel, w_type, value in writes
+            ],
+        )
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        # 每个线程只有一个检查点，列表即最新检查点
+        if config is None:
+            return
+        checkpoint_tuple = await self.aget_tuple(config)
+        if checkpoint_tuple is None:
+            return
+        if filter and any(checkpoint_tuple.metadata.get(k) != v for k, v in filter.items()):
+            return
+        yield checkpoint_tuple
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        type_, data = self._dump(checkpoint)
+        meta_type, meta = self._dump(get_checkpoint_metadata(config, metadata))
+
+        db = await self._connect()
+        try:
+            await db.execute(
+                """
+                INSERT OR REPLACE INTO graph_checkpoints
+                (thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint,
+                 metadata_type, metadata, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                 type_, data, meta_type, meta, time.time())
+            )
+            # 旧检查点的挂起写入已合并进新检查点，不再需要
+            await db.execute(
+                "DELETE FROM graph_writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id != ?",
+                (thread_id, checkpoint_ns, checkpoint["id"])
+            )
+            await db.commit()
+        finally:
+            await db.close()
+
+        self._puts += 1
+        if self._puts % PURGE_EVERY == 0:
+            await self.purge_expired()
+
+        return {"configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint["id"],
+        }}
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, data = self._dump(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id,
+                         WRITES_IDX_MAP.get(channel, idx), channel, type_, data, task_path))
+
+        # 特殊通道（错误/中断等）可覆盖，普通写入重复时保留第一次
+        verb = "REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "IGNORE"
+        db = await self._connect()
+        try:
+            await db.executemany(
+                f"""
+                INSERT OR {verb} INTO graph_writes
+                (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows
+            )
+            await db.commit()
+        finally:
+            await db.close()
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        db = await self._connect()
+        try:
+            await db.execute("DELETE FROM graph_checkpoints WHERE thread_id = ?", (thread_id,))
+            await db.execute("DELETE FROM graph_writes WHERE thread_id = ?", (thread_id,))
+            await db.commit()
+        finally:
+            await db.close()
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}"
@@ -0,0 +1,422 @@
+"""
+应用级共享 HTTP 连接池
+- LLM 客户端（ChatOpenAI）通过同一个 httpx.AsyncClient 发出请求：keep-alive 连接复用、
+  总连接数 / 每主机并发上限、安装 h2 时启用 HTTP/2、DNS 结果缓存
+- 遵循 HTTP_PROXY / HTTPS_PROXY / ALL_PROXY / NO_PROXY 环境变量（与 httpx 的 trust_env 一致），
+  代理按 URL 模式挂载为各自的连接池，HTTP_TRUST_ENV=0 时忽略
+- 连接池饱和指标（排队次数、等待时间、在途请求、连接数）通过 /health 暴露
+
+覆盖范围：只有 httpx 流量（LLM）经过本连接池。同步搜索库（DDGS）使用自己的 HTTP 会话，
+在 run_blocking 的固定大小线程池中运行、每个线程复用一个会话，不享受这里的 DNS 缓存、
+每主机并发上限和代理挂载（DDGS 自己读取代理环境变量）；snapshot 中只为它单独统计调用次数和耗时。
+
+客户端在 FastAPI lifespan 中创建并绑定到 apiset.llm，lifespan 结束时解绑并关闭；
+lifespan 之外（CLI、冒烟测试）llm 使用 SDK 默认客户端。
+"""
+import asyncio
+import ipaddress
+import logging
+import os
+import socket
+import time
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+import httpcore
+import httpx
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    HTTP2_AVAILABLE = True
+except ImportError:  # h2 为可选依赖
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "100"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "64"))  # 每个主机的并发请求上限
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "1") == "1" and HTTP2_AVAILABLE
+DNS_CACHE_TTL = float(os.getenv("DNS_CACHE_TTL", "300"))
+BLOCKING_HTTP_WORKERS = int(os.getenv("BLOCKING_HTTP_WORKERS", "8"))  # 同步 HTTP 库（DDGS）的线程数
+HTTP_TRUST_ENV = os.getenv("HTTP_TRUST_ENV", "1") == "1"  # 是否读取代理环境变量
+
+T = TypeVar("T")
+
+
+# ========== 指标 ==========
+
+@dataclass
+class PoolMetrics:
+    """连接池指标（只在事件循环线程中更新）"""
+    requests: int = 0
+    errors: int = 0  # 传输层异常 + 5xx
+    waiting: int = 0  # 当前因每主机上限排队的请求
+    waited: int = 0  # 累计排队过的请求数
+    wait_time_total: float = 0.0
+    wait_time_max: float = 0.0
+    headers_time_total: float = 0.0  # 发出请求到收到响应头
+    responses: int = 0
+    dns_hits: int = 0
+    dns_misses: int = 0
+    in_flight: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    peak_in_flight: int = 0
+    # 同步 HTTP 库（不经过连接池，只统计调用）
+    blocking_calls: int = 0
+    blocking_in_flight: int = 0
+    blocking_time_total: float = 0.0
+
+
+metrics = PoolMetrics()
+
+
+# ========== DNS 缓存 ==========
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+class CachingDNSBackend(httpcore.AsyncNetworkBackend):
+    """在 httpcore 网络层之前缓存 DNS 解析结果；TLS SNI 和 Host 头仍使用原主机名"""
+
+    def __init__(self, backend: httpcore.AsyncNetworkBackend, ttl: float = DNS_CACHE_TTL):
+        self._backend = backend
+        self._ttl = ttl
+        self._cache: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}
+
+    async def _resolve(self, host: str, port: int) -> List[str]:
+        if _is_ip(host):
+            return [host]
+        now = time.monotonic()
+        cached = self._cache.get((host, port))
+        if cached and cached[0] > now:
+            metrics.dns_hits += 1
+            return cached[1]
+        metrics.dns_misses += 1
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        self._cache[(host, port)] = (now + self._ttl, addresses)
+        return addresses
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        addresses = await self._resolve(host, port)
+        error: Optional[Exception] = None
+        for address in addresses:
+            try:
+                return await self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout, OSError) as e:
+                error = e
+        # 所有地址都连不上时丢弃缓存，下次重新解析
+        self._cache.pop((host, port), None)
+        raise error
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds: float):
+        await self._backend.sleep(seconds)
+
+
+# ========== 传输层 ==========
+
+# httpcore 异常 -> httpx 异常（从具体到一般），上层（openai SDK）按 httpx 异常类型处理超时和连接错误
+_EXCEPTION_MAP = (
+    (httpcore.ConnectTimeout, httpx.ConnectTimeout),
+    (httpcore.ReadTimeout, httpx.ReadTimeout),
+    (httpcore.WriteTimeout, httpx.WriteTimeout),
+    (httpcore.PoolTimeout, httpx.PoolTimeout),
+    (httpcore.TimeoutException, httpx.TimeoutException),
+    (httpcore.ConnectError, httpx.ConnectError),
+    (httpcore.ReadError, httpx.ReadError),
+    (httpcore.WriteError, httpx.WriteError),
+    (httpcore.NetworkError, httpx.NetworkError),
+    (httpcore.ProxyError, httpx.ProxyError),
+    (httpcore.UnsupportedProtocol, httpx.UnsupportedProtocol),
+    (httpcore.RemoteProtocolError, httpx.RemoteProtocolError),
+    (httpcore.LocalProtocolError, httpx.LocalProtocolError),
+    (httpcore.ProtocolError, httpx.ProtocolError),
+)
+
+
+def _map_exception(exc: Exception, request: httpx.Request) -> Exception:
+    for core_type, httpx_type in _EXCEPTION_MAP:
+        if isinstance(exc, core_type):
+            mapped = httpx_type(str(exc), request=request)
+            mapped.__cause__ = exc
+            return mapped
+    return exc
+
+
+class _ResponseStream(httpx.AsyncByteStream):
+    """转换响应体异常；读完或关闭时释放主机并发名额（流式响应在整个流期间占用名额）"""
+
+    def __init__(self, stream, request: httpx.Request, release):
+        self._stream = stream
+        self._request = request
+        self._release = release
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        except Exception as e:
+            raise _map_exception(e, self._request)
+
+    async def aclose(self):
+        try:
+            if hasattr(self._stream, "aclose"):
+                await self._stream.aclose()
+        finally:
+            self._release()
+
+
+class PooledTransport(httpx.AsyncBaseTransport):
+    """
+    httpx 传输层：直接持有 httpcore 连接池
+    - 通过连接池的 network_backend 参数接入 DNS 缓存
+    - 在连接池之上按主机限制并发请求数，并记录排队指标
+    - 传入 proxy 时经该代理转发（http(s):// 代理，或安装 socksio 时的 socks5://）
+    """
+
+    def __init__(self, max_per_host: int = HTTP_MAX_PER_HOST, proxy: Optional[str] = None):
+        options = dict(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            http1=True,
+            http2=HTTP2_ENABLED,
+            network_backend=CachingDNSBackend(httpcore.AnyIOBackend()),
+        )
+        self.proxy: Optional[str] = None  # 不含用户名密码，用于日志和指标
+        if proxy is None:
+            self.pool = httpcore.AsyncConnectionPool(**options)
+        else:
+            # 与 httpx.AsyncHTTPTransport 的代理处理一致：代理 URL 中的用户名密码作为 Proxy-Authorization
+            parsed = httpx.Proxy(proxy)
+            self.proxy = str(parsed.url.copy_with(username=None, password=None))
+            proxy_url = httpcore.URL(
+                scheme=parsed.url.raw_scheme,
+                host=parsed.url.raw_host,
+                port=parsed.url.port,
+                target=parsed.url.raw_path,
+            )
+            if parsed.url.scheme in ("socks5", "socks5h"):
+                self.pool = httpcore.AsyncSOCKSProxy(proxy_url=proxy_url, proxy_auth=parsed.raw_auth, **options)
+            else:
+                self.pool = httpcore.AsyncHTTPProxy(
+                    proxy_url=proxy_url, proxy_auth=parsed.raw_auth, proxy_headers=parsed.headers.raw, **options
+                )
+        self._max_per_host = max_per_host
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+
+    async def _acquire(self, host: str) -> asyncio.Semaphore:
+        slots = self._slots.setdefault(host, asyncio.Semaphore(self._max_per_host))
+        if slots.locked():
+            metrics.waited += 1
+            metrics.waiting += 1
+            started = time.perf_counter()
+            try:
+                await slots.acquire()
+            finally:
+                metrics.waiting -= 1
+            waited = time.perf_counter() - started
+            metrics.wait_time_total += waited
+            metrics.wait_time_max = max(metrics.wait_time_max, waited)
+        else:
+            await slots.acquire()
+        return slots
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        slots = await self._acquire(host)
+        metrics.in_flight[host] += 1
+        metrics.peak_in_flight = max(metrics.peak_in_flight, sum(metrics.in_flight.values()))
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                metrics.in_flight[host] -= 1
+                slots.release()
+
+        core_request = httpcore.Request(
+            method=request.method,
+            url=httpcore.URL(
+                scheme=request.url.raw_scheme,
+                host=request.url.raw_host,
+                port=request.url.port,
+                target=request.url.raw_path,
+            ),
+            headers=request.headers.raw,
+            content=request.stream,
+            extensions=request.extensions,
+        )
+        try:
+            response = await self.pool.handle_async_request(core_request)
+        except BaseException as e:
+            metrics.errors += 1
+            release()
+            if isinstance(e, Exception):
+                raise _map_exception(e, request)
+            raise
+        return httpx.Response(
+            status_code=response.status,
+            headers=response.headers,
+            stream=_ResponseStream(response.stream, request, release),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self.pool.aclose()
+
+
+def env_proxy_mounts() -> Dict[str, Optional[str]]:
+    """
+    按代理环境变量生成 httpx mounts 模式 -> 代理 URL（None 表示直连，对应 NO_PROXY）
+
+    规则与 httpx 的 trust_env 相同：HTTP_PROXY / HTTPS_PROXY / ALL_PROXY 分别挂到
+    http:// / https:// / all://，NO_PROXY 中的主机（含子域名）直连，NO_PROXY=* 时全部直连。
+    """
+    proxies = urllib.request.getproxies()
+    mounts: Dict[str, Optional[str]] = {}
+    for scheme in ("http", "https", "all"):
+        url = proxies.get(scheme)
+        if url:
+            mounts[f"{scheme}://"] = url if "://" in url else f"http://{url}"
+    for host in (h.strip() for h in proxies.get("no", "").split(",")):
+        if not host:
+            continue
+        if host == "*":
+            return {}
+        if host.startswith("."):
+            mounts[f"all://*{host}"] = None
+        elif _is_ip(host.split("/")[0]) or host == "localhost":
+            mounts[f"all://{host}"] = None
+        else:
+            mounts[f"all://*{host}"] = None
+    return mounts if any(mounts.values()) else {}
+
+
+# ========== 事件钩子 ==========
+
+async def _on_request(request: httpx.Request):
+    metrics.requests += 1
+    request.extensions["http_pool_started"] = time.perf_counter()
+
+
+async def _on_response(response: httpx.Response):
+    started = response.request.extensions.get("http_pool_started")
+    if started is not None:
+        metrics.responses += 1
+        metrics.headers_time_total += time.perf_counter() - started
+    if response.status_code >= 500:
+        metrics.errors += 1
+
+
+# ========== 客户端 ==========
+
+_async_client: Optional[httpx.AsyncClient] = None
+_transports: List[PooledTransport] = []
+_blocking_executor: Optional[ThreadPoolExecutor] = None
+
+
+def open_client() -> httpx.AsyncClient:
+    """创建共享异步 HTTP 客户端（FastAPI lifespan 启动时调用，与 aclose 成对使用）"""
+    global _async_client
+    if _async_client is None:
+        direct = PooledTransport()
+        # 自定义 transport 时 httpx 不再读取代理环境变量，这里按同样的规则挂载代理连接池
+        mounts = {
+            pattern: PooledTransport(proxy=url) if url else None
+            for pattern, url in (env_proxy_mounts() if HTTP_TRUST_ENV else {}).items()
+        }
+        _transports[:] = [direct, *(t for t in mounts.values() if t is not None)]
+        _async_client = httpx.AsyncClient(
+            transport=direct,
+            mounts=mounts,
+            event_hooks={"request": [_on_request], "response": [_on_response]},
+        )
+        logger.info(
+            "共享 HTTP 客户端已创建: HTTP/2=%s, 连接上限 %d（keep-alive %d），每主机并发 %d，代理 %s",
+            HTTP2_ENABLED, HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_MAX_PER_HOST,
+            sorted(pattern for pattern, transport in mounts.items() if transport) or "无"
+        )
+    return _async_client
+
+
+def blocking_executor() -> ThreadPoolExecutor:
+    """同步 HTTP 库使用的固定大小线程池（线程内可复用各自的会话）"""
+    global _blocking_executor
+    if _blocking_executor is None:
+        _blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_HTTP_WORKERS, thread_name_prefix="http-blocking")
+    return _blocking_executor
+
+
+async def run_blocking(fn: Callable[..., T], *args, **kwargs) -> T:
+    """在 blocking_executor 中运行同步 HTTP 调用，并记录调用次数和耗时（这类流量不经过连接池）"""
+    metrics.blocking_calls += 1
+    metrics.blocking_in_flight += 1
+    started = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(blocking_executor(), partial(fn, *args, **kwargs))
+    finally:
+        metrics.blocking_in_flight -= 1
+        metrics.blocking_time_total += time.perf_counter() - started
+
+
+async def aclose():
+    """关闭共享客户端（含代理连接池）和线程池（lifespan 结束时调用）"""
+    global _async_client, _blocking_executor
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+        _transports.clear()
+    if _blocking_executor is not None:
+        _blocking_executor.shutdown(wait=False, cancel_futures=True)
+        _blocking_executor = None
+
+
+def snapshot() -> dict:
+    """连接池与饱和指标快照（pooled 只含 httpx 流量；blocking 为不经过连接池的同步 HTTP 库）"""
+    connections = [c for transport in _transports for c in transport.pool.connections]
+    idle = sum(1 for c in connections if c.is_idle())
+    in_flight = {host: n for host, n in metrics.in_flight.items() if n}
+    return {
+        "covers": ["llm"],
+        "http2": HTTP2_ENABLED,
+        "proxies": sorted({t.proxy for t in _transports if t.proxy}),
+        "requests": metrics.requests,
+        "errors": metrics.errors,
+        "connections": len(connections),
+        "idle_connections": idle,
+        "max_connections": HTTP_MAX_CONNECTIONS,
+        "in_flight": in_flight,
+        "peak_in_flight": metrics.peak_in_flight,
+        "max_per_host": HTTP_MAX_PER_HOST,
+        "waiting": metrics.waiting,
+        "waited": metrics.waited,
+        "avg_wait_ms": round(metrics.wait_time_total / metrics.waited * 1000, 1) if metrics.waited else 0.0,
+        "max_wait_ms": round(metrics.wait_time_max * 1000, 1),
+        "avg_headers_ms": round(metrics.headers_time_total / metrics.responses * 1000, 1) if metrics.responses else 0.0,
+        "dns_cache": {"hits": metrics.dns_hits, "misses": metrics.dns_misses},
+        "blocking": {
+            "covers": ["ddgs_search"],
+            "pooled": False,  # 各线程自己的会话：无 DNS 缓存 / 每主机上限 / 连接指标
+            "workers": BLOCKING_HTTP_WORKERS,
+            "calls": metrics.blocking_calls,
+            "in_flight": metrics.blocking_in_flight,
+            "avg_ms": round(metrics.blocking_time_total / metrics.blocking_calls * 1000, 1)
+            if metrics.blocking_calls else 0.0,
+        },
+    }
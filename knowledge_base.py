@@ -0,0 +1,206 @@
+"""
+目的地知识库模块
+按 (目的地, 月份) 维护预计算的调研结果，由后台任务从 travel_history 中
+挑选最热门的目的地定期刷新；流式规划命中新鲜记录时调研阶段只需一次查询。
+
+预计算调研不区分出发地（departure 为空，交通只有通用建议）；命中时由
+travel_agent._research 附加出发地相关的交通信息，该信息按 (出发地, 目的地)
+缓存在 departure_transport 表中，过期（KB_TRANSPORT_MAX_AGE_HOURS）后才重新搜索。
+
+地名统一经 normalize_place 处理后再作为键读写。
+"""
+import asyncio
+import calendar
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import aiosqlite
+
+from database import DATABASE_PATH
+from load_control import load_controller
+
+logger = logging.getLogger(__name__)
+
+KB_MAX_AGE_HOURS = float(os.getenv("KB_MAX_AGE_HOURS", "72"))  # 超过该时长视为过期
+KB_REFRESH_INTERVAL_HOURS = float(os.getenv("KB_REFRESH_INTERVAL_HOURS", "6"))
+KB_TOP_DESTINATIONS = int(os.getenv("KB_TOP_DESTINATIONS", "20"))
+KB_REFRESH_ENABLED = os.getenv("KB_REFRESH_ENABLED", "1") == "1"
+KB_TRANSPORT_MAX_AGE_HOURS = float(os.getenv("KB_TRANSPORT_MAX_AGE_HOURS", "24"))
+
+# research_fn(departure, destination, start_date, end_date) -> 调研结果
+ResearchFn = Callable[[str, str, str, str], Awaitable[str]]
+
+
+# ========== 数据访问 ==========
+
+def normalize_place(name: str) -> str:
+    """知识库键的统一形式（去掉首尾空白）"""
+    return (name or "").strip()
+
+
+def _is_fresh(refreshed_at: str, max_age_hours: float) -> bool:
+    return datetime.fromisoformat(refreshed_at) >= datetime.now() - timedelta(hours=max_age_hours)
+
+
+async def get_fresh_research(destination: str, month: str,
+                             max_age_hours: float = KB_MAX_AGE_HOURS) -> Optional[str]:
+    """获取新鲜的预计算调研结果（month 为两位月份，如 "05"），没有或已过期时返回 None"""
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        cursor = await db.execute(
+            "SELECT research, refreshed_at FROM destination_research WHERE destination = ? AND month = ?",
+            (normalize_place(destination), month)
+        )
+        row = await cursor.fetchone()
+    if row and _is_fresh(row[1], max_age_hours):
+        return row[0]
+    return None
+
+
+async def upsert_research(destination: str, month: str, research: str) -> int:
+    """写入调研结果并递增版本号，返回新版本号"""
+    destination = normalize_place(destination)
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        await db.execute(
+            """
+            INSERT INTO destination_research (destination, month, research, version, refreshed_at)
+            VALUES (?, ?, ?, 1, ?)
+            ON CONFLICT(destination, month) DO UPDATE SET
+                research = excluded.research,
+                version = destination_research.version + 1,
+                refreshed_at = excluded.refreshed_at
+            """,
+            (destination, month, research, datetime.now().isoformat())
+        )
+        cursor = await db.execute(
+            "SELECT version FROM destination_research WHERE destination = ? AND month = ?",
+            (destination, month)
+        )
+        version = (await cursor.fetchone())[0]
+        await db.commit()
+        return version
+
+
+async def get_fresh_transport(departure: str, destination: str,
+                              max_age_hours: float = KB_TRANSPORT_MAX_AGE_HOURS) -> Optional[str]:
+    """获取缓存的出发地交通搜索结果，没有或已过期时返回 None"""
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        cursor = await db.execute(
+            "SELECT search_results, refreshed_at FROM departure_transport WHERE departure = ? AND destination = ?",
+            (normalize_place(departure), normalize_place(destination))
+        )
+        row = await cursor.fetchone()
+    if row and _is_fresh(row[1], max_age_hours):
+        return row[0]
+    return None
+
+
+async def upsert_transport(departure: str, destination: str, search_results: str):
+    """写入出发地交通搜索结果"""
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        await db.execute(
+            """
+            INSERT INTO departure_transport (departure, destination, search_results, refreshed_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(departure, destination) DO UPDATE SET
+                search_results = excluded.search_results,
+                refreshed_at = excluded.refreshed_at
+            """,
+            (normalize_place(departure), normalize_place(destination), search_results, datetime.now().isoformat())
+        )
+        await db.commit()
+
+
+async def get_stale_targets(limit: int, max_age_hours: float) -> List[Tuple[str, str]]:
+    """按历史请求量挑选最热门的 (目的地, 月份)，只返回缺失或即将过期的组合"""
+    # 提前到过期前一个刷新周期就开始刷新，避免热门目的地出现空窗
+    refresh_before = datetime.now() - timedelta(hours=max(0.0, max_age_hours - KB_REFRESH_INTERVAL_HOURS))
+    async with aiosqlite.connect(DATABASE_PATH) as db:
+        # 历史记录中的目的地与知识库键使用同一个规范化函数
+        await db.create_function("normalize_place", 1, normalize_place, deterministic=True)
+        cursor = await db.execute(
+            """
+            SELECT normalize_place(h.destination) AS dest, substr(h.start_date, 6, 2) AS month, COUNT(*) AS cnt
+            FROM travel_history h
+            LEFT JOIN destination_research r
+                ON r.destination = normalize_place(h.destination) AND r.month = substr(h.start_date, 6, 2)
+            WHERE (r.refreshed_at IS NULL OR r.refreshed_at < ?) AND dest != ''
+            GROUP BY dest, month
+            ORDER BY cnt DESC
+            LIMIT ?
+            """,
+            (refresh_before.isoformat(), limit)
+        )
+        rows = await cursor.fetchall()
+    return [(destination, month) for destination, month, _ in rows if len(month) == 2]
+
+
+def month_date_range(month: str, today: Optional[date] = None) -> Tuple[str, str]:
+    """某月份最近一次出现（今年或明年）的首末日期"""
+    today = today or date.today()
+    m = int(month)
+    year = today.year if m >= today.month else today.year + 1
+    last_day = calendar.monthrange(year, m)[1]
+    return f"{year}-{m:02d}-01", f"{year}-{m:02d}-{last_day:02d}"
+
+
+# ========== 后台刷新 ==========
+
+class KnowledgeBaseRefresher:
+    """后台定期刷新热门目的地的预计算调研"""
+
+    def __init__(
+        self,
+        research_fn: ResearchFn,
+        interval_hours: float = KB_REFRESH_INTERVAL_HOURS,
+        limit: int = KB_TOP_DESTINATIONS,
+        max_age_hours: float = KB_MAX_AGE_HOURS
+    ):
+        self.research_fn = research_fn
+        self.interval_hours = interval_hours
+        self.limit = limit
+        self.max_age_hours = max_age_hours
+        self._task: Optional[asyncio.Task] = None
+
+    async def refresh_once(self) -> int:
+        """刷新一轮，返回刷新成功的记录数"""
+        refreshed = 0
+        for destination, month in await get_stale_targets(self.limit, self.max_age_hours):
+            # 在线流量优先：高负载时暂停后台刷新，留到下一轮
+            if load_controller.degraded:
+                logger.info("系统处于降级模式，暂停知识库刷新")
+                break
+            start_date, end_date = month_date_range(month)
+            try:
+                # 出发地留空：记录被所有出发地的请求共享
+                research = await self.research_fn("", destination, start_date, end_date)
+            except Exception as e:
+                logger.warning("刷新知识库失败 %s/%s: %s", destination, month, e)
+                continue
+            version = await upsert_research(destination, month, research)
+            logger.info("知识库已刷新 %s/%s (v%d)", destination, month, version)
+            refreshed += 1
+        return refreshed
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh_once()
+            except Exception as e:
+                logger.warning("知识库刷新任务出错: %s", e)
+            await asyncio.sleep(self.interval_hours * 3600)
+
+    def start(self):
+        """在当前事件循环中启动后台刷新任务"""
+        if KB_REFRESH_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,129 @@
+"""
+负载自适应控制模块
+根据上游 LLM 延迟 (p95) 和排队深度，在 normal / degraded 两种模式间切换。
+延迟样本只来自流式调用的首字延迟和短 JSON 步骤的整段耗时（长文本生成的总耗时不代表上游拥塞），
+窗口内样本数不足 min_samples 时不按延迟降级。
+降级模式下跳过可选阶段（内容审核/润色、额外修改轮次、LLM 预算解析）。
+"""
+import math
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, List, Sequence, Tuple
+
+MODE_NORMAL = "normal"
+MODE_DEGRADED = "degraded"
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """
+    最近秩法分位数（q 取 0~1），负载控制和压测脚本共用同一口径
+
+    样本少于 1/(1-q) 个时等于最大值（例如 p95 需要至少 20 个样本才不等于最大值）。
+    """
+    ordered = sorted(values)
+    index = max(0, math.ceil(len(ordered) * q) - 1)
+    return ordered[index]
+
+
+class LoadController:
+    """SLO 感知的负载控制器（带滞回，避免模式来回抖动）"""
+
+    def __init__(
+        self,
+        latency_threshold: float = 15.0,
+        queue_threshold: int = 8,
+        recover_ratio: float = 0.7,
+        window_seconds: float = 60.0,
+        max_samples: int = 200,
+        min_samples: int = 20
+    ):
+        self.latency_threshold = latency_threshold  # p95 延迟阈值（秒）
+        self.queue_threshold = queue_threshold  # 同时处理的请求数阈值
+        self.recover_ratio = recover_ratio  # 低于阈值 * 该比例才恢复
+        self.window_seconds = window_seconds  # 只统计最近窗口内的样本
+        self.min_samples = min_samples  # 样本数不足时 p95 近似最大值，不作为降级依据
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=max_samples)
+        self.in_flight = 0
+        self.mode = MODE_NORMAL
+
+    # ---------- 指标采集 ----------
+
+    def record_latency(self, seconds: float):
+        """记录一次上游调用耗时"""
+        self._samples.append((time.monotonic(), seconds))
+        self._update_mode()
+
+    @contextmanager
+    def observe(self):
+        """包裹一次上游 LLM 调用并记录耗时"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record_latency(time.monotonic() - start)
+
+    @contextmanager
+    def track_request(self):
+        """包裹一个完整的规划请求，用于统计排队深度"""
+        self.in_flight += 1
+        self._update_mode()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._update_mode()
+
+    def _window(self) -> List[float]:
+        cutoff = time.monotonic() - self.window_seconds
+        return sorted(s for t, s in self._samples if t >= cutoff)
+
+    def p95(self) -> float:
+        """最近窗口内的 p95 延迟（无样本时为 0）"""
+        latencies = self._window()
+        if not latencies:
+            return 0.0
+        return percentile(latencies, 0.95)
+
+    def _latency_p95(self) -> float:
+        """用于模式判定的 p95：样本不足时视为 0（只按排队深度判定）"""
+        if len(self._window()) < self.min_samples:
+            return 0.0
+        return self.p95()
+
+    # ---------- 模式判定 ----------
+
+    def _update_mode(self):
+        p95 = self._latency_p95()
+        if self.mode == MODE_NORMAL:
+            if p95 > self.latency_threshold or self.in_flight > self.queue_threshold:
+                self.mode = MODE_DEGRADED
+        else:
+            if (p95 <= self.latency_threshold * self.recover_ratio
+                    and self.in_flight <= self.queue_threshold * self.recover_ratio):
+                self.mode = MODE_NORMAL
+
+    @property
+    def degraded(self) -> bool:
+        """当前是否处于降级模式（读取时顺便让过期样本生效）"""
+        self._update_mode()
+        return self.mode == MODE_DEGRADED
+
+    def snapshot(self) -> dict:
+        """当前负载状态（用于 /health 和 SSE 状态事件）"""
+        return {
+            "mode": MODE_DEGRADED if self.degraded else MODE_NORMAL,
+            "p95_latency": round(self.p95(), 3),
+            "latency_samples": len(self._window()),
+            "in_flight": self.in_flight
+        }
+
+
+# 全局控制器实例（阈值可通过环境变量调整）
+load_controller = LoadController(
+    latency_threshold=float(os.getenv("DEGRADE_LATENCY_SECONDS", "15")),
+    queue_threshold=int(os.getenv("DEGRADE_QUEUE_DEPTH", "8")),
+    recover_ratio=float(os.getenv("DEGRADE_RECOVER_RATIO", "0.7")),
+    min_samples=int(os.getenv("DEGRADE_MIN_SAMPLES", "20"))
+)
@@ -1,27 +1,59 @@
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse
-from typing import List, Optional
-from contextlib import asynccontextmanager
-from travel_agent import plan_travel, plan_travel_stream
-from database import init_db, save_plan, get_history, get_plan_by_id, delete_plan
-from apiset import llm
+import asyncio
+import logging
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import List, Literal, Optional
+from contextlib import aclosing, asynccontextmanager
+import uuid
+from functools import partial
+from travel_agent import (
+    plan_travel, plan_travel_stream, plan_variants_stream, refinalize_plan, checkpointer, research_live, MAX_VARIANTS
+)
+from knowledge_base import KnowledgeBaseRefresher
+from plan_index import plan_index
+from batch import run_parsed_batch, aparse_jsonl, iter_lines, DEFAULT_WORKERS, MAX_WORKERS
+from export import export_history, export_filename, validate_date_range, MEDIA_TYPES
+from assets import asset_bundle
+from database import (
+    init_db, save_plan, get_history, get_plan_by_id, get_plan_by_request_id, delete_plan, get_analytics
+)
+import resilience
+import http_pool
+import apiset
+from load_control import load_controller
+from stream_json import extract_json
 from schemas import (
     TravelRequest, TravelResponse, ChatRequest, ChatResponse, 
-    HistoryResponse, BudgetItem, TravelRecord
+    HistoryResponse, BudgetItem, TravelRecord, RefinalizeRequest
 )
 from prompts import BUDGET_PARSING_PROMPT, CHAT_MODIFY_PROMPT
 
+logger = logging.getLogger(__name__)
+
 # 应用启动时初始化数据库
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
+    # LLM 调用走共享 HTTP 连接池（每次 lifespan 新建，结束时关闭）
+    apiset.bind_http_client(http_pool.open_client())
+    await checkpointer.purge_expired()
+    # 构建指纹化、预压缩的前端资源
+    asset_bundle.refresh_if_changed()
+    # 后台刷新热门目的地的预计算调研
+    kb_refresher = KnowledgeBaseRefresher(partial(research_live, strict=True))
+    kb_refresher.start()
+    # 后台预加载相似方案索引，避免首个请求等待
+    index_task = asyncio.create_task(plan_index.ensure_loaded()) if plan_index else None
     yield
+    if index_task:
+        index_task.cancel()
+    await kb_refresher.stop()
+    # 解绑并关闭共享 HTTP 连接池（LLM / 搜索）
+    apiset.bind_http_client(None)
+    await http_pool.aclose()
 
 app = FastAPI(title="旅行规划 Agent", lifespan=lifespan)
 
-# 挂载静态文件
-app.mount("/static", StaticFiles(directory="static"), name="static")
 
 
 def extract_budget_breakdown(plan: str, total_budget: int) -> List[BudgetItem]:
@@ -44,91 +76,165 @@ def extract_budget_breakdown(plan: str, total_budget: int) -> List[BudgetItem]:
     ]
 
 
+# 预算类别的展示配置（与固定比例备用方案一致）
+BUDGET_COLORS = {
+    "交通": "#6366f1",
+    "住宿": "#8b5cf6",
+    "餐饮": "#f472b6",
+    "门票": "#22d3ee",
+    "其他": "#fbbf24"
+}
+
+BUDGET_EMOJIS = {
+    "交通": "🚗",
+    "住宿": "🏨",
+    "餐饮": "🍜",
+    "门票": "🎫",
+    "其他": "🛍️"
+}
+
+
+def budget_items_from_mapping(budget_data: dict) -> List[BudgetItem]:
+    """把 {"交通": 1000, ...} 形式的预算字典转换为图表数据"""
+    result = []
+    for key, amount in budget_data.items():
+        if key in BUDGET_COLORS:
+            result.append(BudgetItem(
+                category=f"{BUDGET_EMOJIS.get(key, '')} {key}",
+                amount=int(amount) if isinstance(amount, (int, float)) else 0,
+                color=BUDGET_COLORS[key]
+            ))
+    return result
+
+
 async def extract_budget_with_llm(plan: str, total_budget: int) -> List[BudgetItem]:
     """使用 LLM 从生成的方案中解析真实预算数字"""
-    import json as json_module
-    import re
+    # 熔断期间直接使用固定比例，不再等待上游
+    if resilience.breaker.is_open:
+        return extract_budget_breakdown(plan, total_budget)
     
     prompt = BUDGET_PARSING_PROMPT.format(plan=plan[:2000], total_budget=total_budget)
     
     try:
-        response = await llm.ainvoke(prompt)
-        content = response.content
+        content = await resilience.ainvoke("budget_parse", prompt)
         
-        # 提取 JSON
-        json_match = re.search(r'\{[^}]+\}', content, re.DOTALL)
-        if json_match:
-            budget_data = json_module.loads(json_match.group())
-            
-            colors = {
-                "交通": "#6366f1",
-                "住宿": "#8b5cf6",
-                "餐饮": "#f472b6",
-                "门票": "#22d3ee",
-                "其他": "#fbbf24"
-            }
-            
-            emojis = {
-                "交通": "🚗",
-                "住宿": "🏨",
-                "餐饮": "🍜",
-                "门票": "🎫",
-                "其他": "🛍️"
-            }
-            
-            result = []
-            for key, amount in budget_data.items():
-                if key in colors:
-                    result.append(BudgetItem(
-                        category=f"{emojis.get(key, '')} {key}",
-                        amount=int(amount) if isinstance(amount, (int, float)) else 0,
-                        color=colors[key]
-                    ))
-            
+        # 提取 JSON（支持嵌套和被截断的输出）
+        budget_data = extract_json(content)
+        if budget_data:
+            result = budget_items_from_mapping(budget_data)
             if result and sum(item.amount for item in result) > 0:
                 return result
     except Exception as e:
-        print(f"LLM 预算解析失败: {e}")
+        logger.warning("LLM 预算解析失败，回退到固定比例: %s", e)
     
     # 失败时回退到固定比例
     return extract_budget_breakdown(plan, total_budget)
 
 
 @app.get("/")
-async def root():
-    """返回前端页面"""
-    return FileResponse("static/index.html")
+async def root(request: Request):
+    """返回前端页面（HTML 外壳每次重新验证，引用的资源带内容哈希）"""
+    return asset_bundle.shell_response(request)
+
+
+@app.get("/static/{name}")
+async def get_static(name: str, request: Request):
+    """旧的未指纹化地址（重定向到带哈希的资源，其它文件每次重新验证）"""
+    return asset_bundle.static_response(name, request)
+
+
+@app.get("/assets/{name}")
+async def get_asset(name: str, request: Request):
+    """指纹化的静态资源（可永久缓存）"""
+    return asset_bundle.asset_response(name, request)
 
 
 @app.post("/travel-plan", response_model=TravelResponse)
 async def create_travel_plan(request: TravelRequest):
     """生成旅行规划（非流式）"""
+    # 客户端可传入 request_id 作为幂等键，失败后用同一 ID 重试即可从断点继续
+    request_id = request.request_id or uuid.uuid4().hex
     try:
-        plan = await plan_travel(
-            budget=request.budget,
-            destination=request.destination,
-            start_date=request.start_date,
-            end_date=request.end_date
-        )
-        
-        # 保存到数据库
-        plan_id = await save_plan(
-            destination=request.destination,
-            budget=request.budget,
-            start_date=request.start_date,
-            end_date=request.end_date,
-            plan_content=plan
-        )
+        # 该 request_id 已完成并保存过：直接返回已保存的规划，不重复运行和保存
+        existing = await get_plan_by_request_id(request.request_id) if request.request_id else None
+        if existing:
+            plan, plan_id = existing.plan_content, existing.id
+        else:
+            with load_controller.track_request():
+                plan = await plan_travel(
+                    budget=request.budget,
+                    destination=request.destination,
+                    start_date=request.start_date,
+                    end_date=request.end_date,
+                    departure=request.departure,
+                    request_id=request_id,
+                    style=request.style
+                )
+            
+            # 保存到数据库
+            plan_id = await save_plan(
+                departure=request.departure,
+                destination=request.destination,
+                budget=request.budget,
+                start_date=request.start_date,
+                end_date=request.end_date,
+                plan_content=plan,
+                request_id=request_id
+            )
         
         budget_breakdown = extract_budget_breakdown(plan, request.budget)
         return TravelResponse(
             success=True, 
             plan=plan, 
             plan_id=plan_id,
+            request_id=request_id,
             budget_breakdown=budget_breakdown
         )
     except Exception as e:
-        return TravelResponse(success=False, plan="", message=str(e))
+        return TravelResponse(success=False, plan="", request_id=request_id, message=str(e))
+
+
+def skeleton_event(data: dict) -> dict:
+    """把骨架的预算分配转换为前端预算图使用的 breakdown（保留 variant 等其它字段）"""
+    items = budget_items_from_mapping(data.pop("budget_allocation", {}))
+    data["breakdown"] = [{"category": item.category, "amount": item.amount, "color": item.color} for item in items]
+    return data
+
+
+async def save_streamed_plan(
+    budget: int,
+    departure: str,
+    destination: str,
+    start_date: str,
+    end_date: str,
+    content: str
+) -> List[dict]:
+    """保存流式生成的方案并解析预算，返回 budget / saved 事件"""
+    plan_id = await save_plan(
+        departure=departure,
+        destination=destination,
+        budget=budget,
+        start_date=start_date,
+        end_date=end_date,
+        plan_content=content
+    )
+    
+    # 使用 LLM 解析预算（降级模式下直接使用固定比例）
+    if load_controller.degraded:
+        budget_items = extract_budget_breakdown(content, budget)
+    else:
+        budget_items = await extract_budget_with_llm(content, budget)
+    budget_data = [{"category": item.category, "amount": item.amount, "color": item.color} for item in budget_items]
+    
+    # 附带列表摘要，前端直接插入侧边栏，无需重新拉取历史记录
+    summary = {
+        "id": plan_id, "departure": departure, "destination": destination,
+        "budget": budget, "start_date": start_date, "end_date": end_date
+    }
+    return [
+        {"type": "budget", "breakdown": budget_data},
+        {"type": "saved", "plan_id": plan_id, "record": summary},
+    ]
 
 
 @app.get("/travel-plan-stream")
@@ -137,46 +243,108 @@ async def stream_travel_plan(
     departure: str,
     destination: str,
     start_date: str,
-    end_date: str
+    end_date: str,
+    pipeline: Optional[Literal["two_pass", "fused"]] = None
 ):
     """
     流式生成旅行规划 (SSE)
     
-    使用 EventSource 接收实时生成的内容
+    使用 EventSource 接收实时生成的内容；pipeline 可选 two_pass / fused（默认读取 PIPELINE_MODE）
     """
     async def event_generator():
         full_content = ""
-        async for chunk in plan_travel_stream(budget, departure, destination, start_date, end_date):
-            yield chunk
-            # 收集完整内容用于保存
-            if '"type": "chunk"' in chunk:
-                import json
-                try:
-                    data = json.loads(chunk.replace("data: ", "").strip())
-                    if data.get("type") == "chunk":
-                        full_content += data.get("content", "")
-                except:
-                    pass
-        
-        # 保存到数据库
-        if full_content:
-            plan_id = await save_plan(
-                departure=departure,
-                destination=destination,
-                budget=budget,
-                start_date=start_date,
-                end_date=end_date,
-                plan_content=full_content
-            )
-            
-            # 使用 LLM 解析预算
-            budget_items = await extract_budget_with_llm(full_content, budget)
-            budget_data = [{"category": item.category, "amount": item.amount, "color": item.color} for item in budget_items]
+        import json
+        with load_controller.track_request():
+            try:
+                stream = plan_travel_stream(budget, departure, destination, start_date, end_date, pipeline)
+                async with aclosing(stream):
+                    async for chunk in stream:
+                        if '"type": "skeleton"' in chunk:
+                            # 骨架的预算分配先行推送，前端可在正文生成前画出预算图
+                            data = json.loads(chunk.replace("data: ", "").strip())
+                            chunk = f"data: {json.dumps(skeleton_event(data))}\n\n"
+                        yield chunk
+                        # 收集完整内容用于保存
+                        if '"type": "chunk"' in chunk:
+                            try:
+                                data = json.loads(chunk.replace("data: ", "").strip())
+                                if data.get("type") == "chunk":
+                                    full_content += data.get("content", "")
+                            except:
+                                pass
+            except Exception as e:
+                # 超时 / 熔断等错误通过 SSE 告知前端，而不是让连接挂起或直接断开
+                logger.warning("流式规划失败: %s", e)
+                yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+                return
             
-            import json
-            yield f"data: {json.dumps({'type': 'budget', 'breakdown': budget_data})}\n\n"
-            yield f"data: {json.dumps({'type': 'saved', 'plan_id': plan_id})}\n\n"
+            # 保存到数据库（含 LLM 预算解析，仍计入在途请求）
+            if full_content:
+                for payload in await save_streamed_plan(
+                    budget, departure, destination, start_date, end_date, full_content
+                ):
+                    yield f"data: {json.dumps(payload)}\n\n"
+    
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
+@app.get("/travel-plan-variants-stream")
+async def stream_travel_plan_variants(
+    budgets: str,
+    departure: str,
+    destination: str,
+    start_date: str,
+    end_date: str,
+    pipeline: Optional[Literal["two_pass", "fused"]] = None
+):
+    """
+    多预算档位对比 (SSE)
     
+    budgets 为逗号分隔的多个预算（例如 3000,8000,20000）。调研只做一次，各档位的方案并行生成，
+    除 status 外的事件都带 variant 字段（budgets 中的下标）；每个档位单独保存并返回自己的预算解析。
+    """
+    import json
+
+    try:
+        values = [int(v) for v in budgets.split(",") if v.strip()]
+    except ValueError:
+        values = []
+    values = list(dict.fromkeys(values))  # 去重并保持顺序
+
+    async def event_generator():
+        if not 1 <= len(values) <= MAX_VARIANTS or any(v <= 0 for v in values):
+            yield f"data: {json.dumps({'type': 'error', 'message': f'budgets 需为 1~{MAX_VARIANTS} 个正整数预算，用逗号分隔'})}\n\n"
+            return
+
+        async def on_complete(budget: int, content: str) -> List[dict]:
+            events = await save_streamed_plan(budget, departure, destination, start_date, end_date, content)
+            logger.info("档位方案已保存: 预算 %d -> plan_id %s", budget, events[-1]["plan_id"])
+            return events
+
+        with load_controller.track_request():
+            try:
+                stream = plan_variants_stream(
+                    values, departure, destination, start_date, end_date, pipeline, on_complete=on_complete
+                )
+                async with aclosing(stream):
+                    async for chunk in stream:
+                        if '"type": "skeleton"' in chunk:
+                            data = json.loads(chunk.replace("data: ", "").strip())
+                            chunk = f"data: {json.dumps(skeleton_event(data))}\n\n"
+                        yield chunk
+            except Exception as e:
+                # 共享阶段（调研 / 骨架）失败时整个请求失败
+                logger.warning("多档位规划失败: %s", e)
+                yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+
     return StreamingResponse(
         event_generator(),
         media_type="text/event-stream",
@@ -188,16 +356,96 @@ async def stream_travel_plan(
     )
 
 
+@app.post("/batch")
+async def batch_travel_plans(
+    request: Request,
+    workers: int = Query(DEFAULT_WORKERS, ge=1, le=MAX_WORKERS),
+    batch_id: Optional[str] = None
+):
+    """
+    批量生成旅行规划
+    
+    请求体为 JSONL（每行一个 TravelRequest），按行流式解析，不把整个请求体读入内存；
+    响应以 NDJSON 流式返回进度和每行结果。同一批输入重复提交时会从断点继续。
+    """
+    import json
+    # 在返回响应前读完请求体（流式响应开始后 Starlette 会自行读取 receive 检测断开）
+    rows, parse_events = await aparse_jsonl(iter_lines(request.stream()))
+    
+    async def event_generator():
+        async for event in run_parsed_batch(rows, parse_events, batch_id=batch_id, workers=workers):
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(event_generator(), media_type="application/x-ndjson")
+
+
 @app.get("/history", response_model=HistoryResponse)
-async def get_travel_history(limit: int = 20):
-    """获取历史记录列表"""
+async def get_travel_history(limit: int = 20, cursor: Optional[int] = None, include_plan: bool = True):
+    """
+    获取历史记录列表（按 id 倒序分页）
+    
+    cursor 传上一页返回的 next_cursor；include_plan=false 时不返回正文（侧边栏列表使用）。
+    """
     try:
-        history = await get_history(limit)
-        return HistoryResponse(success=True, history=history)
+        history, next_cursor = await get_history(min(max(limit, 1), 200), cursor, include_plan)
+        # database.TravelRecord 与 schemas.TravelRecord 是不同的模型类，按字段转换
+        return HistoryResponse(
+            success=True,
+            history=[record.model_dump() for record in history],
+            next_cursor=next_cursor
+        )
     except Exception as e:
         return HistoryResponse(success=False, message=str(e))
 
 
+@app.get("/analytics")
+async def get_travel_analytics(top: int = 10, days: int = 30):
+    """
+    统计看板：热门目的地、预算分布、行程天数分布、每日规划量
+    
+    只读取触发器增量维护的汇总表，耗时与历史记录数量无关。
+    """
+    try:
+        result = await get_analytics(top=min(max(top, 1), 100), days=min(max(days, 1), 366))
+        return {"success": True, **result}
+    except Exception as e:
+        return {"success": False, "message": str(e)}
+
+
+@app.get("/history/export")
+async def export_travel_history(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    gzip: bool = False,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None,
+    destination: Optional[str] = None,
+    include_plan: bool = True
+):
+    """
+    流式导出历史记录（NDJSON / CSV，可选 gzip）
+    
+    created_from / created_to 为创建日期范围（YYYY-MM-DD，均包含）。
+    需声明在 /history/{plan_id} 之前，否则会被当作 plan_id 匹配。
+    """
+    # 响应头发出后无法再返回错误状态码，参数必须在开始流式输出前校验
+    try:
+        validate_date_range(created_from, created_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        export_history(
+            fmt=format,
+            gzip=gzip,
+            created_from=created_from,
+            created_to=created_to,
+            destination=destination,
+            include_plan=include_plan
+        ),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(format, gzip)}"'}
+    )
+
+
 @app.get("/history/{plan_id}")
 async def get_single_plan(plan_id: int):
     """获取单个规划详情"""
@@ -210,6 +458,38 @@ async def get_single_plan(plan_id: int):
         return {"success": False, "message": str(e)}
 
 
+@app.post("/history/{plan_id}/refinalize", response_model=TravelResponse)
+async def refinalize_travel_plan(plan_id: int, request: RefinalizeRequest):
+    """以新的文案风格重新定稿（复用已保存的调研结果和方案草稿）"""
+    try:
+        record = await get_plan_by_id(plan_id)
+        if not record:
+            return TravelResponse(success=False, plan="", message="记录不存在")
+        
+        plan = await refinalize_plan(record.request_id, request.style) if record.request_id else None
+        if plan is None:
+            return TravelResponse(success=False, plan="", message="中间结果已过期，请重新生成")
+        
+        new_plan_id = await save_plan(
+            departure=record.departure,
+            destination=record.destination,
+            budget=record.budget,
+            start_date=record.start_date,
+            end_date=record.end_date,
+            plan_content=plan,
+            request_id=record.request_id
+        )
+        return TravelResponse(
+            success=True,
+            plan=plan,
+            plan_id=new_plan_id,
+            request_id=record.request_id,
+            budget_breakdown=extract_budget_breakdown(plan, record.budget)
+        )
+    except Exception as e:
+        return TravelResponse(success=False, plan="", message=str(e))
+
+
 @app.delete("/history/{plan_id}")
 async def delete_travel_plan(plan_id: int):
     """删除旅行规划记录"""
@@ -233,8 +513,7 @@ async def chat_modify_plan(request: ChatRequest):
             user_message=request.user_message
         )
 
-        response = llm.invoke(prompt)
-        modified_plan = response.content
+        modified_plan = await resilience.ainvoke("default", prompt)
         budget_breakdown = extract_budget_breakdown(modified_plan, request.budget)
         
         return ChatResponse(
@@ -249,4 +528,9 @@ async def chat_modify_plan(request: ChatRequest):
 @app.get("/health")
 async def health_check():
     """健康检查"""
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "load": load_controller.snapshot(),
+        "llm_breaker": resilience.breaker.snapshot(),
+        "http_pool": http_pool.snapshot()
+    }
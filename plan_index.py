@@ -0,0 +1,234 @@
+"""
+相似历史方案索引
+用廉价特征（目的地 / 出发地、行程天数、季节、预算档位，可选正文哈希向量）
+在内存中索引已保存的规划，用 NumPy 向量化打分。
+保存 / 删除规划时通过 database 的监听器增量更新。
+
+需要 numpy；未安装时索引不可用，规划流程照常执行。
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import zlib
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, Optional
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖
+    np = None
+
+from database import PLAN_SAVED, PLAN_DELETED, add_plan_listener, iter_history
+
+logger = logging.getLogger(__name__)
+
+PLAN_INDEX_ENABLED = os.getenv("PLAN_INDEX_ENABLED", "1") == "1" and np is not None
+TEXT_DIM = int(os.getenv("PLAN_INDEX_TEXT_DIM", "256"))  # 0 表示不使用正文向量
+REUSE_THRESHOLD = float(os.getenv("PLAN_REUSE_THRESHOLD", "0.92"))  # 直接改编历史方案
+REFERENCE_THRESHOLD = float(os.getenv("PLAN_REFERENCE_THRESHOLD", "0.7"))  # 作为参考注入提示词
+
+# 结构化特征权重（和为 1）
+W_DEPARTURE = 0.2
+W_DAYS = 0.3
+W_SEASON = 0.2
+W_BUDGET = 0.3
+W_TEXT = 0.2  # 提供查询文本时，与结构化得分按此比例混合
+
+TEXT_MAX_CHARS = 4000  # 正文只取开头部分计算向量
+_ITINERARY_SECTION = re.compile(r"^#+[^\n]*每日行程[^\n]*\n(.*?)(?=^#{1,2}\s|\Z)", re.M | re.S)
+_NOISE = re.compile(r"[\s#*\-:：，。、！？（）()\[\]【】|>`_~\d]+")
+
+
+@dataclass
+class SimilarPlan:
+    """相似方案检索结果"""
+    plan_id: int
+    score: float
+
+
+def _norm(name: str) -> str:
+    return (name or "").strip().lower()
+
+
+def _trip_features(start_date: str, end_date: str, budget: int):
+    """(天数, 季节角度, 对数预算)；日期无法解析时天数为 0、角度取 0"""
+    try:
+        start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+        days = max(1, (end - start).days + 1)
+        angle = 2 * math.pi * (start.timetuple().tm_yday - 1) / 365
+    except ValueError:
+        days, angle = 0, 0.0
+    return days, angle, math.log(max(budget, 1))
+
+
+def itinerary_text(plan_content: str) -> str:
+    """方案正文中的「每日行程」段落（缺失时用全文），与骨架的 daily_themes 属同一类内容"""
+    match = _ITINERARY_SECTION.search(plan_content or "")
+    return match.group(1) if match else (plan_content or "")
+
+
+def skeleton_query_text(draft_skeleton: str) -> str:
+    """骨架的查询文本：只取 daily_themes，去掉 JSON 键名和预算数字；无法解析时用原文"""
+    try:
+        skeleton = json.loads(draft_skeleton)
+    except (TypeError, ValueError):
+        return draft_skeleton or ""
+    themes = skeleton.get("daily_themes") if isinstance(skeleton, dict) else None
+    return "\n".join(str(theme) for theme in themes) if isinstance(themes, list) else ""
+
+
+def text_vector(text: str, dim: int = TEXT_DIM):
+    """字符二元组的带符号哈希向量（L2 归一化）"""
+    vec = np.zeros(dim, dtype=np.float32)
+    compact = _NOISE.sub("", text[:TEXT_MAX_CHARS])
+    for i in range(len(compact) - 1):
+        h = zlib.crc32(compact[i:i + 2].encode("utf-8"))
+        vec[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+class PlanIndex:
+    """内存中的相似方案索引（按容量倍增的列式数组，支持增量增删）"""
+
+    def __init__(self, text_dim: int = TEXT_DIM, capacity: int = 1024):
+        self.text_dim = text_dim
+        self.loaded = False
+        self._load_lock = asyncio.Lock()
+        self._codes: Dict[str, int] = {}  # 地名 -> 整数编码
+        self._pos: Dict[int, int] = {}  # plan_id -> 行号
+        self._size = 0
+        self._alloc(capacity)
+
+    def _alloc(self, capacity: int):
+        def grow(old, shape, dtype, fill=0):
+            new = np.full(shape, fill, dtype=dtype)
+            if old is not None:
+                new[:len(old)] = old
+            return new
+
+        get = lambda name: getattr(self, name, None)
+        self._ids = grow(get("_ids"), capacity, np.int64, -1)
+        self._dest = grow(get("_dest"), capacity, np.int32, -1)
+        self._dep = grow(get("_dep"), capacity, np.int32, -1)
+        self._days = grow(get("_days"), capacity, np.float32)
+        self._cos = grow(get("_cos"), capacity, np.float32)
+        self._sin = grow(get("_sin"), capacity, np.float32)
+        self._logb = grow(get("_logb"), capacity, np.float32)
+        self._text = grow(get("_text"), (capacity, self.text_dim), np.float32) if self.text_dim else None
+
+    def _code(self, name: str) -> int:
+        return self._codes.setdefault(_norm(name), len(self._codes))
+
+    def __len__(self) -> int:
+        return len(self._pos)
+
+    def add(self, record: dict):
+        """加入（或覆盖）一条规划"""
+        plan_id = record["id"]
+        row = self._pos.get(plan_id)
+        if row is None:
+            if self._size == len(self._ids):
+                self._alloc(len(self._ids) * 2)
+            row = self._size
+            self._size += 1
+            self._pos[plan_id] = row
+
+        days, angle, logb = _trip_features(record["start_date"], record["end_date"], record["budget"])
+        self._ids[row] = plan_id
+        self._dest[row] = self._code(record["destination"])
+        self._dep[row] = self._code(record.get("departure", ""))
+        self._days[row] = days
+        self._cos[row], self._sin[row] = math.cos(angle), math.sin(angle)
+        self._logb[row] = logb
+        if self._text is not None:
+            self._text[row] = text_vector(itinerary_text(record.get("plan_content", "")), self.text_dim)
+
+    def remove(self, plan_id: int):
+        """删除一条规划（只标记，行号不复用）"""
+        row = self._pos.pop(plan_id, None)
+        if row is not None:
+            self._ids[row] = -1
+            self._dest[row] = -1
+
+    def on_plan_event(self, event: str, record: dict):
+        """database 监听器：保存 / 删除规划时增量更新（按 plan_id 去重，加载期间也可安全调用）"""
+        if event == PLAN_SAVED:
+            self.add(record)
+        elif event == PLAN_DELETED:
+            self.remove(record["id"])
+
+    async def ensure_loaded(self):
+        """首次使用时从数据库分块构建索引"""
+        if self.loaded:
+            return
+        async with self._load_lock:
+            if self.loaded:
+                return
+            async for rows in iter_history(include_plan=self._text is not None):
+                for record in rows:
+                    self.add(record)
+            self.loaded = True
+            logger.info("相似方案索引已加载 %d 条规划", len(self))
+
+    def search(
+        self,
+        departure: str,
+        destination: str,
+        start_date: str,
+        end_date: str,
+        budget: int,
+        query_text: Optional[str] = None
+    ) -> Optional[SimilarPlan]:
+        """返回同目的地中得分最高的规划（得分 0~1）"""
+        code = self._codes.get(_norm(destination))
+        if code is None:
+            return None
+        n = self._size
+        candidates = np.nonzero(self._dest[:n] == code)[0]
+        if not len(candidates):
+            return None
+
+        days, angle, logb = _trip_features(start_date, end_date, budget)
+        dep_code = self._codes.get(_norm(departure), -2)
+        score = (
+            W_DEPARTURE * (self._dep[candidates] == dep_code)
+            + W_DAYS * np.exp(-np.abs(self._days[candidates] - days) / 2)
+            + W_SEASON * (1 + self._cos[candidates] * math.cos(angle) + self._sin[candidates] * math.sin(angle)) / 2
+            + W_BUDGET * np.exp(-np.abs(self._logb[candidates] - logb) / 0.25)
+        )
+        query_vector = text_vector(query_text, self.text_dim) if query_text and self._text is not None else None
+        if query_vector is not None and query_vector.any():
+            similarity = np.clip(self._text[candidates] @ query_vector, 0, 1)
+            score = (1 - W_TEXT) * score + W_TEXT * similarity
+
+        best = int(np.argmax(score))
+        return SimilarPlan(plan_id=int(self._ids[candidates[best]]), score=round(float(score[best]), 4))
+
+
+plan_index = PlanIndex() if PLAN_INDEX_ENABLED else None
+if plan_index is not None:
+    add_plan_listener(plan_index.on_plan_event)
+
+
+async def find_similar_plan(
+    departure: str,
+    destination: str,
+    start_date: str,
+    end_date: str,
+    budget: int,
+    query_text: Optional[str] = None
+) -> Optional[SimilarPlan]:
+    """检索最相似的历史规划；索引不可用或出错时返回 None"""
+    if plan_index is None:
+        return None
+    try:
+        await plan_index.ensure_loaded()
+        return plan_index.search(departure, destination, start_date, end_date, budget, query_text)
+    except Exception as e:
+        logger.warning("相似方案检索失败: %s", e)
+        return None
@@ -0,0 +1,316 @@
+"""
+规划正文的内容寻址压缩存储
+travel_history 只保存正文的哈希（plan_hash），正文按 SHA-256 去重后存入 plan_blobs，
+使用基于已有规划训练的共享字典压缩（安装了 zstandard 时用 zstd，否则用 zlib 预置字典）。
+
+压缩 / 解压和字典训练都是 CPU 密集操作，在线程池中执行，不阻塞事件循环。
+当前字典压缩过的正文达到 PLAN_DICT_RETRAIN_ROWS 条后用最近的规划重新训练（database 在写入后按需触发），
+旧字典保留，已有正文仍按各自的 dict_id 解压。
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import zlib
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import aiosqlite
+
+try:
+    import zstandard
+except ImportError:  # zstd 为可选依赖
+    zstandard = None
+
+from prompts import FINALIZE_ITINERARY_PROMPT, FUSED_ITINERARY_PROMPT
+
+logger = logging.getLogger(__name__)
+
+CODEC_ZSTD = "zstd"
+CODEC_ZLIB = "zlib"
+CODEC = CODEC_ZSTD if zstandard else CODEC_ZLIB
+
+DICT_SIZE = 32 * 1024  # zlib 预置字典上限为 32KB
+MIN_TRAIN_SAMPLES = 50  # 少于该数量的规划时使用模板种子字典，样本足够后自动重新训练
+MAX_TRAIN_SAMPLES = 2000
+ZSTD_LEVEL = int(os.getenv("PLAN_ZSTD_LEVEL", "19"))
+ZLIB_LEVEL = 9
+RETRAIN_ROWS = int(os.getenv("PLAN_DICT_RETRAIN_ROWS", "1000"))  # 当前字典压缩过这么多条正文后重新训练
+RETRAIN_CHECK_EVERY = 100  # 每写入这么多条正文检查一次是否需要重新训练
+
+# 已加载的字典：dict_id -> (codec, 字典数据)
+_dicts: Dict[int, Tuple[str, bytes]] = {}
+
+
+def plan_hash(text: str) -> str:
+    """正文的内容地址"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# ========== 字典构建 ==========
+
+def _seed_text() -> str:
+    """没有历史数据时，用定稿提示词中的输出格式作为种子"""
+    return "\n".join(
+        line for prompt in (FINALIZE_ITINERARY_PROMPT, FUSED_ITINERARY_PROMPT)
+        for line in prompt.splitlines()
+        if line.startswith(("#", "-", "每天", "使用"))
+    )
+
+
+def build_sampled_dictionary(samples: List[str], size: int = DICT_SIZE) -> bytes:
+    """
+    从样本中挑选跨规划重复出现的行拼成预置字典
+
+    压缩器对字典末尾的内容引用代价最低，所以收益最高的行放在最后。
+    """
+    counts = Counter()
+    for sample in samples:
+        counts.update({line.strip() for line in sample.splitlines() if len(line.strip()) >= 4})
+    common = [(n * len(line.encode("utf-8")), line) for line, n in counts.items() if n >= 2]
+    common.sort()
+
+    chosen: List[bytes] = [_seed_text().encode("utf-8")]
+    used = len(chosen[0])
+    for _, line in reversed(common):
+        data = (line + "\n").encode("utf-8")
+        if used + len(data) > size:
+            break
+        chosen.insert(1, data)
+        used += len(data)
+    return b"".join(chosen)[-size:]
+
+
+def train_dictionary(samples: List[str], codec: str = CODEC) -> bytes:
+    """按编码方式训练字典；zstd 训练失败（样本太少等）时退回采样字典"""
+    if codec == CODEC_ZSTD and len(samples) >= MIN_TRAIN_SAMPLES:
+        try:
+            trained = zstandard.train_dictionary(DICT_SIZE * 4, [s.encode("utf-8") for s in samples])
+            return trained.as_bytes()
+        except zstandard.ZstdError as e:
+            logger.warning("zstd 字典训练失败，改用采样字典: %s", e)
+    return build_sampled_dictionary(samples)
+
+
+# ========== 压缩 / 解压 ==========
+
+# zstd 压缩/解压上下文按字典缓存（创建带字典的上下文开销较大）；
+# 上下文不能被多个线程同时使用，所以每个线程各缓存一份
+_zstd_local = threading.local()
+
+
+def _zstd_context(kind: str, dict_id: Optional[int], zdict: bytes):
+    contexts = getattr(_zstd_local, "contexts", None)
+    if contexts is None:
+        contexts = _zstd_local.contexts = {}
+    key = (kind, dict_id)
+    if key not in contexts:
+        dict_data = zstandard.ZstdCompressionDict(zdict) if zdict else None
+        if kind == "c":
+            contexts[key] = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dict_data)
+        else:
+            contexts[key] = zstandard.ZstdDecompressor(dict_data=dict_data)
+    return contexts[key]
+
+
+def compress(text: str, codec: str, dict_id: Optional[int], zdict: bytes) -> bytes:
+    data = text.encode("utf-8")
+    if codec == CODEC_ZSTD:
+        return _zstd_context("c", dict_id, zdict).compress(data)
+    compressor = zlib.compressobj(ZLIB_LEVEL, zdict=zdict) if zdict else zlib.compressobj(ZLIB_LEVEL)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(data: bytes, codec: str, dict_id: Optional[int], zdict: bytes) -> str:
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("该规划使用 zstd 压缩，需要安装 zstandard")
+        return _zstd_context("d", dict_id, zdict).decompress(data).decode("utf-8")
+    decompressor = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+    return (decompressor.decompress(data) + decompressor.flush()).decode("utf-8")
+
+
+def _decompress_rows(rows: List[Tuple[str, bytes, str, Optional[int], bytes]]) -> Dict[str, str]:
+    """批量解压 [(hash, data, codec, dict_id, zdict)]（在线程池中执行）"""
+    return {digest: decompress(data, codec, dict_id, zdict) for digest, data, codec, dict_id, zdict in rows}
+
+
+# ========== 数据库操作（均使用调用方的连接，以便加入同一事务）==========
+
+async def create_tables(db: aiosqlite.Connection):
+    """创建字典表和正文表"""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS plan_dicts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            codec TEXT NOT NULL,
+            data BLOB NOT NULL,
+            sample_count INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        )
+    """)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS plan_blobs (
+            hash TEXT PRIMARY KEY,
+            codec TEXT NOT NULL,
+            dict_id INTEGER,
+            data BLOB NOT NULL,
+            raw_size INTEGER NOT NULL
+        )
+    """)
+    # 统计当前字典压缩过的正文数（重新训练判定）
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_plan_blobs_dict ON plan_blobs(dict_id)")
+
+
+async def _load_dict(db: aiosqlite.Connection, dict_id: Optional[int]) -> bytes:
+    if dict_id is None:
+        return b""
+    if dict_id not in _dicts:
+        cursor = await db.execute("SELECT codec, data FROM plan_dicts WHERE id = ?", (dict_id,))
+        row = await cursor.fetchone()
+        if row is None:
+            raise RuntimeError(f"压缩字典 {dict_id} 不存在")
+        _dicts[dict_id] = (row[0], bytes(row[1]))
+    return _dicts[dict_id][1]
+
+
+async def _current_dict(db: aiosqlite.Connection) -> Tuple[Optional[int], bytes]:
+    """当前编码方式下最新的字典"""
+    cursor = await db.execute(
+        "SELECT id FROM plan_dicts WHERE codec = ? ORDER BY id DESC LIMIT 1", (CODEC,)
+    )
+    row = await cursor.fetchone()
+    if row is None:
+        return None, b""
+    return row[0], await _load_dict(db, row[0])
+
+
+async def _sample_plans(db: aiosqlite.Connection) -> List[str]:
+    """抽取最近的规划正文作为训练样本（兼容尚未迁移的明文行）"""
+    cursor = await db.execute(
+        """
+        SELECT plan_content, plan_hash FROM travel_history
+        ORDER BY id DESC LIMIT ?
+        """,
+        (MAX_TRAIN_SAMPLES,)
+    )
+    rows = await cursor.fetchall()
+    texts = [content for content, _ in rows if content]
+    hashes = [h for content, h in rows if not content and h]
+    texts.extend((await load_plans(db, hashes)).values())
+    return texts
+
+
+async def ensure_dictionary(db: aiosqlite.Connection) -> Optional[int]:
+    """
+    确保存在可用字典
+
+    以下情况（重新）训练：还没有字典；当前字典是样本不足时生成的，现在样本够了；
+    当前字典已压缩过 RETRAIN_ROWS 条正文（内容分布可能已经变化）。
+    旧字典保留，已有正文仍可按其 dict_id 解压。
+    """
+    cursor = await db.execute(
+        "SELECT id, sample_count FROM plan_dicts WHERE codec = ? ORDER BY id DESC LIMIT 1", (CODEC,)
+    )
+    row = await cursor.fetchone()
+    if row is not None and row[1] >= MIN_TRAIN_SAMPLES:
+        cursor = await db.execute("SELECT COUNT(*) FROM plan_blobs WHERE dict_id = ?", (row[0],))
+        if (await cursor.fetchone())[0] < RETRAIN_ROWS:
+            return row[0]
+
+    samples = await _sample_plans(db)
+    if row is not None and len(samples) < MIN_TRAIN_SAMPLES:
+        return row[0]
+
+    zdict = await asyncio.to_thread(train_dictionary, samples)
+    cursor = await db.execute(
+        "INSERT INTO plan_dicts (codec, data, sample_count, created_at) VALUES (?, ?, ?, ?)",
+        (CODEC, zdict, len(samples), datetime.now().isoformat())
+    )
+    logger.info("已生成规划压缩字典 #%d（%s，%d 个样本，%d 字节）", cursor.lastrowid, CODEC, len(samples), len(zdict))
+    return cursor.lastrowid
+
+
+_puts_since_check = 0
+
+
+def retrain_check_due() -> bool:
+    """写入的正文数累计到 RETRAIN_CHECK_EVERY 时返回 True（并重新计数），由调用方执行 ensure_dictionary"""
+    global _puts_since_check
+    if _puts_since_check < RETRAIN_CHECK_EVERY:
+        return False
+    _puts_since_check = 0
+    return True
+
+
+async def put_plan(db: aiosqlite.Connection, text: str) -> str:
+    """写入正文（相同内容只存一份），返回内容哈希"""
+    global _puts_since_check
+    digest = plan_hash(text)
+    cursor = await db.execute("SELECT 1 FROM plan_blobs WHERE hash = ?", (digest,))
+    if await cursor.fetchone():
+        return digest
+    dict_id, zdict = await _current_dict(db)
+    data = await asyncio.to_thread(compress, text, CODEC, dict_id, zdict)
+    await db.execute(
+        "INSERT OR IGNORE INTO plan_blobs (hash, codec, dict_id, data, raw_size) VALUES (?, ?, ?, ?, ?)",
+        (digest, CODEC, dict_id, data, len(text.encode("utf-8")))
+    )
+    _puts_since_check += 1
+    return digest
+
+
+async def load_plans(db: aiosqlite.Connection, hashes: Iterable[str]) -> Dict[str, str]:
+    """批量读取并解压正文：hash -> 文本"""
+    hashes = list(dict.fromkeys(h for h in hashes if h))
+    if not hashes:
+        return {}
+    placeholders = ",".join("?" * len(hashes))
+    cursor = await db.execute(
+        f"SELECT hash, codec, dict_id, data FROM plan_blobs WHERE hash IN ({placeholders})", hashes
+    )
+    rows = [
+        (digest, bytes(data), codec, dict_id, await _load_dict(db, dict_id))
+        for digest, codec, dict_id, data in await cursor.fetchall()
+    ]
+    return await asyncio.to_thread(_decompress_rows, rows) if rows else {}
+
+
+async def delete_orphans(db: aiosqlite.Connection, hashes: Iterable[str]) -> int:
+    """删除已无记录引用的正文"""
+    deleted = 0
+    for digest in set(h for h in hashes if h):
+        cursor = await db.execute(
+            """
+            DELETE FROM plan_blobs WHERE hash = ?
+              AND NOT EXISTS (SELECT 1 FROM travel_history WHERE plan_hash = ?)
+            """,
+            (digest, digest)
+        )
+        deleted += cursor.rowcount
+    return deleted
+
+
+async def migrate_plans(db: aiosqlite.Connection, chunk_size: int = 200) -> int:
+    """把 travel_history 中的明文正文迁移到 plan_blobs，返回迁移行数"""
+    migrated = 0
+    while True:
+        cursor = await db.execute(
+            """
+            SELECT id, plan_content FROM travel_history
+            WHERE plan_content != '' AND (plan_hash IS NULL OR plan_hash = '')
+            LIMIT ?
+            """,
+            (chunk_size,)
+        )
+        rows = await cursor.fetchall()
+        if not rows:
+            return migrated
+        for row_id, content in rows:
+            digest = await put_plan(db, content)
+            await db.execute(
+                "UPDATE travel_history SET plan_hash = ?, plan_content = '' WHERE id = ?",
+                (digest, row_id)
+            )
+        migrated += len(rows)
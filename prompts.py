@@ -117,6 +117,67 @@ FINALIZE_ITINERARY_PROMPT = """请将以下旅行方案整理为精美的最终
 
 请使用 emoji 美化输出。"""
 
+FUSED_ITINERARY_PROMPT = """请基于以下调研结果和预算骨架，直接输出一份精美的最终行程单：
+
+【目的地调研】
+{research_result}
+
+【预算骨架】
+{draft_skeleton}
+
+【预算约束】
+- 总预算：{budget} 元，预算明细各项之和不得超过总预算
+- 各项金额以预算骨架为基准，可小幅调整，但须给出具体金额
+- 景点门票、餐饮人均等价格参考调研结果
+
+请按以下格式输出（不要使用 Markdown 表格）：
+
+# 🧳 {destination}旅行计划
+
+## 📅 行程概览
+- **出发地**：{departure}
+- **目的地**：{destination}
+- **出行日期**：{start_date} 至 {end_date}
+- **总预算**：{budget} 元
+
+## 🗓️ 每日行程
+每天使用列表格式描述（包含具体景点和餐饮）
+
+## 💰 预算明细
+使用列表格式，每行形如 "- 交通：xxx元"，依次列出交通、住宿、餐饮、门票、其他，最后给出总计
+
+## 📝 温馨提示
+使用要点列表
+
+请使用 emoji 美化输出。"""
+
+ADAPT_PLAN_PROMPT = """下面是一份条件非常接近的历史行程单，请在其基础上改编出新的行程单：
+
+【历史行程单】
+{reference_plan}
+
+【新的需求】
+- 出发地：{departure}
+- 目的地：{destination}
+- 出行日期：{start_date} 至 {end_date}
+- 总预算：{budget} 元
+
+改编要求：
+1. 保持原有格式和风格，只修改与新需求不符的部分（日期、天数、出发地交通、预算金额等）
+2. 天数变化时相应增删每日行程
+3. 预算明细各项之和不得超过总预算
+4. 直接输出完整的新行程单，不要解释修改过程"""
+
+REFERENCE_PLAN_BLOCK = """
+
+【相似历史方案（仅供参考，可复用其中合适的安排，按本次需求调整）】
+{reference_plan}"""
+
+DEPARTURE_TRANSPORT_BLOCK = """
+
+【{departure}出发的交通搜索结果（知识库调研中的交通为通用建议，以此为准）】
+{search_results}"""
+
 CONTENT_REVIEW_PROMPT = """你是一位资深的旅游文案编辑。请对以下旅行规划进行质量审核：
 
 【旅行规划文案】
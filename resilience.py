@@ -0,0 +1,272 @@
+"""
+LLM 调用韧性层
+- 分阶段的连接 / 首字 / 总时长超时
+- 幂等的非流式步骤：带抖动退避的有限重试
+- 短 JSON 步骤（骨架、调研、预算解析）：可选的对冲请求
+- 熔断器：上游不健康时快速失败，由调用方回退到固定比例预算或缓存调研
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, replace
+from typing import AsyncIterator, Dict, Optional
+
+import httpx
+
+import apiset
+from load_control import load_controller
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，调用被快速拒绝"""
+
+
+class LLMTimeoutError(Exception):
+    """LLM 调用超过阶段超时"""
+
+
+# ========== 阶段策略 ==========
+
+@dataclass(frozen=True)
+class StagePolicy:
+    """单个阶段的超时 / 重试 / 对冲策略（单位：秒）"""
+    connect_timeout: float = 5.0
+    first_token_timeout: float = 30.0  # 仅流式调用使用
+    total_timeout: float = 120.0
+    retries: int = 0  # 额外重试次数（仅非流式）
+    hedge_after: Optional[float] = None  # 超过该时间仍未返回则发起对冲请求
+    backoff_base: float = 0.5
+    backoff_cap: float = 8.0
+    latency_sample: bool = False  # 非流式调用的整段耗时是否计入负载控制的延迟样本
+
+
+STAGE_POLICIES: Dict[str, StagePolicy] = {
+    # 短 JSON 步骤：超时短、可重试、可对冲
+    "research": StagePolicy(total_timeout=45, retries=2, hedge_after=8, latency_sample=True),
+    "skeleton": StagePolicy(total_timeout=30, retries=2, hedge_after=5, latency_sample=True),
+    "budget_parse": StagePolicy(total_timeout=20, retries=1, hedge_after=4, latency_sample=True),
+    # 长文本流式步骤：只限制首字和总时长，不重试
+    "draft": StagePolicy(first_token_timeout=30, total_timeout=180),
+    "finalize": StagePolicy(first_token_timeout=30, total_timeout=180),
+    "fused": StagePolicy(first_token_timeout=30, total_timeout=240),
+    "adapt": StagePolicy(first_token_timeout=20, total_timeout=120),
+    # 其余非流式步骤（Agent 节点、对话修改）：生成长文本，整段耗时不计入延迟样本
+    "default": StagePolicy(total_timeout=120, retries=1),
+}
+
+# 测试或压测时可整体缩放超时（例如对接本地假服务时设为 0.1）
+TIMEOUT_SCALE = float(os.getenv("LLM_TIMEOUT_SCALE", "1"))
+HEDGING_ENABLED = os.getenv("LLM_HEDGING", "0") == "1"
+
+# 全进程共享的 LLM 并发上限（在线请求与批量任务共用）
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+_llm_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+
+def get_policy(stage: str) -> StagePolicy:
+    """获取阶段策略（已应用超时缩放）"""
+    policy = STAGE_POLICIES.get(stage, STAGE_POLICIES["default"])
+    if TIMEOUT_SCALE == 1:
+        return policy
+    return replace(
+        policy,
+        connect_timeout=policy.connect_timeout * TIMEOUT_SCALE,
+        first_token_timeout=policy.first_token_timeout * TIMEOUT_SCALE,
+        total_timeout=policy.total_timeout * TIMEOUT_SCALE,
+        hedge_after=policy.hedge_after * TIMEOUT_SCALE if policy.hedge_after else None
+    )
+
+
+def _http_timeout(policy: StagePolicy) -> httpx.Timeout:
+    """转换为底层 HTTP 请求的超时设置"""
+    return httpx.Timeout(policy.total_timeout, connect=policy.connect_timeout)
+
+
+# ========== 熔断器 ==========
+
+class CircuitBreaker:
+    """连续失败达到阈值后打开，冷却后放行单个探测请求（半开）"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"  # closed / open / half_open
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        """上游是否被判定为不健康（调用方可据此直接走回退路径）"""
+        if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+            return False
+        return self.state == "open" or (self.state == "half_open" and self._probe_in_flight)
+
+    def before_call(self):
+        """调用前检查，打开状态下抛出 CircuitOpenError"""
+        if self.state == "closed":
+            return
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError("LLM 服务暂不可用（熔断中）")
+            self.state = "half_open"
+        if self._probe_in_flight:
+            raise CircuitOpenError("LLM 服务暂不可用（探测中）")
+        self._probe_in_flight = True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning("LLM 熔断器打开（连续失败 %d 次）", self.failures)
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+    def release(self):
+        """调用被取消（未产生成功/失败结论）时释放半开探测名额"""
+        self._probe_in_flight = False
+
+    def snapshot(self) -> dict:
+        return {"state": self.state, "failures": self.failures}
+
+
+breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+)
+
+
+# ========== 调用入口 ==========
+
+async def _attempt(policy: StagePolicy, prompt: str) -> str:
+    """单次非流式调用（带总超时；短 JSON 步骤记录上游延迟）"""
+    async with _llm_slots:
+        with load_controller.observe() if policy.latency_sample else nullcontext():
+            try:
+                response = await asyncio.wait_for(
+                    apiset.llm.ainvoke(prompt, timeout=_http_timeout(policy)),
+                    policy.total_timeout
+                )
+            except asyncio.TimeoutError:
+                raise LLMTimeoutError(f"LLM 调用超时（{policy.total_timeout:.1f}s）")
+    return response.content
+
+
+async def _hedged_attempt(policy: StagePolicy, prompt: str) -> str:
+    """
+    对冲调用：首个请求迟迟未返回时并发第二个请求，取先成功者
+
+    无论正常返回、失败还是调用方被取消，都会取消并等待所有子请求结束，确保释放并发名额。
+    """
+    tasks = [asyncio.create_task(_attempt(policy, prompt))]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=policy.hedge_after)
+        if not done:
+            tasks.append(asyncio.create_task(_attempt(policy, prompt)))
+
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def ainvoke(stage: str, prompt: str) -> str:
+    """
+    按阶段策略调用 LLM（非流式），返回文本内容
+
+    Raises:
+        CircuitOpenError: 熔断器打开
+        LLMTimeoutError / 其他异常: 重试耗尽后的最后一次错误
+    """
+    policy = get_policy(stage)
+    use_hedge = HEDGING_ENABLED and policy.hedge_after is not None
+
+    for attempt in range(policy.retries + 1):
+        breaker.before_call()
+        try:
+            if use_hedge:
+                content = await _hedged_attempt(policy, prompt)
+            else:
+                content = await _attempt(policy, prompt)
+            breaker.record_success()
+            return content
+        except Exception as e:
+            breaker.record_failure()
+            if attempt >= policy.retries or breaker.state == "open":
+                raise
+            # Full jitter 退避
+            delay = random.uniform(0, min(policy.backoff_cap, policy.backoff_base * 2 ** attempt))
+            logger.warning("LLM 阶段 %s 第 %d 次调用失败，%.2fs 后重试: %s", stage, attempt + 1, delay, e)
+        finally:
+            breaker.release()
+        await asyncio.sleep(delay)
+
+
+async def astream(stage: str, prompt: str) -> AsyncIterator[str]:
+    """
+    按阶段策略流式调用 LLM，逐块产出非空文本
+
+    流式调用不做重试（已输出的内容无法撤回），只限制首字延迟和总时长。
+    """
+    policy = get_policy(stage)
+    breaker.before_call()
+    try:
+        await _llm_slots.acquire()
+    except BaseException:
+        breaker.release()
+        raise
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + policy.total_timeout
+    first_token_deadline = min(deadline, started + policy.first_token_timeout)
+    received_first = False
+
+    stream = apiset.llm.astream(prompt, timeout=_http_timeout(policy)).__aiter__()
+    try:
+        while True:
+            limit = deadline if received_first else first_token_deadline
+            try:
+                chunk = await asyncio.wait_for(stream.__anext__(), max(0.0, limit - loop.time()))
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                kind = "总时长" if received_first else "首字"
+                raise LLMTimeoutError(f"LLM 流式调用{kind}超时（阶段 {stage}）")
+
+            if not chunk.content:
+                continue
+            if not received_first:
+                received_first = True
+                # 流式调用以首字延迟作为上游延迟样本
+                load_controller.record_latency(loop.time() - started)
+            yield chunk.content
+        breaker.record_success()
+    except Exception:
+        breaker.record_failure()
+        raise
+    finally:
+        # 消费方提前退出（例如客户端断开）时也要释放底层连接和并发名额
+        breaker.release()
+        _llm_slots.release()
+        await stream.aclose()
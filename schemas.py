@@ -12,6 +12,13 @@ class TravelRequest(BaseModel):
     destination: str
     start_date: str
     end_date: str
+    request_id: Optional[str] = None  # 幂等键：同一 ID 重试时从上次完成的节点继续
+    style: str = ""  # 文案风格（可选）
+
+
+class RefinalizeRequest(BaseModel):
+    """以新的文案风格重新生成已保存的方案"""
+    style: str
 
 
 class BudgetItem(BaseModel):
@@ -26,6 +33,7 @@ class TravelResponse(BaseModel):
     success: bool
     plan: str
     plan_id: Optional[int] = None
+    request_id: Optional[str] = None
     budget_breakdown: List[BudgetItem] = []
     message: str = ""
 
@@ -56,12 +64,14 @@ class TravelRecord(BaseModel):
     end_date: str
     plan_content: str
     created_at: str
+    request_id: str = ""
 
 
 class HistoryResponse(BaseModel):
     """历史记录响应"""
     success: bool
     history: List[TravelRecord] = []
+    next_cursor: Optional[int] = None  # 下一页游标，没有更多记录时为空
     message: str = ""
 
 # ====================
@@ -72,9 +82,11 @@ class TravelState(TypedDict):
     """旅行规划状态"""
     # 用户输入
     budget: int  # 预算（元）
+    departure: str  # 出发地
     destination: str  # 目的地
     start_date: str  # 开始日期
     end_date: str  # 结束日期
+    style: str  # 文案风格（可为空）
     
     # 中间状态
     research_result: str  # 目的地调研结果
@@ -0,0 +1,466 @@
+"""
+搜索后端
+统一的搜索接口，三种实现：
+- ddgs:      DuckDuckGo 实时网页搜索
+- local:     本地语料的 BM25 倒排索引（索引文件落盘后 mmap 读取，可完全离线）
+- composite: 先查本地，得分不足时才查网页（默认）
+
+本地语料放在 SEARCH_CORPUS_DIR（默认 corpus/）下：
+- *.md / *.txt: 文件名即目的地（如 北京.md，general.md 为通用内容），按标题 / 空行切分为文档
+- *.jsonl:      每行 {"destination": "北京", "title": "...", "body": "..."}
+仓库不附带语料（格式示例见 tests/fixtures/corpus/）；SEARCH_BACKEND 为 local / composite
+而语料目录为空时启动即记录错误，CLI build 直接失败。
+
+CLI 用法:
+    python search_providers.py build
+    python search_providers.py query "北京 必游景点 门票价格" --destination 北京
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from array import array
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import http_pool
+
+logger = logging.getLogger(__name__)
+
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "composite")
+SEARCH_CORPUS_DIR = os.getenv("SEARCH_CORPUS_DIR", "corpus")
+LOCAL_MIN_SCORE = float(os.getenv("SEARCH_LOCAL_MIN_SCORE", "0.5"))  # 低于该得分视为本地未命中
+
+INDEX_DIRNAME = ".index"
+INDEX_VERSION = 1
+SIGNATURE_CHECK_INTERVAL = 60  # 秒；语料文件变化后自动重建索引
+GENERAL_DESTINATION = "general"  # 不限目的地的通用文档
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_WORD = re.compile(r"[a-z0-9]+|[一-鿿]+")
+_HEADING = re.compile(r"^#{1,6}\s*(.+)$")
+
+
+class SearchProvider(ABC):
+    """搜索后端接口"""
+
+    name = "base"
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    @abstractmethod
+    async def search(self, query: str, destination: str = "", max_results: int = 2) -> List[dict]:
+        """返回 [{"title", "body", ...}]（与 build_search_context 的输入格式一致）"""
+
+
+# ========== DDGS ==========
+
+class DDGSProvider(SearchProvider):
+    """
+    DuckDuckGo 实时搜索（同步库，经 http_pool.run_blocking 在固定线程池中运行）
+
+    每个线程复用自己的 DDGS 会话，keep-alive 连接在多次查询间保持，避免每次查询重新握手；
+    会话出错时丢弃，下次查询重新创建。DDGS 自带 HTTP 客户端，不经过 http_pool 的共享连接池
+    （没有 DNS 缓存和每主机上限），/health 中只统计它的调用次数和耗时。
+    """
+
+    name = "ddgs"
+
+    def __init__(self):
+        self._local = threading.local()
+
+    @property
+    def available(self) -> bool:
+        try:
+            import duckduckgo_search  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def _session(self):
+        ddgs = getattr(self._local, "ddgs", None)
+        if ddgs is None:
+            from duckduckgo_search import DDGS
+            ddgs = self._local.ddgs = DDGS()
+        return ddgs
+
+    def _search_sync(self, query: str, max_results: int) -> List[dict]:
+        try:
+            return list(self._session().text(query, max_results=max_results))
+        except Exception as e:
+            self._local.ddgs = None
+            logger.warning("搜索出错 %s: %s", query, e)
+            return []
+
+    async def search(self, query: str, destination: str = "", max_results: int = 2) -> List[dict]:
+        return await http_pool.run_blocking(self._search_sync, query, max_results)
+
+
+# ========== 本地 BM25 ==========
+
+def tokenize(text: str) -> List[str]:
+    """英文 / 数字按词，中文按字符二元组（单字保留原字）"""
+    tokens = []
+    for word in _WORD.findall(text.lower()):
+        if word.isascii() or len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def _split_markdown(text: str) -> Iterator[tuple]:
+    """按标题和空行切分为 (标题, 段落)"""
+    title = ""
+    paragraph: List[str] = []
+
+    def flush():
+        body = " ".join(paragraph).strip()
+        paragraph.clear()
+        return (title, body) if body else None
+
+    for line in text.splitlines():
+        heading = _HEADING.match(line.strip())
+        if heading or not line.strip():
+            doc = flush()
+            if doc:
+                yield doc
+            if heading:
+                title = heading.group(1).strip()
+        else:
+            paragraph.append(line.strip())
+    doc = flush()
+    if doc:
+        yield doc
+
+
+def _corpus_files(corpus_dir: Path) -> List[Path]:
+    if not corpus_dir.is_dir():
+        return []
+    return sorted(
+        p for p in corpus_dir.rglob("*")
+        if p.is_file() and p.suffix in (".md", ".txt", ".jsonl") and INDEX_DIRNAME not in p.parts
+    )
+
+
+def _corpus_signature(files: List[Path]) -> List[list]:
+    return [[str(p), p.stat().st_size, int(p.stat().st_mtime)] for p in files]
+
+
+def load_corpus(corpus_dir: Path) -> Iterator[dict]:
+    """读取语料目录，产出 {"destination", "title", "body"}"""
+    for path in _corpus_files(corpus_dir):
+        default_dest = "" if path.stem == GENERAL_DESTINATION else path.stem
+        if path.suffix == ".jsonl":
+            with open(path, encoding="utf-8") as f:
+                for line_no, line in enumerate(f, start=1):
+                    if not line.strip():
+                        continue
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError:
+                        item = None
+                    if not isinstance(item, dict):
+                        logger.warning("语料解析失败 %s:%d", path, line_no)
+                        continue
+                    yield {
+                        "destination": item.get("destination", default_dest),
+                        "title": item.get("title", ""),
+                        "body": item.get("body", ""),
+                    }
+        else:
+            for title, body in _split_markdown(path.read_text(encoding="utf-8")):
+                yield {"destination": default_dest, "title": title or path.stem, "body": body}
+
+
+def build_index(corpus_dir: Path, index_dir: Path) -> dict:
+    """
+    构建倒排索引并写入磁盘
+
+    文件布局（整数均为小端 uint32，offsets 为 uint64）：
+        terms.json    词 -> [postings 偏移, df]
+        postings.bin  每个词连续存放 df 个文档号，紧接着 df 个词频
+        doclens.bin   文档长度
+        dests.bin     文档目的地编号
+        offsets.bin   文档在 docs.bin 中的起止偏移
+        docs.bin      文档 JSON
+        meta.json     文档数、平均长度、目的地列表、语料签名
+    """
+    files = _corpus_files(corpus_dir)
+    postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+    doc_lens, dest_codes, offsets = array("I"), array("I"), array("Q", [0])
+    destinations: Dict[str, int] = {"": 0}
+    tmp_dir = index_dir.with_name(index_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    with open(tmp_dir / "docs.bin", "wb") as docs_file:
+        for doc_id, doc in enumerate(load_corpus(corpus_dir)):
+            tokens = tokenize(f"{doc['title']} {doc['body']}")
+            for term, tf in Counter(tokens).items():
+                postings[term][doc_id] = tf
+            doc_lens.append(len(tokens))
+            dest_codes.append(destinations.setdefault(doc["destination"].strip(), len(destinations)))
+            data = json.dumps(doc, ensure_ascii=False).encode("utf-8")
+            docs_file.write(data)
+            offsets.append(offsets[-1] + len(data))
+
+    terms = {}
+    flat = array("I")
+    for term in sorted(postings):
+        entries = postings[term]
+        terms[term] = [len(flat), len(entries)]
+        flat.extend(entries.keys())
+        flat.extend(entries.values())
+
+    for name, data in (("postings.bin", flat), ("doclens.bin", doc_lens),
+                       ("dests.bin", dest_codes), ("offsets.bin", offsets)):
+        with open(tmp_dir / name, "wb") as f:
+            data.tofile(f)
+    with open(tmp_dir / "terms.json", "w", encoding="utf-8") as f:
+        json.dump(terms, f, ensure_ascii=False)
+
+    meta = {
+        "version": INDEX_VERSION,
+        "n_docs": len(doc_lens),
+        "avgdl": (sum(doc_lens) / len(doc_lens)) if doc_lens else 0.0,
+        "destinations": list(destinations),
+        "signature": _corpus_signature(files),
+    }
+    with open(tmp_dir / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.replace(tmp_dir, index_dir)
+    logger.info("本地搜索索引已构建: %d 篇文档, %d 个词", meta["n_docs"], len(terms))
+    return meta
+
+
+class _MappedIndex:
+    """mmap 方式打开的只读索引"""
+
+    def __init__(self, index_dir: Path):
+        with open(index_dir / "meta.json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(index_dir / "terms.json", encoding="utf-8") as f:
+            self.terms: Dict[str, list] = json.load(f)
+        self.n_docs = self.meta["n_docs"]
+        self.avgdl = self.meta["avgdl"] or 1.0
+        self.dest_codes = {name: code for code, name in enumerate(self.meta["destinations"])}
+        self._maps: List[mmap.mmap] = []
+        self.postings = self._map(index_dir / "postings.bin", "I")
+        self.doc_lens = self._map(index_dir / "doclens.bin", "I")
+        self.dests = self._map(index_dir / "dests.bin", "I")
+        self.offsets = self._map(index_dir / "offsets.bin", "Q")
+        self.docs = self._map(index_dir / "docs.bin", None)
+
+    def _map(self, path: Path, fmt: Optional[str]):
+        if path.stat().st_size == 0:
+            return memoryview(b"").cast(fmt) if fmt else memoryview(b"")
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        view = memoryview(mapped)
+        return view.cast(fmt) if fmt else view
+
+    def doc(self, doc_id: int) -> dict:
+        return json.loads(bytes(self.docs[self.offsets[doc_id]:self.offsets[doc_id + 1]]))
+
+    def search(self, query: str, destination: str, k: int) -> List[dict]:
+        """
+        BM25 检索，只在该目的地和通用文档中查找
+
+        返回的 score 为归一化得分（0~1）：BM25 / 语料词表中存在的查询词 idf 之和，
+        约等于这些词的加权覆盖率。语料里根本没有的词（如 "必游"、日期）不计入分母；
+        只有一个已知词时得分减半，避免单个常见词误判为命中。
+        """
+        if not self.n_docs:
+            return []
+        allowed = {0}
+        if destination:
+            if destination not in self.dest_codes:
+                return []
+            allowed.add(self.dest_codes[destination])
+            query = query.replace(destination, " ")  # 目的地已用于过滤，不再参与打分
+
+        scores: Dict[int, float] = defaultdict(float)
+        ideal = 0.0
+        known = 0
+        for term in set(tokenize(query)):
+            entry = self.terms.get(term)
+            if not entry:
+                continue
+            offset, df = entry
+            idf = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            ideal += idf
+            known += 1
+            doc_ids = self.postings[offset:offset + df]
+            tfs = self.postings[offset + df:offset + 2 * df]
+            for doc_id, tf in zip(doc_ids, tfs):
+                if self.dests[doc_id] not in allowed:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lens[doc_id] / self.avgdl)
+                scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        if not scores or not ideal:
+            return []
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        damping = min(1.0, known / 2)
+        hits = []
+        for doc_id, score in top:
+            doc = self.doc(doc_id)
+            hits.append({"title": doc["title"], "body": doc["body"], "score": round(min(1.0, score / ideal) * damping, 4)})
+        return hits
+
+
+class LocalBM25Provider(SearchProvider):
+    """本地语料 BM25 检索；语料变化时自动重建索引"""
+
+    name = "local"
+
+    def __init__(self, corpus_dir: str = SEARCH_CORPUS_DIR):
+        self.corpus_dir = Path(corpus_dir)
+        self.index_dir = self.corpus_dir / INDEX_DIRNAME
+        self._index: Optional[_MappedIndex] = None
+        self._checked_at = 0.0
+        self._files: Optional[List[Path]] = None
+        self._files_checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _corpus(self, refresh: bool = False) -> List[Path]:
+        """语料文件列表（按签名检查间隔缓存，避免每次查询都在事件循环上遍历目录）"""
+        if refresh or self._files is None or time.monotonic() - self._files_checked_at >= SIGNATURE_CHECK_INTERVAL:
+            self._files = _corpus_files(self.corpus_dir)
+            self._files_checked_at = time.monotonic()
+        return self._files
+
+    @property
+    def available(self) -> bool:
+        return bool(self._corpus())
+
+    def ensure_index(self) -> _MappedIndex:
+        """打开索引；索引缺失或语料签名变化时重建"""
+        with self._lock:
+            if self._index and time.monotonic() - self._checked_at < SIGNATURE_CHECK_INTERVAL:
+                return self._index
+            signature = _corpus_signature(self._corpus(refresh=True))
+            self._checked_at = time.monotonic()
+            if self._index and self._index.meta["signature"] == signature:
+                return self._index
+
+            meta_path = self.index_dir / "meta.json"
+            stale = True
+            if meta_path.exists():
+                with open(meta_path, encoding="utf-8") as f:
+                    meta = json.load(f)
+                stale = meta.get("version") != INDEX_VERSION or meta.get("signature") != signature
+            if stale:
+                build_index(self.corpus_dir, self.index_dir)
+            # 旧索引可能仍被正在进行的检索引用，不主动关闭，由引用计数回收映射
+            self._index = _MappedIndex(self.index_dir)
+            return self._index
+
+    def _search_sync(self, query: str, destination: str, max_results: int) -> List[dict]:
+        return self.ensure_index().search(query, destination, max_results)
+
+    async def search(self, query: str, destination: str = "", max_results: int = 2) -> List[dict]:
+        if self._index is None and not self.available:
+            return []
+        # 打开索引 / 检查语料变化（文件 IO）和 BM25 打分都放到线程中，不阻塞事件循环
+        return await asyncio.to_thread(self._search_sync, query, destination.strip(), max_results)
+
+
+# ========== 组合 ==========
+
+class CompositeSearchProvider(SearchProvider):
+    """先查本地语料，得分低于阈值（或无结果）时再查网页；网页不可用时退回本地结果"""
+
+    name = "composite"
+
+    def __init__(self, local: SearchProvider, web: SearchProvider, min_score: float = LOCAL_MIN_SCORE):
+        self.local = local
+        self.web = web
+        self.min_score = min_score
+        self.stats = Counter()  # 各后端命中次数
+
+    @property
+    def available(self) -> bool:
+        return self.local.available or self.web.available
+
+    async def search(self, query: str, destination: str = "", max_results: int = 2) -> List[dict]:
+        hits = []
+        if self.local.available:
+            try:
+                hits = await self.local.search(query, destination, max_results)
+            except Exception as e:
+                # 本地索引损坏 / 构建失败时直接查网页
+                logger.warning("本地搜索出错 %s: %s", query, e)
+        if hits and hits[0].get("score", 0) >= self.min_score:
+            self.stats["local"] += 1
+            return hits
+        if self.web.available:
+            web_hits = await self.web.search(query, destination, max_results)
+            if web_hits:
+                self.stats["web"] += 1
+                return web_hits
+        self.stats["local_fallback" if hits else "miss"] += 1
+        return hits
+
+
+_provider: Optional[SearchProvider] = None
+
+
+def get_search_provider() -> SearchProvider:
+    """按 SEARCH_BACKEND 创建（并缓存）搜索后端"""
+    global _provider
+    if _provider is None:
+        if SEARCH_BACKEND == "ddgs":
+            _provider = DDGSProvider()
+        elif SEARCH_BACKEND == "local":
+            _provider = LocalBM25Provider()
+        else:
+            _provider = CompositeSearchProvider(LocalBM25Provider(), DDGSProvider())
+        if SEARCH_BACKEND != "ddgs" and not _corpus_files(Path(SEARCH_CORPUS_DIR)):
+            logger.error(
+                "本地搜索语料为空（%s），local 模式将没有搜索结果，composite 模式只能查网页；"
+                "语料格式见 search_providers.py 模块说明", Path(SEARCH_CORPUS_DIR).resolve()
+            )
+    return _provider
+
+
+# ========== CLI ==========
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="本地搜索语料索引")
+    parser.add_argument("command", choices=["build", "query"])
+    parser.add_argument("text", nargs="?", default="", help="查询内容（query 命令）")
+    parser.add_argument("--destination", default="", help="目的地过滤")
+    parser.add_argument("--corpus", default=SEARCH_CORPUS_DIR, help="语料目录")
+    parser.add_argument("-k", type=int, default=5, help="返回条数")
+    args = parser.parse_args()
+
+    provider = LocalBM25Provider(args.corpus)
+    if args.command == "build":
+        if not _corpus_files(provider.corpus_dir):
+            sys.exit(f"语料目录为空或不存在: {provider.corpus_dir.resolve()}")
+        build_index(provider.corpus_dir, provider.index_dir)
+    else:
+        started = time.perf_counter()
+        hits = asyncio.run(provider.search(args.text, args.destination, args.k))
+        for hit in hits:
+            print(json.dumps(hit, ensure_ascii=False))
+        print(f"耗时 {1000 * (time.perf_counter() - started):.1f} ms", file=sys.stderr)
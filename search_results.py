@@ -0,0 +1,136 @@
+"""
+搜索结果规范化模块
+把原始搜索结果压缩成紧凑的 "标题 + 摘要" 文本：
+去掉 URL / 引号转义等噪音，跨查询去重重叠摘要，并按本地 token 估算控制预算。
+"""
+import json
+import logging
+import re
+from typing import Dict, List, Sequence
+
+logger = logging.getLogger(__name__)
+
+PER_QUERY_TOKEN_BUDGET = 200
+TOTAL_TOKEN_BUDGET = 600
+
+_CJK = re.compile(r"[㐀-鿿豈-﫿　-〿＀-￯]")
+_URL = re.compile(r"https?://\S+")
+_SPACE = re.compile(r"\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """本地 token 估算：中日韩字符约 1 token/字，其余约 4 字符/token"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _clean(text: str) -> str:
+    text = _URL.sub("", text or "")
+    text = text.replace("\\n", " ").replace('"', "").replace("...", "…")
+    return _SPACE.sub(" ", text).strip()
+
+
+def _truncate_to_budget(text: str, budget: int) -> str:
+    """按 token 预算截断（保留开头部分）"""
+    if estimate_tokens(text) <= budget:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo].rstrip() + "…"
+
+
+def _shingles(text: str, n: int = 4) -> set:
+    compact = text.replace(" ", "")
+    return {compact[i:i + n] for i in range(max(1, len(compact) - n + 1))}
+
+
+def _is_duplicate(snippet: str, seen: List[set], threshold: float = 0.6) -> bool:
+    """与已收录的摘要重叠度（Jaccard）超过阈值视为重复"""
+    current = _shingles(snippet)
+    for other in seen:
+        union = len(current | other)
+        if union and len(current & other) / union >= threshold:
+            return True
+    return False
+
+
+def normalize_hits(hits: Sequence[dict]) -> List[str]:
+    """把一条查询的原始结果规范化为 "标题：摘要" 行"""
+    lines = []
+    for hit in hits:
+        title = _clean(hit.get("title", ""))
+        body = _clean(hit.get("body") or hit.get("snippet", ""))
+        if not (title or body):
+            continue
+        lines.append(f"{title}：{body}" if title and body else title or body)
+    return lines
+
+
+def build_search_context(
+    results: Dict[str, Sequence[dict]],
+    per_query_budget: int = PER_QUERY_TOKEN_BUDGET,
+    total_budget: int = TOTAL_TOKEN_BUDGET
+) -> str:
+    """
+    把 {查询: 原始结果列表} 压缩为紧凑的提示词片段
+
+    每个查询不超过 per_query_budget，总量不超过 total_budget（按估算 token 计）。
+    """
+    seen: List[set] = []
+    sections = []
+    used = 0
+    for query, hits in results.items():
+        remaining = min(per_query_budget, total_budget - used)
+        if remaining <= 0:
+            break
+        lines = []
+        for line in normalize_hits(hits):
+            if _is_duplicate(line, seen):
+                continue
+            seen.append(_shingles(line))
+            lines.append(f"- {line}")
+        if not lines:
+            continue
+        section = _truncate_to_budget(f"【{query}】\n" + "\n".join(lines), remaining)
+        used += estimate_tokens(section)
+        sections.append(section)
+
+    context = "\n".join(sections)
+    raw = "".join(f"【搜索：{q}】\n{str(list(h))}\n\n" for q, h in results.items())
+    raw_tokens, new_tokens = estimate_tokens(raw), estimate_tokens(context)
+    if raw_tokens:
+        logger.info(
+            "搜索结果压缩: %d -> %d tokens (节省 %.0f%%)",
+            raw_tokens, new_tokens, 100 * (1 - new_tokens / raw_tokens)
+        )
+    return context
+
+
+def compact_research(research: str) -> str:
+    """
+    压缩 LLM 返回的调研 JSON（去掉代码块标记和多余空白）
+
+    调研结果会被同时拼进方案和定稿两个提示词，压缩一次省两次。
+    解析失败时原样返回。
+    """
+    text = research.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        text = text[text.find("\n") + 1:] if "\n" in text else text
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return research
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return research
+    compact = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    if len(compact) < len(research):
+        logger.info("调研结果压缩: %d -> %d tokens", estimate_tokens(research), estimate_tokens(compact))
+        return compact
+    return research
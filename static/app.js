@@ -0,0 +1,727 @@
+// 元素引用
+const form = document.getElementById('travel-form');
+const formSection = document.getElementById('form-section');
+const loadingSection = document.getElementById('loading-section');
+const resultSection = document.getElementById('result-section');
+const resultContent = document.getElementById('result-content');
+const errorMessage = document.getElementById('error-message');
+const budgetSlider = document.getElementById('budget');
+const budgetDisplay = document.getElementById('budget-display');
+const newPlanBtn = document.getElementById('new-plan-btn');
+const chatInput = document.getElementById('chat-input');
+const chatSendBtn = document.getElementById('chat-send-btn');
+const chatLoading = document.getElementById('chat-loading');
+const loadingStatus = document.getElementById('loading-status');
+const compareBudgetsInput = document.getElementById('compare-budgets');
+const variantTabs = document.getElementById('variant-tabs');
+
+// 当前方案数据
+let currentPlan = '';
+let currentBudget = 5000;
+let currentDestination = '';
+let budgetChart = null;
+
+// 设置默认日期
+const today = new Date();
+const startDate = new Date(today);
+startDate.setDate(startDate.getDate() + 7);
+const endDate = new Date(today);
+endDate.setDate(endDate.getDate() + 10);
+
+document.getElementById('start-date').value = startDate.toISOString().split('T')[0];
+document.getElementById('end-date').value = endDate.toISOString().split('T')[0];
+
+// 预算滑块更新
+budgetSlider.addEventListener('input', (e) => {
+  budgetDisplay.textContent = parseInt(e.target.value).toLocaleString();
+});
+
+// ========== 点击地球解压游戏 ==========
+let clickCount = 0;
+const clickableGlobe = document.getElementById('clickable-globe');
+const counterValue = document.getElementById('counter-value');
+const clickEffects = document.getElementById('click-effects');
+
+clickableGlobe.addEventListener('click', (e) => {
+  clickCount++;
+  counterValue.textContent = clickCount;
+
+  // 地球缩放动画
+  clickableGlobe.style.transform = 'scale(1.3)';
+  setTimeout(() => {
+    clickableGlobe.style.transform = 'scale(1)';
+  }, 150);
+
+  // 创建 +1 特效
+  const effect = document.createElement('div');
+  effect.className = 'click-effect';
+  effect.textContent = '+1';
+  effect.style.left = `${Math.random() * 60 + 20}%`;
+  clickEffects.appendChild(effect);
+
+  // 移除特效
+  setTimeout(() => effect.remove(), 1000);
+
+  // 每10次显示彩蛋
+  if (clickCount % 10 === 0) {
+    const emojis = ['🎉', '⭐', '🚀', '💫', '✨'];
+    const emoji = emojis[Math.floor(Math.random() * emojis.length)];
+    const bonus = document.createElement('div');
+    bonus.className = 'click-effect bonus';
+    bonus.textContent = emoji;
+    bonus.style.left = '50%';
+    clickEffects.appendChild(bonus);
+    setTimeout(() => bonus.remove(), 1500);
+  }
+});
+
+// ========== 加载步骤动画 (5 步) ==========
+const loadingSteps = [
+  { id: 'step-1', text: 'AI 正在调研目的地信息...', delay: 0 },
+  { id: 'step-2', text: 'AI 正在制定初步方案...', delay: 6000 },
+  { id: 'step-3', text: 'AI 正在进行预算审核...', delay: 12000 },
+  { id: 'step-4', text: 'AI 正在生成详细行程...', delay: 18000 },
+  { id: 'step-5', text: 'AI 正在润色优化文案...', delay: 24000 }
+];
+
+let stepTimeouts = [];
+
+function startLoadingAnimation() {
+  // 重置点击计数
+  clickCount = 0;
+  counterValue.textContent = '0';
+
+  // 重置所有步骤
+  document.querySelectorAll('.step').forEach(s => s.classList.remove('active', 'done'));
+  document.getElementById('step-1').classList.add('active');
+  loadingStatus.textContent = loadingSteps[0].text;
+
+  // 设置步骤动画
+  loadingSteps.slice(1).forEach((step, index) => {
+    const timeout = setTimeout(() => {
+      document.getElementById(loadingSteps[index].id).classList.remove('active');
+      document.getElementById(loadingSteps[index].id).classList.add('done');
+      document.getElementById(step.id).classList.add('active');
+      loadingStatus.textContent = step.text;
+    }, step.delay);
+    stepTimeouts.push(timeout);
+  });
+}
+
+function stopLoadingAnimation() {
+  stepTimeouts.forEach(t => clearTimeout(t));
+  stepTimeouts = [];
+}
+
+// 表单提交
+form.addEventListener('submit', async (e) => {
+  e.preventDefault();
+  errorMessage.classList.remove('active');
+
+  const data = {
+    budget: parseInt(budgetSlider.value),
+    departure: document.getElementById('departure').value.trim(),
+    destination: document.getElementById('destination').value.trim(),
+    start_date: document.getElementById('start-date').value,
+    end_date: document.getElementById('end-date').value
+  };
+
+  currentBudget = data.budget;
+  currentDestination = data.destination;
+
+  if (new Date(data.end_date) <= new Date(data.start_date)) {
+    showError('返程日期必须晚于出发日期');
+    return;
+  }
+
+  formSection.style.display = 'none';
+  loadingSection.classList.add('active');
+  resultSection.classList.remove('active');
+  resultContent.innerHTML = ''; // 清空内容准备流式显示
+  clearVariantTabs();
+  startLoadingAnimation();
+
+  // 填写了对比预算时走多档方案模式
+  const compareBudgets = parseCompareBudgets(compareBudgetsInput.value, data.budget);
+  if (compareBudgets.length) {
+    streamVariants(data, [data.budget, ...compareBudgets]);
+    return;
+  }
+
+  // 使用 SSE 流式输出
+  const params = new URLSearchParams({
+    budget: data.budget,
+    departure: data.departure,
+    destination: data.destination,
+    start_date: data.start_date,
+    end_date: data.end_date
+  });
+
+  const eventSource = new EventSource(`/travel-plan-stream?${params}`);
+  // 增量渲染：已完成的行只渲染一次，每帧最多更新一次 DOM
+  const streamRenderer = new IncrementalMarkdownRenderer(resultContent, {
+    onRender: () => { resultContent.scrollTop = resultContent.scrollHeight; } // 滚动到底部
+  });
+  let skeletonBreakdown = null; // 骨架阶段先到的预算分配
+
+  eventSource.onmessage = (event) => {
+    try {
+      const msg = JSON.parse(event.data);
+
+      if (msg.type === 'status') {
+        updateLoadingSteps(msg);
+      }
+      else if (msg.type === 'chunk') {
+        // 打字机效果 - 实时显示内容
+        streamRenderer.append(msg.content);
+        // 切换到结果页面显示
+        if (loadingSection.classList.contains('active')) {
+          loadingSection.classList.remove('active');
+          resultSection.classList.add('active');
+          // 最终预算解析完成前先展示骨架预算
+          if (skeletonBreakdown) renderBudgetChart(skeletonBreakdown);
+        }
+      }
+      else if (msg.type === 'done') {
+        streamRenderer.finish();
+        currentPlan = msg.content;
+      }
+      else if (msg.type === 'skeleton') {
+        if (msg.breakdown && msg.breakdown.length) skeletonBreakdown = msg.breakdown;
+      }
+      else if (msg.type === 'budget') {
+        renderBudgetChart(msg.breakdown);
+      }
+      else if (msg.type === 'saved') {
+        console.log('Plan saved with ID:', msg.plan_id);
+        if (msg.record) insertHistoryRecord(msg.record); // 插入历史记录列表
+        eventSource.close();
+      }
+      else if (msg.type === 'error') {
+        eventSource.close();
+        showStreamError('生成失败：' + msg.message);
+      }
+    } catch (err) {
+      console.error('SSE parse error:', err);
+    }
+  };
+
+  eventSource.onerror = (error) => {
+    console.error('SSE error:', error);
+    eventSource.close();
+    showStreamError('连接中断，请重试');
+  };
+});
+
+// 更新步骤进度
+function updateLoadingSteps(msg) {
+  stopLoadingAnimation();
+  for (let i = 1; i <= 5; i++) {
+    const stepEl = document.getElementById(`step-${i}`);
+    stepEl.classList.remove('active', 'done');
+    if (i < msg.step) stepEl.classList.add('done');
+    else if (i === msg.step) stepEl.classList.add('active');
+  }
+  loadingStatus.textContent = msg.message;
+}
+
+// 流式生成失败：回到表单并提示
+function showStreamError(message) {
+  stopLoadingAnimation();
+  loadingSection.classList.remove('active');
+  resultSection.classList.remove('active');
+  formSection.style.display = 'block';
+  showError(message);
+}
+
+// ========== 多档方案对比 ==========
+const MAX_VARIANTS = 4;
+
+// 解析对比预算：去重、去掉与主预算相同的值，最多 MAX_VARIANTS - 1 个
+function parseCompareBudgets(text, mainBudget) {
+  const values = text.split(/[,，\s]+/)
+    .map(v => parseInt(v, 10))
+    .filter(v => v > 0 && v !== mainBudget);
+  return [...new Set(values)].slice(0, MAX_VARIANTS - 1);
+}
+
+function clearVariantTabs() {
+  variantTabs.innerHTML = '';
+  variantTabs.classList.remove('active');
+}
+
+// 一个 SSE 连接同时接收多个档位的方案，事件按 variant 分发到各自的标签页
+function streamVariants(data, budgets) {
+  const params = new URLSearchParams({
+    budgets: budgets.join(','),
+    departure: data.departure,
+    destination: data.destination,
+    start_date: data.start_date,
+    end_date: data.end_date
+  });
+  const eventSource = new EventSource(`/travel-plan-variants-stream?${params}`);
+  const variants = [];
+  let active = 0;
+
+  function showVariant(index) {
+    active = index;
+    variants.forEach((v, i) => {
+      v.el.style.display = i === index ? '' : 'none';
+      v.tab.classList.toggle('active', i === index);
+    });
+    const v = variants[index];
+    currentPlan = v.plan;
+    currentBudget = v.budget;
+    if (v.breakdown) renderBudgetChart(v.breakdown);
+    resultContent.scrollTop = resultContent.scrollHeight;
+  }
+
+  function createVariants(list) {
+    list.forEach(item => {
+      const el = document.createElement('div');
+      el.className = 'variant-content';
+      resultContent.appendChild(el);
+
+      const tab = document.createElement('button');
+      tab.type = 'button';
+      tab.className = 'variant-tab';
+      tab.textContent = `${item.label} · ${item.budget.toLocaleString()} 元`;
+      tab.addEventListener('click', () => showVariant(item.variant));
+      variantTabs.appendChild(tab);
+
+      variants[item.variant] = {
+        budget: item.budget,
+        el,
+        tab,
+        plan: '',
+        breakdown: null,
+        renderer: new IncrementalMarkdownRenderer(el, {
+          onRender: () => {
+            if (active === item.variant) resultContent.scrollTop = resultContent.scrollHeight;
+          }
+        })
+      };
+    });
+    variantTabs.classList.add('active');
+    showVariant(0);
+  }
+
+  eventSource.onmessage = (event) => {
+    try {
+      const msg = JSON.parse(event.data);
+      const v = msg.variant !== undefined ? variants[msg.variant] : null;
+
+      if (msg.type === 'variants') {
+        createVariants(msg.variants);
+      }
+      else if (msg.type === 'status') {
+        updateLoadingSteps(msg);
+      }
+      else if (msg.type === 'skeleton' && v) {
+        // 最终预算解析完成前先展示骨架预算
+        if (msg.breakdown && msg.breakdown.length) {
+          v.breakdown = msg.breakdown;
+          if (msg.variant === active && resultSection.classList.contains('active')) renderBudgetChart(v.breakdown);
+        }
+      }
+      else if (msg.type === 'chunk' && v) {
+        v.renderer.append(msg.content);
+        if (loadingSection.classList.contains('active')) {
+          loadingSection.classList.remove('active');
+          resultSection.classList.add('active');
+          showVariant(active);
+        }
+      }
+      else if (msg.type === 'done' && v) {
+        v.renderer.finish();
+        v.plan = msg.content;
+        if (msg.variant === active) currentPlan = v.plan;
+      }
+      else if (msg.type === 'budget' && v) {
+        v.breakdown = msg.breakdown;
+        if (msg.variant === active) renderBudgetChart(v.breakdown);
+      }
+      else if (msg.type === 'saved' && v) {
+        console.log(`Variant ${msg.variant} saved with ID:`, msg.plan_id);
+        if (msg.record) insertHistoryRecord(msg.record);
+      }
+      else if (msg.type === 'error' && v) {
+        // 单个档位失败不影响其它档位
+        v.tab.classList.add('failed');
+        v.renderer.append(`\n\n⚠️ 该档位生成失败：${msg.message}`);
+        v.renderer.finish();
+      }
+      else if (msg.type === 'error') {
+        eventSource.close();
+        clearVariantTabs();
+        showStreamError('生成失败：' + msg.message);
+      }
+      else if (msg.type === 'variants_done') {
+        eventSource.close();
+        if (loadingSection.classList.contains('active')) {
+          // 所有档位都在输出正文前失败
+          loadingSection.classList.remove('active');
+          resultSection.classList.add('active');
+          stopLoadingAnimation();
+        }
+      }
+    } catch (err) {
+      console.error('SSE parse error:', err);
+    }
+  };
+
+  eventSource.onerror = (error) => {
+    console.error('SSE error:', error);
+    eventSource.close();
+    clearVariantTabs();
+    showStreamError('连接中断，请重试');
+  };
+}
+
+// 前端预算分解（备用）
+function extract_budget_breakdown(totalBudget) {
+  return [
+    { category: "🚗 交通", amount: Math.round(totalBudget * 0.30), color: "#6366f1" },
+    { category: "🏨 住宿", amount: Math.round(totalBudget * 0.35), color: "#8b5cf6" },
+    { category: "🍜 餐饮", amount: Math.round(totalBudget * 0.15), color: "#f472b6" },
+    { category: "🎫 门票", amount: Math.round(totalBudget * 0.12), color: "#22d3ee" },
+    { category: "🛍️ 其他", amount: Math.round(totalBudget * 0.08), color: "#fbbf24" }
+  ];
+}
+
+// 重新规划
+newPlanBtn.addEventListener('click', () => {
+  resultSection.classList.remove('active');
+  formSection.style.display = 'block';
+  clearVariantTabs();
+  if (budgetChart) {
+    budgetChart.destroy();
+    budgetChart = null;
+  }
+});
+
+// ========== 历史记录功能 ==========
+const historySidebar = document.getElementById('history-sidebar');
+const historyList = document.getElementById('history-list');
+const historyToggleBtn = document.getElementById('history-toggle-btn');
+const sidebarClose = document.getElementById('sidebar-close');
+const sidebarOverlay = document.getElementById('sidebar-overlay');
+
+historyToggleBtn.addEventListener('click', () => {
+  historySidebar.classList.add('open');
+  sidebarOverlay.classList.add('active');
+  loadHistory();
+});
+
+sidebarClose.addEventListener('click', closeHistorySidebar);
+sidebarOverlay.addEventListener('click', closeHistorySidebar);
+
+function closeHistorySidebar() {
+  historySidebar.classList.remove('open');
+  sidebarOverlay.classList.remove('active');
+}
+
+// 虚拟列表：只渲染可见范围内的行，滚动到底部附近时按游标加载下一页
+const HISTORY_PAGE_SIZE = 30;
+const HISTORY_OVERSCAN = 5; // 可见范围上下额外渲染的行数
+const historyState = {
+  records: [],       // 已加载的记录摘要（id 倒序）
+  nextCursor: null,  // 下一页游标，null 表示没有更多
+  loading: false,
+  generation: 0,     // 每次重新加载递增，丢弃过期的分页响应
+  rowHeight: 0,      // 行高（含间距），首次渲染时测量
+  range: null,       // 当前已渲染的 [first, last)
+  frameId: null
+};
+const historyWindow = document.createElement('div');
+historyWindow.className = 'history-window';
+
+function historyItemHtml(record, index) {
+  return `
+    <div class="history-item" data-id="${record.id}" style="top: ${index * historyState.rowHeight}px">
+      <div class="history-info">
+        <span class="history-dest">📍 ${record.destination}</span>
+        <span class="history-date">${record.start_date} ~ ${record.end_date}</span>
+        <span class="history-budget">💰 ${record.budget.toLocaleString()} 元</span>
+      </div>
+      <div class="history-actions">
+        <button class="btn-load" onclick="loadPlan(${record.id})">查看</button>
+        <button class="btn-delete" onclick="deletePlan(${record.id})">删除</button>
+      </div>
+    </div>
+  `;
+}
+
+function measureHistoryRow() {
+  historyWindow.innerHTML = historyItemHtml(historyState.records[0], 0);
+  const item = historyWindow.firstElementChild;
+  historyState.rowHeight = item.offsetHeight + parseFloat(getComputedStyle(item).marginBottom);
+}
+
+// 数据变化时调用：重置已渲染范围并按当前滚动位置重绘
+function renderHistory() {
+  const { records } = historyState;
+  historyState.range = null;
+  if (!records.length) {
+    historyList.innerHTML = historyState.loading ? '' : '<p class="history-empty">暂无历史记录</p>';
+    return;
+  }
+  if (historyWindow.parentNode !== historyList) {
+    historyList.innerHTML = '';
+    historyList.appendChild(historyWindow);
+  }
+  if (!historyState.rowHeight) measureHistoryRow();
+  historyWindow.style.height = `${records.length * historyState.rowHeight}px`;
+  renderHistoryWindow();
+}
+
+function renderHistoryWindow() {
+  const { records, rowHeight } = historyState;
+  if (!records.length || !rowHeight) return;
+
+  const visibleTop = Math.max(0, historySidebar.scrollTop - historyWindow.offsetTop);
+  const first = Math.max(0, Math.floor(visibleTop / rowHeight) - HISTORY_OVERSCAN);
+  const last = Math.min(records.length,
+    Math.ceil((visibleTop + historySidebar.clientHeight) / rowHeight) + HISTORY_OVERSCAN);
+
+  const range = historyState.range;
+  if (!range || range[0] !== first || range[1] !== last) {
+    historyState.range = [first, last];
+    historyWindow.innerHTML = records.slice(first, last)
+      .map((record, i) => historyItemHtml(record, first + i)).join('');
+  }
+
+  // 接近底部时加载下一页
+  if (last >= records.length - HISTORY_OVERSCAN && historyState.nextCursor !== null) {
+    loadHistoryPage();
+  }
+}
+
+historySidebar.addEventListener('scroll', () => {
+  if (historyState.frameId !== null) return;
+  historyState.frameId = requestAnimationFrame(() => {
+    historyState.frameId = null;
+    renderHistoryWindow();
+  });
+}, { passive: true });
+
+async function loadHistoryPage() {
+  if (historyState.loading) return;
+  historyState.loading = true;
+  const generation = historyState.generation;
+  try {
+    const params = new URLSearchParams({ limit: HISTORY_PAGE_SIZE, include_plan: false });
+    if (historyState.nextCursor !== null) params.set('cursor', historyState.nextCursor);
+    const response = await fetch(`/history?${params}`);
+    const result = await response.json();
+    if (generation !== historyState.generation) return;
+
+    if (result.success) {
+      // 分页期间新保存的记录已插入到顶部，按 id 去重
+      const known = new Set(historyState.records.map(r => r.id));
+      historyState.records.push(...result.history.filter(r => !known.has(r.id)));
+      historyState.nextCursor = result.next_cursor;
+    } else {
+      historyState.nextCursor = null;
+    }
+  } catch (error) {
+    console.error('加载历史记录失败:', error);
+    historyState.nextCursor = null;
+  } finally {
+    if (generation === historyState.generation) {
+      historyState.loading = false;
+      renderHistory();
+    }
+  }
+}
+
+// 打开侧边栏时从第一页重新加载
+function loadHistory() {
+  historyState.generation += 1;
+  historyState.records = [];
+  historyState.nextCursor = null;
+  historyState.loading = false;
+  historySidebar.scrollTop = 0;
+  loadHistoryPage();
+}
+
+// 新保存的规划直接插入列表顶部
+function insertHistoryRecord(record) {
+  if (historyState.records.some(r => r.id === record.id)) return;
+  historyState.records.unshift(record);
+  renderHistory();
+}
+
+function removeHistoryRecord(planId) {
+  historyState.records = historyState.records.filter(r => r.id !== planId);
+  renderHistory();
+}
+
+// 全局函数：加载历史方案
+window.loadPlan = async function (planId) {
+  try {
+    const response = await fetch(`/history/${planId}`);
+    const result = await response.json();
+
+    if (result.success) {
+      const record = result.record;
+      currentPlan = record.plan_content;
+      currentBudget = record.budget;
+      currentDestination = record.destination;
+
+      clearVariantTabs();
+      resultContent.innerHTML = formatMarkdown(record.plan_content);
+      renderBudgetChart(extract_budget_breakdown(record.budget));
+
+      formSection.style.display = 'none';
+      loadingSection.classList.remove('active');
+      resultSection.classList.add('active');
+      closeHistorySidebar();
+    }
+  } catch (error) {
+    console.error('加载方案失败:', error);
+  }
+};
+
+// 全局函数：删除方案
+window.deletePlan = async function (planId) {
+  console.log('删除方案 ID:', planId);
+
+  if (!window.confirm('确定要删除这条记录吗？')) {
+    console.log('用户取消删除');
+    return;
+  }
+
+  try {
+    console.log('发送删除请求...');
+    const response = await fetch(`/history/${planId}`, {
+      method: 'DELETE',
+      headers: { 'Content-Type': 'application/json' }
+    });
+
+    console.log('响应状态:', response.status);
+    const result = await response.json();
+    console.log('删除结果:', result);
+
+    if (result.success) {
+      alert('删除成功！');
+      removeHistoryRecord(planId); // 从列表中移除
+    } else {
+      alert('删除失败: ' + (result.message || '未知错误'));
+    }
+  } catch (error) {
+    console.error('删除失败:', error);
+    alert('删除请求失败: ' + error.message);
+  }
+};
+
+// AI 对话修改
+chatSendBtn.addEventListener('click', sendChatModify);
+chatInput.addEventListener('keypress', (e) => {
+  if (e.key === 'Enter') sendChatModify();
+});
+
+async function sendChatModify() {
+  const message = chatInput.value.trim();
+  if (!message) return;
+
+  chatInput.disabled = true;
+  chatSendBtn.disabled = true;
+  chatLoading.classList.add('active');
+
+  try {
+    const response = await fetch('/chat-modify', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        current_plan: currentPlan,
+        user_message: message,
+        budget: currentBudget,
+        destination: currentDestination
+      })
+    });
+
+    const result = await response.json();
+
+    if (result.success) {
+      currentPlan = result.modified_plan;
+      clearVariantTabs(); // 修改后只展示当前方案
+      resultContent.innerHTML = formatMarkdown(result.modified_plan);
+      renderBudgetChart(result.budget_breakdown);
+      chatInput.value = '';
+    } else {
+      alert('修改失败：' + (result.message || '请重试'));
+    }
+  } catch (error) {
+    alert('请求失败：' + error.message);
+  } finally {
+    chatInput.disabled = false;
+    chatSendBtn.disabled = false;
+    chatLoading.classList.remove('active');
+  }
+}
+
+// 渲染预算饼图
+function renderBudgetChart(breakdown) {
+  const ctx = document.getElementById('budget-chart').getContext('2d');
+
+  if (budgetChart) {
+    budgetChart.destroy();
+  }
+
+  const labels = breakdown.map(b => b.category);
+  const data = breakdown.map(b => b.amount);
+  const colors = breakdown.map(b => b.color);
+
+  budgetChart = new Chart(ctx, {
+    type: 'doughnut',
+    data: {
+      labels: labels,
+      datasets: [{
+        data: data,
+        backgroundColor: colors,
+        borderColor: 'rgba(255, 255, 255, 0.1)',
+        borderWidth: 2,
+        hoverOffset: 10
+      }]
+    },
+    options: {
+      responsive: true,
+      maintainAspectRatio: false,
+      cutout: '65%',
+      plugins: {
+        legend: { display: false },
+        tooltip: {
+          backgroundColor: 'rgba(0, 0, 0, 0.8)',
+          titleColor: '#fff',
+          bodyColor: '#fff',
+          padding: 12,
+          displayColors: true,
+          callbacks: {
+            label: (ctx) => ` ${ctx.parsed.toLocaleString()} 元`
+          }
+        }
+      },
+      animation: {
+        animateRotate: true,
+        animateScale: true
+      }
+    }
+  });
+
+  // 渲染图例
+  const legendContainer = document.getElementById('chart-legend');
+  legendContainer.innerHTML = breakdown.map(b => `
+    <div class="legend-item">
+      <span class="legend-color" style="background: ${b.color}"></span>
+      <span class="legend-label">${b.category}</span>
+      <span class="legend-value">${b.amount.toLocaleString()}元</span>
+    </div>
+  `).join('');
+}
+
+// 显示错误
+function showError(message) {
+  errorMessage.textContent = '❌ ' + message;
+  errorMessage.classList.add('active');
+}
@@ -0,0 +1,197 @@
+/**
+ * Markdown 渲染
+ * - formatMarkdown(text): 一次性渲染整段文本（历史记录、对话修改）
+ * - IncrementalMarkdownRenderer: 流式渲染，已完成的行只渲染一次并追加，
+ *   只有末尾未完成的块每帧重新渲染，DOM 更新按 requestAnimationFrame 合并
+ */
+
+// 分隔行 (|---|---|)
+const TABLE_SEPARATOR = /^\|[\s:-]+\|$/;
+
+// 检测表格行（以 | 开头和结尾）
+function isTableRow(line) {
+  return line.startsWith('|') && line.endsWith('|');
+}
+
+// 单行格式：标题、粗体、列表项
+function formatLine(line) {
+  return line
+    .replace(/^### (.+)$/, '<h3>$1</h3>')
+    .replace(/^## (.+)$/, '<h2>$1</h2>')
+    .replace(/^# (.+)$/, '<h1>$1</h1>')
+    .replace(/\*\*(.+?)\*\*/g, '<strong>$1</strong>')
+    .replace(/^- (.+)$/, '<div class="list-item">$1</div>');
+}
+
+function formatMarkdown(text) {
+  // 先处理表格，再逐行格式化，行之间换行
+  return formatTables(text).split('\n').map(formatLine).join('<br>');
+}
+
+// 表格转 HTML
+function formatTables(text) {
+  const lines = text.split('\n');
+  let result = [];
+  let inTable = false;
+  let tableRows = [];
+
+  for (let i = 0; i < lines.length; i++) {
+    const line = lines[i].trim();
+
+    if (isTableRow(line)) {
+      // 跳过分隔行
+      if (TABLE_SEPARATOR.test(line)) {
+        continue;
+      }
+
+      if (!inTable) {
+        inTable = true;
+        tableRows = [];
+      }
+
+      // 解析单元格
+      tableRows.push(parseTableRow(line));
+    } else {
+      // 结束表格
+      if (inTable) {
+        result.push(renderTable(tableRows));
+        inTable = false;
+        tableRows = [];
+      }
+      result.push(line);
+    }
+  }
+
+  // 处理末尾的表格
+  if (inTable) {
+    result.push(renderTable(tableRows));
+  }
+
+  return result.join('\n');
+}
+
+function parseTableRow(line) {
+  return line.slice(1, -1).split('|').map(c => c.trim());
+}
+
+// 渲染表格为美观的卡片
+function renderTable(rows) {
+  if (rows.length === 0) return '';
+
+  let html = '<div class="styled-table">';
+
+  rows.forEach((row, index) => {
+    const isHeader = index === 0;
+    html += `<div class="table-row ${isHeader ? 'header-row' : ''}">`;
+    row.forEach(cell => {
+      html += `<div class="table-cell">${cell}</div>`;
+    });
+    html += '</div>';
+  });
+
+  html += '</div>';
+  return html;
+}
+
+/**
+ * 增量 Markdown 渲染器
+ *
+ * 输出与 formatMarkdown(全部文本) 一致：
+ * 完整的行（遇到换行）渲染一次后插入到末尾块之前；连续的表格行在表格结束后整体提交；
+ * 末尾未完成的行（以及尚未结束的表格）放在 tail 元素中，每帧最多重绘一次。
+ */
+class IncrementalMarkdownRenderer {
+  constructor(container, options = {}) {
+    this.container = container;
+    this.onRender = options.onRender || null; // 每次实际渲染后回调 (耗时 ms)
+    this.reset();
+  }
+
+  reset() {
+    this.text = '';
+    this.pending = '';       // 尚未处理的新文本
+    this.openLine = '';      // 末尾未完成的行
+    this.tableRows = [];     // 尚未结束的表格
+    this.hasOutput = false;  // 是否已提交过内容（决定是否需要前置 <br>）
+    this.frame = 0;
+    if (this.frameId) cancelAnimationFrame(this.frameId);
+    this.frameId = null;
+    this.container.innerHTML = '';
+    this.tail = document.createElement('div');
+    this.tail.style.display = 'contents';
+    this.container.appendChild(this.tail);
+  }
+
+  append(chunk) {
+    this.text += chunk;
+    this.pending += chunk;
+    if (this.frameId === null) {
+      this.frameId = requestAnimationFrame(() => this.flush());
+    }
+  }
+
+  // 流结束：提交所有剩余内容
+  finish() {
+    this.flush(true);
+  }
+
+  _commit(html) {
+    this.tail.insertAdjacentHTML('beforebegin', (this.hasOutput ? '<br>' : '') + html);
+    this.hasOutput = true;
+  }
+
+  _commitTable() {
+    if (this.tableRows.length) {
+      this._commit(formatLine(renderTable(this.tableRows)));
+      this.tableRows = [];
+    }
+  }
+
+  // 处理一个完整的行
+  _completeLine(raw) {
+    const line = raw.trim();
+    if (isTableRow(line)) {
+      if (!TABLE_SEPARATOR.test(line)) this.tableRows.push(parseTableRow(line));
+      return;
+    }
+    this._commitTable();
+    this._commit(formatLine(line));
+  }
+
+  flush(final = false) {
+    if (this.frameId !== null) {
+      cancelAnimationFrame(this.frameId);
+      this.frameId = null;
+    }
+    const started = performance.now();
+
+    if (this.pending) {
+      const parts = (this.openLine + this.pending).split('\n');
+      this.pending = '';
+      this.openLine = parts.pop();
+      parts.forEach(line => this._completeLine(line));
+    }
+
+    if (final) {
+      // 与 formatMarkdown 相同：末尾的行（即使为空）也算一行
+      this._completeLine(this.openLine);
+      this._commitTable();
+      this.openLine = '';
+      this.tail.innerHTML = '';
+    } else {
+      // 末尾块：未结束的表格 + 未完成的行
+      const open = this.openLine.trim();
+      const openIsTableRow = isTableRow(open);
+      const rows = openIsTableRow && !TABLE_SEPARATOR.test(open)
+        ? this.tableRows.concat([parseTableRow(open)])
+        : this.tableRows;
+      const blocks = [];
+      if (rows.length) blocks.push(formatLine(renderTable(rows)));
+      if (!openIsTableRow) blocks.push(formatLine(open));
+      this.tail.innerHTML = blocks.length ? (this.hasOutput ? '<br>' : '') + blocks.join('<br>') : '';
+    }
+
+    this.frame += 1;
+    if (this.onRender) this.onRender(performance.now() - started);
+  }
+}
@@ -0,0 +1,181 @@
+"""
+增量 JSON 解析模块
+在 LLM 流式输出上逐块解析 JSON：顶层字段一闭合就产出，
+并能修复被截断的输出（未闭合的字符串 / 对象 / 数组）。
+"""
+import json
+import re
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+# 修复截断输出时依次尝试去掉的尾部片段
+_TRAILING_GARBAGE = [
+    re.compile(r"[,\s]+$"),  # 尾随逗号 / 空白
+    re.compile(r'"(?:[^"\\]|\\.)*"\s*:\s*[^,{}\[\]"]*$'),  # 只有键或键后是不完整的字面量
+    re.compile(r'"(?:[^"\\]|\\.)*"\s*$'),  # 对象中孤立的键
+    re.compile(r"[^,{}\[\]\s\"]+$"),  # 不完整的 true / false / null / 数字
+]
+
+
+class IncrementalJSONParser:
+    """
+    增量 JSON 对象解析器
+
+    用法:
+        parser = IncrementalJSONParser()
+        for chunk in stream:
+            for key, value in parser.feed(chunk):
+                ...  # 顶层字段闭合
+        data = parser.snapshot()  # 已闭合字段 + 修复后的未完成部分
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self.complete = False  # 顶层对象是否已闭合
+        self._buf: List[str] = []  # 从第一个 '{' 开始的文本
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member: List[str] = []  # 当前顶层成员的原始文本
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """喂入一段文本，返回本次闭合的顶层字段 [(key, value)]"""
+        closed = []
+        for ch in text:
+            if self.complete:
+                break
+            if not self._started:
+                # 跳过 ```json 之类的前缀
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                    self._buf.append(ch)
+                continue
+
+            self._buf.append(ch)
+            if self._in_string:
+                self._member.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+
+            if self._depth == 1 and ch == ",":
+                closed.extend(self._close_member())
+            elif self._depth == 0:
+                closed.extend(self._close_member())
+                self.complete = True
+            else:
+                self._member.append(ch)
+        return closed
+
+    def _close_member(self) -> List[Tuple[str, Any]]:
+        raw = "".join(self._member).strip()
+        self._member = []
+        if not raw:
+            return []
+        try:
+            member = json.loads("{" + raw + "}")
+        except json.JSONDecodeError:
+            return []
+        self.fields.update(member)
+        return list(member.items())
+
+    @property
+    def text(self) -> str:
+        """已消费的 JSON 文本（从第一个 '{' 开始）"""
+        return "".join(self._buf)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前可得的对象：完整时直接解析，截断时尽量修复"""
+        if not self._started:
+            return {}
+        repaired = repair_json(self.text)
+        if isinstance(repaired, dict):
+            return repaired
+        return dict(self.fields)
+
+
+def repair_json(text: str) -> Optional[Any]:
+    """修复被截断的 JSON 文本（补全字符串和括号，去掉不完整的尾部），失败返回 None"""
+    stack = []
+    in_string = escape = False
+    for ch in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+        elif ch in "}]" and stack:
+            stack.pop()
+
+    candidate = text + ('"' if in_string else "")
+    closers = "".join("}" if c == "{" else "]" for c in reversed(stack))
+    if stack and not in_string:
+        # 截断时末尾的数字 / 字面量无法确认是否完整（"15" 可能是 "1500" 的前缀），一律丢弃
+        candidate = _TRAILING_GARBAGE[3].sub("", candidate)
+    attempts = [candidate]
+    for pattern in _TRAILING_GARBAGE:
+        candidate = pattern.sub("", candidate)
+        attempts.append(_TRAILING_GARBAGE[0].sub("", candidate))
+    for attempt in attempts:
+        try:
+            return json.loads(attempt + closers)
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def extract_json(text: str) -> Optional[Dict[str, Any]]:
+    """从 LLM 输出中提取第一个 JSON 对象（支持嵌套，截断时尝试修复）"""
+    parser = IncrementalJSONParser()
+    parser.feed(text)
+    if not parser.text:
+        return None
+    data = parser.snapshot()
+    return data or None
+
+
+async def consume_json_stream(
+    chunks: AsyncIterator[str],
+    required: Iterable[str] = (),
+    on_field: Optional[Callable[[str, Any], Awaitable[None]]] = None
+) -> Dict[str, Any]:
+    """
+    消费 LLM 流式输出并增量解析 JSON
+
+    Args:
+        chunks: 文本块异步迭代器（例如 resilience.astream）
+        required: 必需字段；全部闭合后立即停止读取（取消剩余生成）
+        on_field: 每个顶层字段闭合时的回调
+
+    Returns:
+        解析得到的对象（截断时为修复后的结果）
+    """
+    required = set(required)
+    parser = IncrementalJSONParser()
+    async with aclosing(chunks):
+        async for chunk in chunks:
+            for key, value in parser.feed(chunk):
+                if on_field:
+                    await on_field(key, value)
+            if parser.complete or (required and required.issubset(parser.fields)):
+                break
+    return parser.snapshot()
@@ -0,0 +1,42 @@
+"""
+测试公共配置
+- 在导入应用模块之前设置环境变量（不访问真实 LLM / 网页搜索，不启动后台刷新）
+- 数据库路径是相对路径 travel_history.db，db 夹具切换到临时目录后初始化，每个测试一份全新的库
+"""
+import asyncio
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("OPENAI_API_BASE", "http://127.0.0.1:9/v1")
+os.environ.setdefault("KB_REFRESH_ENABLED", "0")
+os.environ.setdefault("SEARCH_BACKEND", "local")
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """切换到临时目录（数据库、索引等相对路径都落在这里）"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def db(workdir):
+    """初始化一份全新的数据库"""
+    from database import init_db
+
+    asyncio.run(init_db())
+    return workdir / "travel_history.db"
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    """示例语料的副本（索引会写到语料目录下，不能直接用仓库里的文件）"""
+    target = tmp_path / "corpus"
+    shutil.copytree(FIXTURES / "corpus", target)
+    return target
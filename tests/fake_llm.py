@@ -0,0 +1,79 @@
+"""
+进程内的假 LLM（替换 apiset.llm），按脚本逐次返回结果、延迟或抛出异常
+
+    fake = install_fake_llm(monkeypatch, Step(delay=1), Step(content="ok"))
+    # 第一次调用等待 1 秒，第二次立即返回 "ok"，之后的调用使用 default
+"""
+import asyncio
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Optional, Sequence
+
+import apiset
+import resilience
+from load_control import LoadController
+
+
+@dataclass
+class Step:
+    content: str = "ok"
+    delay: float = 0.0  # 返回前（流式调用为首块之前）的等待
+    error: Optional[Exception] = None
+    chunks: Optional[Sequence[str]] = None  # 流式调用的分块，默认整段作为一块
+    chunk_delay: float = 0.0
+
+
+class FakeLLM:
+    def __init__(self, *steps: Step, default: Step = Step()):
+        self.steps = list(steps)
+        self.default = default
+        self.calls = 0
+        self.prompts = []
+        self.active = 0  # 尚未结束的调用数
+        self.cancelled = 0
+
+    def _next(self, prompt) -> Step:
+        self.calls += 1
+        self.prompts.append(prompt)
+        return self.steps.pop(0) if self.steps else self.default
+
+    async def ainvoke(self, prompt, timeout=None):
+        step = self._next(prompt)
+        self.active += 1
+        try:
+            await asyncio.sleep(step.delay)
+            if step.error:
+                raise step.error
+            return SimpleNamespace(content=step.content)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.active -= 1
+
+    async def astream(self, prompt, timeout=None):
+        step = self._next(prompt)
+        self.active += 1
+        try:
+            await asyncio.sleep(step.delay)
+            if step.error:
+                raise step.error
+            for chunk in step.chunks or [step.content]:
+                yield SimpleNamespace(content=chunk)
+                await asyncio.sleep(step.chunk_delay)
+        except (asyncio.CancelledError, GeneratorExit):
+            self.cancelled += 1
+            raise
+        finally:
+            self.active -= 1
+
+
+def install_fake_llm(monkeypatch, *steps: Step, failure_threshold: int = 3,
+                     reset_timeout: float = 0.2, concurrency: int = 4) -> FakeLLM:
+    """替换 LLM，并为本次测试准备全新的熔断器、并发名额和负载控制器"""
+    fake = FakeLLM(*steps)
+    monkeypatch.setattr(apiset, "llm", fake)
+    monkeypatch.setattr(resilience, "breaker", resilience.CircuitBreaker(failure_threshold, reset_timeout))
+    monkeypatch.setattr(resilience, "_llm_slots", asyncio.Semaphore(concurrency))
+    monkeypatch.setattr(resilience, "load_controller", LoadController())
+    return fake
@@ -0,0 +1,57 @@
+import asyncio
+
+import aiosqlite
+
+import analytics
+from database import delete_plan, get_analytics, save_plan
+
+
+async def counts(db_path):
+    async with aiosqlite.connect(db_path) as conn:
+        cursor = await conn.execute("SELECT dimension, key, plan_count, budget_sum FROM analytics_counts")
+        return sorted(await cursor.fetchall(), key=repr)
+
+
+async def rebuilt(db_path):
+    """全量重建后的结果（回滚，不影响数据库）"""
+    async with aiosqlite.connect(db_path) as conn:
+        await analytics.rebuild(conn)
+        cursor = await conn.execute("SELECT dimension, key, plan_count, budget_sum FROM analytics_counts")
+        rows = sorted(await cursor.fetchall(), key=repr)
+        await conn.rollback()
+    return rows
+
+
+def test_triggers_match_full_rebuild_after_insert_update_delete(db):
+    async def run():
+        ids = [
+            await save_plan("成都", 2500, "2026-05-01", "2026-05-03", "# a"),
+            await save_plan("成都", 6000, "2026-05-01", "2026-05-05", "# b"),
+            await save_plan("北京", 800, "2026-05-01", "bad-date", "# c"),
+            await save_plan("西安", 60000, "2026-05-01", "2026-07-30", "# d"),
+        ]
+        async with aiosqlite.connect(db) as conn:
+            await conn.execute("UPDATE travel_history SET destination = '重庆', budget = 3000 WHERE id = ?", (ids[1],))
+            await conn.execute("UPDATE travel_history SET plan_content = '' WHERE id = ?", (ids[0],))  # 不影响统计
+            await conn.commit()
+        await delete_plan(ids[3])
+        return await counts(db), await rebuilt(db), await get_analytics(top=5, days=1)
+
+    incremental, full, summary = asyncio.run(run())
+    assert incremental == full
+    assert summary["total_plans"] == 3 and summary["avg_budget"] == round((2500 + 3000 + 800) / 3)
+    assert {d["destination"]: d["plan_count"] for d in summary["top_destinations"]} == {"成都": 1, "重庆": 1, "北京": 1}
+    assert {b["min"]: b["plan_count"] for b in summary["budget_distribution"]}[1000] == 1
+    assert {d["days"]: d["plan_count"] for d in summary["trip_days"]} == {0: 1, 3: 1, 5: 1}
+    assert summary["daily_volume"][-1]["plan_count"] == 3
+
+
+def test_deleting_last_plan_removes_the_key(db):
+    async def run():
+        plan_id = await save_plan("拉萨", 9000, "2026-05-01", "2026-05-03", "# a")
+        await delete_plan(plan_id)
+        return await counts(db)
+
+    rows = asyncio.run(run())
+    assert [r for r in rows if r[0] != "total"] == []
+    assert [r for r in rows if r[0] == "total"] == [("total", "", 0, 0)]
@@ -0,0 +1,73 @@
+import os
+import time
+
+import pytest
+from starlette.requests import Request
+
+from assets import AssetBundle, IMMUTABLE, REVALIDATE, negotiate
+
+
+def request(**headers) -> Request:
+    raw = [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+@pytest.fixture
+def static(tmp_path):
+    (tmp_path / "index.html").write_text(
+        '<link rel="stylesheet" href="/static/style.css"><script src="/static/app.js"></script>'
+        '<img src="/static/logo.svg">', encoding="utf-8")
+    (tmp_path / "style.css").write_text("body { color: #333; }\n" * 40, encoding="utf-8")
+    (tmp_path / "app.js").write_text("console.log('app');\n", encoding="utf-8")
+    (tmp_path / "bench.html").write_text("<p>bench</p>", encoding="utf-8")
+    return tmp_path
+
+
+def test_negotiate():
+    assert negotiate("gzip, br", {"identity", "gzip", "br"}) == "br"
+    assert negotiate("gzip, br;q=0", {"identity", "gzip", "br"}) == "gzip"
+    assert negotiate("br", {"identity", "gzip"}) == "identity"
+    assert negotiate("", {"identity", "gzip"}) == "identity"
+
+
+def test_shell_references_fingerprinted_assets_and_revalidates(static):
+    bundle = AssetBundle(str(static))
+    shell = bundle.shell_response(request(accept_encoding="identity"))
+    html = shell.body.decode()
+    css = bundle.manifest["style.css"]
+    assert f'href="/assets/{css}"' in html and 'src="/static/logo.svg"' in html
+    assert shell.headers["cache-control"] == REVALIDATE
+
+    asset = bundle.asset_response(css, request(accept_encoding="gzip"))
+    assert asset.headers["content-encoding"] == "gzip" and asset.headers["cache-control"] == IMMUTABLE
+    not_modified = bundle.asset_response(css, request(accept_encoding="gzip", if_none_match=asset.headers["etag"]))
+    assert not_modified.status_code == 304
+
+
+def test_shell_does_not_stat_sources_unless_reload_enabled(static):
+    bundle = AssetBundle(str(static), reload=False)
+    before = bundle.shell_response(request()).headers["etag"]
+    (static / "app.js").write_text("console.log('changed');\n", encoding="utf-8")
+    os.utime(static / "app.js", (time.time() + 5, time.time() + 5))
+    assert bundle.shell_response(request()).headers["etag"] == before
+
+    dev = AssetBundle(str(static), reload=True, reload_interval=0)
+    dev.shell_response(request())
+    old = dev.manifest["app.js"]
+    (static / "app.js").write_text("console.log('changed again');\n", encoding="utf-8")
+    os.utime(static / "app.js", (time.time() + 10, time.time() + 10))
+    dev.shell_response(request())
+    assert dev.manifest["app.js"] != old
+
+
+def test_legacy_static_urls(static):
+    bundle = AssetBundle(str(static))
+    redirect = bundle.static_response("style.css", request())
+    assert redirect.status_code == 301
+    assert redirect.headers["location"] == "/assets/" + bundle.manifest["style.css"]
+    assert bundle.static_response("index.html", request()).headers["location"] == "/"
+
+    other = bundle.static_response("bench.html", request())
+    assert other.body == b"<p>bench</p>" and other.headers["cache-control"] == REVALIDATE
+    assert bundle.static_response("..", request()).status_code == 404
+    assert bundle.static_response("missing.js", request()).status_code == 404
@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+import pytest
+
+import batch
+from load_control import load_controller
+
+
+def row(destination, budget=3000):
+    return json.dumps({"departure": "上海", "destination": destination, "start_date": "2026-11-01",
+                       "end_date": "2026-11-03", "budget": budget}, ensure_ascii=False)
+
+
+async def collect(gen):
+    return [item async for item in gen]
+
+
+async def chunked(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+@pytest.fixture
+def planner(monkeypatch):
+    """替换 plan_travel：记录调用，目的地为「失败」时抛出异常"""
+    calls = []
+
+    async def plan_travel(budget, destination, start_date, end_date, departure, request_id):
+        calls.append((destination, load_controller.in_flight))
+        await asyncio.sleep(0)
+        if destination == "失败":
+            raise RuntimeError("upstream 502")
+        return f"# {destination} 方案"
+
+    monkeypatch.setattr(batch, "plan_travel", plan_travel)
+    return calls
+
+
+def test_iter_lines_keeps_multibyte_chars_split_across_chunks():
+    data = f"{row('成都')}\n\n{row('北京')}".encode("utf-8")
+    lines = asyncio.run(collect(batch.iter_lines(chunked(data, 5))))
+    assert lines == [row("成都"), "", row("北京")]
+
+
+def test_aparse_jsonl_matches_sync_parser():
+    text = "\n".join([row("成都"), "not json", row(" 成都 "), row("北京")])
+    expected = batch.parse_jsonl(text.splitlines())
+    rows, events = asyncio.run(batch.aparse_jsonl(batch.iter_lines(chunked(text.encode("utf-8"), 7))))
+    assert (rows, events) == expected
+    assert [req.destination for _, req in rows] == ["成都", "北京"]
+    assert [(e["line"], e["status"]) for e in events] == [(2, "invalid"), (3, "duplicate")]
+
+
+def test_batch_resumes_and_stays_out_of_online_load(db, planner):
+    lines = [row("成都"), row("失败"), row("北京")]
+    first = asyncio.run(collect(batch.run_batch(lines, workers=2)))
+    assert first[-1]["done"] == 2 and first[-1]["failed"] == 1
+    assert all(in_flight == 0 for _, in_flight in planner)  # 批量任务不计入在线排队深度
+
+    planner.clear()
+    second = asyncio.run(collect(batch.run_batch(lines, workers=2)))
+    assert second[0] == {"type": "start", "batch_id": first[0]["batch_id"], "total": 3, "resumed": 2}
+    resumed = {e["destination"]: e["plan"] for e in second if e.get("status") == "resumed"}
+    assert resumed == {"成都": "# 成都 方案", "北京": "# 北京 方案"}
+    assert [destination for destination, _ in planner] == ["失败"]  # 只重跑失败的行
@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+import aiosqlite
+import pytest
+
+import main
+import resilience
+import travel_agent
+from fake_llm import Step, install_fake_llm
+from schemas import TravelRequest
+
+TRIP = dict(budget=3000, destination="成都", start_date="2026-05-01", end_date="2026-05-03", departure="上海")
+# 完整流程的 LLM 调用顺序：调研、草稿、预算审核、定稿、内容审核
+FULL_RUN = [Step(content="调研"), Step(content="草稿"), Step(content="approved"),
+            Step(content="终稿"), Step(content="通过")]
+
+
+@pytest.fixture
+def graph(db, monkeypatch):
+    """每个测试使用新数据库里的检查点表；默认阶段不重试"""
+    monkeypatch.setattr(travel_agent.checkpointer, "_initialized", False)
+    monkeypatch.setitem(resilience.STAGE_POLICIES, "default", resilience.StagePolicy(total_timeout=5, retries=0))
+    return db
+
+
+def test_failed_run_resumes_from_last_completed_node(graph, monkeypatch):
+    fake = install_fake_llm(monkeypatch, *FULL_RUN[:2], Step(error=RuntimeError("upstream 502")))
+    with pytest.raises(RuntimeError):
+        asyncio.run(travel_agent.plan_travel(**TRIP, request_id="r1"))
+
+    fake = install_fake_llm(monkeypatch, *FULL_RUN[2:])
+    assert asyncio.run(travel_agent.plan_travel(**TRIP, request_id="r1")) == "终稿"
+    assert fake.calls == 3  # 调研和草稿来自检查点
+
+    fake = install_fake_llm(monkeypatch)
+    assert asyncio.run(travel_agent.plan_travel(**TRIP, request_id="r1")) == "终稿"
+    assert fake.calls == 0  # 已完成的检查点直接返回
+
+
+def test_expired_checkpoint_is_ignored_and_purged(graph, monkeypatch):
+    install_fake_llm(monkeypatch, *FULL_RUN)
+    asyncio.run(travel_agent.plan_travel(**TRIP, request_id="r2"))
+
+    async def expire():
+        async with aiosqlite.connect(graph) as conn:
+            old = time.time() - travel_agent.checkpointer.ttl_seconds - 1
+            await conn.execute("UPDATE graph_checkpoints SET updated_at = ?", (old,))
+            await conn.commit()
+        config = {"configurable": {"thread_id": "r2"}}
+        values = (await travel_agent.travel_agent.aget_state(config)).values
+        return values, await travel_agent.refinalize_plan("r2", "幽默"), await travel_agent.checkpointer.purge_expired()
+
+    values, refinalized, purged = asyncio.run(expire())
+    assert values == {} and refinalized is None and purged == 1
+
+
+def test_refinalize_reruns_only_finalize_onwards(graph, monkeypatch):
+    install_fake_llm(monkeypatch, *FULL_RUN)
+    asyncio.run(travel_agent.plan_travel(**TRIP, request_id="r3"))
+
+    fake = install_fake_llm(monkeypatch, Step(content="幽默终稿"), Step(content="通过"))
+    assert asyncio.run(travel_agent.refinalize_plan("r3", "幽默")) == "幽默终稿"
+    assert fake.calls == 2
+    assert "草稿" in fake.prompts[0] and "文案风格要求：幽默" in fake.prompts[0]
+
+
+def test_resent_request_id_does_not_save_again(graph, monkeypatch):
+    runs = []
+
+    async def plan_travel(**kwargs):
+        runs.append(kwargs["request_id"])
+        return "# 成都方案"
+
+    monkeypatch.setattr(main, "plan_travel", plan_travel)
+    request = TravelRequest(**TRIP, request_id="r4")
+
+    async def run():
+        first = await main.create_travel_plan(request)
+        second = await main.create_travel_plan(request)
+        async with aiosqlite.connect(graph) as conn:
+            rows = (await (await conn.execute("SELECT COUNT(*) FROM travel_history")).fetchone())[0]
+        return first, second, rows
+
+    first, second, rows = asyncio.run(run())
+    assert first.success and second.success
+    assert (second.plan_id, second.plan) == (first.plan_id, "# 成都方案")
+    assert runs == ["r4"] and rows == 1
@@ -0,0 +1,69 @@
+import asyncio
+import gzip
+import json
+
+import aiosqlite
+import pytest
+
+from database import delete_plan, iter_history, save_plan
+from export import export_history, validate_date_range
+
+
+async def seed(db_path, n=5):
+    ids = [await save_plan(f"城市{i}", 1000 + i, "2026-05-01", "2026-05-03", f"# 方案 {i}") for i in range(n)]
+    async with aiosqlite.connect(db_path) as conn:
+        # 前两条放到 4 月，用于日期过滤
+        await conn.execute("UPDATE travel_history SET created_at = '2026-04-30T12:00:00' WHERE id <= 2")
+        await conn.commit()
+    return ids
+
+
+async def collect(gen):
+    return [item async for item in gen]
+
+
+def test_keyset_chunks_survive_concurrent_writes(db):
+    async def run():
+        ids = await seed(db)
+        seen = []
+        async for chunk in iter_history(chunk_size=2):
+            seen.append([row["id"] for row in chunk])
+            if len(seen) == 1:
+                # 导出过程中删除尚未读到的记录、追加新记录：不重复、不跳过、不报错
+                await delete_plan(ids[2])
+                ids.append(await save_plan("新城市", 999, "2026-05-01", "2026-05-03", "# 新"))
+        return ids, seen
+
+    ids, seen = asyncio.run(run())
+    assert seen == [ids[0:2], [ids[3], ids[4]], [ids[5]]]
+
+
+def test_export_ndjson_gzip_with_filters(db):
+    async def run():
+        await seed(db)
+        return b"".join(await collect(export_history(gzip=True, created_from="2026-05-01", include_plan=False,
+                                                      chunk_size=2)))
+
+    rows = [json.loads(line) for line in gzip.decompress(asyncio.run(run())).decode().splitlines()]
+    assert [r["destination"] for r in rows] == ["城市2", "城市3", "城市4"]
+    assert "plan_content" not in rows[0]
+
+
+def test_export_csv_includes_plans_and_inclusive_end_date(db):
+    async def run():
+        await seed(db)
+        full = b"".join(await collect(export_history(fmt="csv", created_to="2026-04-30"))).decode()
+        empty = b"".join(await collect(export_history(fmt="csv", destination="不存在"))).decode()
+        return full, empty
+
+    full, empty = asyncio.run(run())
+    lines = full.strip().splitlines()
+    assert lines[0].startswith("id,departure,destination") and len(lines) == 3
+    assert "# 方案 0" in lines[1]
+    assert empty.strip() == "id,departure,destination,budget,start_date,end_date,created_at,request_id,plan_content"
+
+
+def test_validate_date_range():
+    validate_date_range("2026-01-01", "2026-01-31T12:00:00")
+    with pytest.raises(ValueError, match="created_to"):
+        validate_date_range(None, "2026-13-01")
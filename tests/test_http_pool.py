@@ -0,0 +1,96 @@
+import asyncio
+
+import httpx
+import pytest
+
+import http_pool
+
+PROXY_VARS = ("http_proxy", "https_proxy", "all_proxy", "no_proxy")
+
+
+@pytest.fixture
+def proxy_env(monkeypatch):
+    """清空代理环境变量（大小写两种），返回设置函数"""
+    for name in PROXY_VARS:
+        monkeypatch.delenv(name, raising=False)
+        monkeypatch.delenv(name.upper(), raising=False)
+
+    def set_env(**values):
+        for name, value in values.items():
+            monkeypatch.setenv(name.upper(), value)
+
+    return set_env
+
+
+async def serve_proxy(seen: list):
+    """最小的 HTTP 正向代理：记录请求行，直接返回固定响应"""
+    async def handle(reader, writer):
+        head = await reader.readuntil(b"\r\n\r\n")
+        seen.append(head.split(b"\r\n")[0].decode())
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 7\r\nConnection: close\r\n\r\nproxied")
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def test_env_proxy_mounts(proxy_env):
+    assert http_pool.env_proxy_mounts() == {}
+    proxy_env(https_proxy="proxy.local:3128", no_proxy="localhost,.internal,example.com,10.0.0.1")
+    assert http_pool.env_proxy_mounts() == {
+        "https://": "http://proxy.local:3128",
+        "all://localhost": None,
+        "all://*.internal": None,
+        "all://*example.com": None,
+        "all://10.0.0.1": None,
+    }
+    proxy_env(no_proxy="*")
+    assert http_pool.env_proxy_mounts() == {}
+
+
+def test_requests_go_through_env_proxy_except_no_proxy(proxy_env):
+    async def run():
+        seen = []
+        server, port = await serve_proxy(seen)
+        proxy_env(http_proxy=f"http://user:pw@127.0.0.1:{port}", no_proxy="bypass.test")
+        client = http_pool.open_client()
+        try:
+            response = await client.get("http://llm.test/v1/models")
+            bypass = client._transport_for_url(httpx.URL("http://api.bypass.test/"))
+            snapshot = http_pool.snapshot()
+        finally:
+            await http_pool.aclose()
+            server.close()
+        return response.text, seen, bypass.proxy, snapshot["proxies"], port
+
+    text, seen, bypass_proxy, proxies, port = asyncio.run(run())
+    assert text == "proxied"
+    assert seen == ["GET http://llm.test/v1/models HTTP/1.1"]  # 代理收到绝对 URL 形式的请求
+    assert bypass_proxy is None
+    assert proxies == [f"http://127.0.0.1:{port}"]  # 指标中不含代理凭据
+
+
+def test_trust_env_disabled_ignores_proxies(proxy_env, monkeypatch):
+    proxy_env(all_proxy="http://127.0.0.1:9")
+    monkeypatch.setattr(http_pool, "HTTP_TRUST_ENV", False)
+
+    async def run():
+        client = http_pool.open_client()
+        try:
+            return client._transport_for_url(httpx.URL("https://api.test/")).proxy
+        finally:
+            await http_pool.aclose()
+
+    assert asyncio.run(run()) is None
+
+
+def test_run_blocking_is_counted_outside_the_pool():
+    async def run():
+        before = http_pool.metrics.blocking_calls
+        result = await http_pool.run_blocking(sum, [1, 2, 3])
+        snapshot = http_pool.snapshot()
+        await http_pool.aclose()
+        return result, snapshot["blocking"]["calls"] - before, snapshot["blocking"]["pooled"]
+
+    assert asyncio.run(run()) == (6, 1, False)
@@ -0,0 +1,60 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import aiosqlite
+
+import knowledge_base
+import travel_agent
+from database import save_plan
+
+
+def test_stale_targets_and_lookup_share_normalised_keys(db):
+    async def run():
+        for destination in ("成都", " 成都 ", "成都\n", "北京"):
+            await save_plan(destination, 3000, "2026-05-01", "2026-05-03", "# 方案")
+        targets = await knowledge_base.get_stale_targets(10, 72)
+        await knowledge_base.upsert_research(" 成都 ", "05", "调研")
+        return targets, await knowledge_base.get_fresh_research("成都", "05"), \
+            await knowledge_base.get_stale_targets(10, 72)
+
+    targets, research, remaining = asyncio.run(run())
+    assert targets == [("成都", "05"), ("北京", "05")]
+    assert research == "调研"
+    assert remaining == [("北京", "05")]
+
+
+def test_transport_cache_expires(db):
+    async def run():
+        await knowledge_base.upsert_transport(" 上海", "成都 ", "高铁 7 小时")
+        fresh = await knowledge_base.get_fresh_transport("上海", "成都")
+        async with aiosqlite.connect(db) as conn:
+            old = (datetime.now() - timedelta(hours=25)).isoformat()
+            await conn.execute("UPDATE departure_transport SET refreshed_at = ?", (old,))
+            await conn.commit()
+        return fresh, await knowledge_base.get_fresh_transport("上海", "成都", max_age_hours=24)
+
+    assert asyncio.run(run()) == ("高铁 7 小时", None)
+
+
+def test_kb_hit_searches_transport_once_per_route(db, monkeypatch):
+    searches = []
+
+    async def search_transport(departure, destination):
+        searches.append((departure, destination))
+        return "高铁 7 小时"
+
+    monkeypatch.setattr(travel_agent, "search_transport", search_transport)
+
+    async def run():
+        await knowledge_base.upsert_research("成都", "05", "调研")
+        first = await travel_agent._research("上海", "成都", "2026-05-01", "2026-05-03")
+        second = await travel_agent._research("上海", "成都", "2026-05-02", "2026-05-04")
+        other = await travel_agent._research("北京", "成都", "2026-05-01", "2026-05-03")
+        no_departure = await travel_agent._research("", "成都", "2026-05-01", "2026-05-03")
+        return first, second, other, no_departure
+
+    first, second, other, no_departure = asyncio.run(run())
+    assert searches == [("上海", "成都"), ("北京", "成都")]
+    assert first == second and first.startswith("调研") and "高铁 7 小时" in first
+    assert "北京" in other
+    assert no_departure == "调研"
@@ -0,0 +1,47 @@
+import asyncio
+import json
+
+import bench_pipeline
+import main
+from load_control import LoadController, load_controller, percentile
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 21))
+    assert percentile(values, 0.95) == 19
+    assert percentile(values[:19], 0.95) == 19  # 样本不足 20 个时等于最大值
+    assert percentile([3, 1, 2, 4], 0.5) == 2
+    assert percentile([7], 0.95) == 7
+
+
+def test_controller_and_bench_use_the_same_percentile():
+    latencies = [0.1 * i for i in range(1, 31)]
+    controller = LoadController(min_samples=1)
+    for value in latencies:
+        controller.record_latency(value)
+    records = [{"pipeline": "fused", "error": None, "ttft": v, "total": v, "budget_error": None, "over_budget": False}
+               for v in latencies]
+    summary = bench_pipeline.summarize(records, "fused")
+    assert summary["ttft_p95"] == round(controller.p95(), 3) == round(percentile(latencies, 0.95), 3)
+
+
+def test_streamed_plan_is_saved_while_request_is_tracked(monkeypatch):
+    seen = []
+
+    async def plan_travel_stream(*args):
+        yield 'data: {"type": "chunk", "content": "# 方案"}\n\n'
+
+    async def save_streamed_plan(*args):
+        seen.append(load_controller.in_flight)
+        return [{"type": "saved", "plan_id": 1}]
+
+    monkeypatch.setattr(main, "plan_travel_stream", plan_travel_stream)
+    monkeypatch.setattr(main, "save_streamed_plan", save_streamed_plan)
+
+    async def run():
+        response = await main.stream_travel_plan(3000, "上海", "成都", "2026-05-01", "2026-05-03")
+        return [chunk async for chunk in response.body_iterator]
+
+    chunks = asyncio.run(run())
+    assert seen == [1] and load_controller.in_flight == 0
+    assert json.loads(chunks[-1].removeprefix("data: ")) == {"type": "saved", "plan_id": 1}
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from plan_index import PlanIndex, itinerary_text, skeleton_query_text
+
+PLAN = """# 🧳 成都旅行计划
+
+## 📅 行程概览
+- **出发地**：上海
+- **总预算**：3000 元
+
+## 🗓️ 每日行程
+- Day1：宽窄巷子、人民公园喝茶
+- Day2：大熊猫繁育研究基地、春熙路
+
+## 💰 预算明细
+- 住宿：1200 元
+"""
+
+SKELETON = json.dumps({
+    "budget_allocation": {"交通": 800, "住宿": 1200},
+    "daily_themes": ["Day1: 宽窄巷子与人民公园", "Day2: 大熊猫基地和春熙路"],
+}, ensure_ascii=False)
+
+
+def record(plan_id, plan_content, budget=3000):
+    return {"id": plan_id, "departure": "上海", "destination": "成都", "start_date": "2026-11-01",
+            "end_date": "2026-11-02", "budget": budget, "plan_content": plan_content}
+
+
+def test_itinerary_section_and_skeleton_themes():
+    assert itinerary_text(PLAN).strip().startswith("- Day1：宽窄巷子")
+    assert "预算明细" not in itinerary_text(PLAN)
+    assert skeleton_query_text(SKELETON) == "Day1: 宽窄巷子与人民公园\nDay2: 大熊猫基地和春熙路"
+    assert skeleton_query_text('{"budget_allocation": {}}') == ""
+    assert skeleton_query_text("第一天：宽窄巷子") == "第一天：宽窄巷子"
+
+
+def test_skeleton_query_matches_the_plan_it_describes():
+    index = PlanIndex(text_dim=256)
+    index.add(record(1, PLAN))
+    index.add(record(2, PLAN.replace("宽窄巷子、人民公园喝茶", "都江堰、青城山").replace("大熊猫繁育研究基地、春熙路", "乐山大佛")))
+    best = index.search("上海", "成都", "2026-11-01", "2026-11-02", 3000, skeleton_query_text(SKELETON))
+    assert best.plan_id == 1
+    assert best.score > 0.9  # 结构化特征完全一致时，文本相似度不应把得分拉低到参考阈值附近
+
+
+def test_empty_query_text_keeps_structured_score():
+    index = PlanIndex(text_dim=256)
+    index.add(record(1, PLAN))
+    structured = index.search("上海", "成都", "2026-11-01", "2026-11-02", 3000)
+    assert index.search("上海", "成都", "2026-11-01", "2026-11-02", 3000, "").score == structured.score
+    assert structured.score == pytest.approx(1.0)
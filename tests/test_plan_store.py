@@ -0,0 +1,90 @@
+import asyncio
+
+import aiosqlite
+import pytest
+
+import database
+import plan_store
+from database import get_plan_by_id, init_db, save_plan
+
+
+def plan(i: int) -> str:
+    return f"# 🧳 成都旅行计划 {i}\n\n## 🗓️ 每日行程\n- Day1：宽窄巷子、人民公园（第 {i} 版）\n- Day2：春熙路\n"
+
+
+async def dict_ids(db_path):
+    async with aiosqlite.connect(db_path) as conn:
+        cursor = await conn.execute("SELECT id FROM plan_dicts ORDER BY id")
+        return [row[0] for row in await cursor.fetchall()]
+
+
+@pytest.mark.parametrize("codec", [plan_store.CODEC_ZLIB, plan_store.CODEC_ZSTD])
+def test_compress_roundtrip_with_dictionary(codec):
+    if codec == plan_store.CODEC_ZSTD and plan_store.zstandard is None:
+        pytest.skip("zstandard 未安装")
+    zdict = plan_store.build_sampled_dictionary([plan(i) for i in range(5)])
+    data = plan_store.compress(plan(99), codec, 1, zdict)
+    assert plan_store.decompress(data, codec, 1, zdict) == plan(99)
+
+
+def test_migrates_plaintext_rows_into_deduplicated_blobs(db):
+    async def run():
+        async with aiosqlite.connect(db) as conn:
+            for text in (plan(1), plan(2), plan(1)):
+                await conn.execute(
+                    "INSERT INTO travel_history (departure, destination, budget, start_date, end_date, "
+                    "plan_content, created_at) VALUES ('上海', '成都', 3000, '2026-05-01', '2026-05-02', ?, '')",
+                    (text,)
+                )
+            await conn.commit()
+        await init_db()  # 启动时迁移明文正文
+        async with aiosqlite.connect(db) as conn:
+            cursor = await conn.execute("SELECT plan_content, plan_hash FROM travel_history ORDER BY id")
+            rows = await cursor.fetchall()
+            blobs = (await (await conn.execute("SELECT COUNT(*) FROM plan_blobs")).fetchone())[0]
+        return rows, blobs, [(await get_plan_by_id(i)).plan_content for i in (1, 2, 3)]
+
+    rows, blobs, texts = asyncio.run(run())
+    assert all(content == "" and digest for content, digest in rows)
+    assert rows[0][1] == rows[2][1] and blobs == 2
+    assert texts == [plan(1), plan(2), plan(1)]
+
+
+def test_dictionary_is_retrained_after_enough_new_plans(db, monkeypatch):
+    monkeypatch.setattr(plan_store, "MIN_TRAIN_SAMPLES", 3)
+    monkeypatch.setattr(plan_store, "RETRAIN_ROWS", 4)
+
+    async def run():
+        first = await dict_ids(db)
+        for i in range(3):
+            await save_plan("成都", 3000, "2026-05-01", "2026-05-02", plan(i))
+        upgraded = await database.refresh_plan_dictionary()  # 种子字典 -> 样本足够后训练
+        for i in range(3, 7):
+            await save_plan("成都", 3000, "2026-05-01", "2026-05-02", plan(i))
+        retrained = await database.refresh_plan_dictionary()  # 当前字典压缩满 RETRAIN_ROWS 条
+        unchanged = await database.refresh_plan_dictionary()
+        texts = [(await get_plan_by_id(i)).plan_content for i in range(1, 8)]
+        return first, upgraded, retrained, unchanged, texts
+
+    first, upgraded, retrained, unchanged, texts = asyncio.run(run())
+    assert len(first) == 1 and first[0] < upgraded < retrained == unchanged
+    assert texts == [plan(i) for i in range(7)]  # 旧字典压缩的正文仍可解压
+
+
+def test_save_schedules_retrain_check_in_background(db, monkeypatch):
+    monkeypatch.setattr(plan_store, "RETRAIN_CHECK_EVERY", 2)
+    monkeypatch.setattr(plan_store, "_puts_since_check", 0)
+    checks = []
+
+    async def refresh():
+        checks.append(True)
+
+    monkeypatch.setattr(database, "refresh_plan_dictionary", refresh)
+
+    async def run():
+        for i in range(5):
+            await save_plan("成都", 3000, "2026-05-01", "2026-05-02", plan(i))
+        await asyncio.gather(*database._maintenance_tasks)
+
+    asyncio.run(run())
+    assert len(checks) == 2
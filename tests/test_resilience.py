@@ -0,0 +1,144 @@
+import asyncio
+from contextlib import aclosing
+
+import pytest
+
+import resilience
+from resilience import CircuitOpenError, LLMTimeoutError, StagePolicy
+from fake_llm import Step, install_fake_llm
+
+CONCURRENCY = 4
+
+
+def use_policy(monkeypatch, **kwargs) -> str:
+    kwargs.setdefault("backoff_base", 0.001)
+    monkeypatch.setitem(resilience.STAGE_POLICIES, "test", StagePolicy(**kwargs))
+    return "test"
+
+
+def slots_free() -> bool:
+    return resilience._llm_slots._value == CONCURRENCY
+
+
+def test_total_timeout(monkeypatch):
+    fake = install_fake_llm(monkeypatch, Step(delay=1))
+    stage = use_policy(monkeypatch, total_timeout=0.05)
+    with pytest.raises(LLMTimeoutError):
+        asyncio.run(resilience.ainvoke(stage, "p"))
+    assert fake.cancelled == 1 and fake.active == 0 and slots_free()
+
+
+def test_retry_then_success(monkeypatch):
+    fake = install_fake_llm(monkeypatch, Step(error=RuntimeError("502")), Step(content="done"))
+    stage = use_policy(monkeypatch, retries=2)
+    assert asyncio.run(resilience.ainvoke(stage, "p")) == "done"
+    assert fake.calls == 2
+    assert resilience.breaker.snapshot() == {"state": "closed", "failures": 0}
+
+
+def test_retries_exhausted_raises_last_error(monkeypatch):
+    fake = install_fake_llm(monkeypatch, Step(error=RuntimeError("a")), Step(error=RuntimeError("b")))
+    stage = use_policy(monkeypatch, retries=1)
+    with pytest.raises(RuntimeError, match="b"):
+        asyncio.run(resilience.ainvoke(stage, "p"))
+    assert fake.calls == 2
+
+
+def test_hedge_returns_faster_request_and_cancels_slower(monkeypatch):
+    fake = install_fake_llm(monkeypatch, Step(delay=1, content="slow"), Step(content="fast"))
+    monkeypatch.setattr(resilience, "HEDGING_ENABLED", True)
+    stage = use_policy(monkeypatch, hedge_after=0.02)
+    assert asyncio.run(resilience.ainvoke(stage, "p")) == "fast"
+    assert fake.calls == 2 and fake.cancelled == 1 and fake.active == 0 and slots_free()
+
+
+def test_hedge_cleans_up_when_caller_is_cancelled(monkeypatch):
+    fake = install_fake_llm(monkeypatch, Step(delay=1))
+    monkeypatch.setattr(resilience, "HEDGING_ENABLED", True)
+    stage = use_policy(monkeypatch, hedge_after=0.5)
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(resilience.ainvoke(stage, "p"), 0.02)
+        # 取消在返回前已完成：没有遗留的请求和并发名额
+        return fake.active, slots_free()
+
+    assert asyncio.run(run()) == (0, True)
+    assert fake.cancelled == 1
+
+
+def test_breaker_opens_half_opens_and_closes(monkeypatch):
+    fake = install_fake_llm(
+        monkeypatch, Step(error=RuntimeError("x")), Step(error=RuntimeError("x")),
+        failure_threshold=2, reset_timeout=0.05
+    )
+    stage = use_policy(monkeypatch)
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await resilience.ainvoke(stage, "p")
+        assert resilience.breaker.state == "open" and resilience.breaker.is_open
+        with pytest.raises(CircuitOpenError):
+            await resilience.ainvoke(stage, "p")
+        assert fake.calls == 2  # 打开期间不访问上游
+
+        await asyncio.sleep(0.06)
+        assert not resilience.breaker.is_open
+        assert await resilience.ainvoke(stage, "p") == "ok"  # 半开探测成功
+        assert resilience.breaker.state == "closed"
+
+    asyncio.run(run())
+
+
+def test_breaker_reopens_when_probe_fails(monkeypatch):
+    install_fake_llm(monkeypatch, *[Step(error=RuntimeError("x"))] * 3, failure_threshold=2, reset_timeout=0.05)
+    stage = use_policy(monkeypatch)
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await resilience.ainvoke(stage, "p")
+        await asyncio.sleep(0.06)
+        with pytest.raises(RuntimeError):
+            await resilience.ainvoke(stage, "p")
+        assert resilience.breaker.state == "open"
+
+    asyncio.run(run())
+
+
+def test_stream_first_token_timeout(monkeypatch):
+    fake = install_fake_llm(monkeypatch, Step(delay=1))
+    stage = use_policy(monkeypatch, first_token_timeout=0.05)
+
+    async def run():
+        return [chunk async for chunk in resilience.astream(stage, "p")]
+
+    with pytest.raises(LLMTimeoutError):
+        asyncio.run(run())
+    assert fake.active == 0 and slots_free()
+    assert resilience.breaker.failures == 1
+
+
+def test_stream_yields_chunks_and_records_ttft(monkeypatch):
+    install_fake_llm(monkeypatch, Step(chunks=["a", "", "b"]))
+    stage = use_policy(monkeypatch)
+
+    async def run():
+        return [chunk async for chunk in resilience.astream(stage, "p")]
+
+    assert asyncio.run(run()) == ["a", "b"]
+    assert resilience.load_controller.snapshot()["latency_samples"] == 1
+
+
+def test_stream_early_exit_releases_slot(monkeypatch):
+    fake = install_fake_llm(monkeypatch, Step(chunks=["a", "b", "c"], chunk_delay=0.01))
+    stage = use_policy(monkeypatch)
+
+    async def run():
+        async with aclosing(resilience.astream(stage, "p")) as stream:
+            async for _ in stream:
+                break
+        return fake.active, slots_free(), resilience.breaker.snapshot()
+
+    assert asyncio.run(run()) == (0, True, {"state": "closed", "failures": 0})
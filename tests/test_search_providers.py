@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import pytest
+
+import search_providers
+import travel_agent
+from search_providers import CompositeSearchProvider, LocalBM25Provider, SearchProvider, load_corpus, tokenize
+
+
+class StaticProvider(SearchProvider):
+    """返回固定结果（或抛出异常）的搜索后端"""
+
+    def __init__(self, hits=None, error=None):
+        self.hits = hits or []
+        self.error = error
+        self.calls = 0
+
+    async def search(self, query, destination="", max_results=2):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return self.hits
+
+
+def test_search_provider_is_abstract():
+    with pytest.raises(TypeError):
+        SearchProvider()
+
+
+def test_tokenize_uses_chinese_bigrams():
+    assert tokenize("成都火锅 AB12") == ["成都", "都火", "火锅", "ab12"]
+
+
+def test_load_corpus_skips_malformed_jsonl_lines(tmp_path):
+    (tmp_path / "data.jsonl").write_text(
+        '{"destination": "成都", "title": "t", "body": "b"}\n[1, 2]\n"text"\n{broken\n', encoding="utf-8"
+    )
+    assert list(load_corpus(tmp_path)) == [{"destination": "成都", "title": "t", "body": "b"}]
+
+
+def test_bm25_filters_by_destination_and_keeps_general_docs(corpus):
+    provider = LocalBM25Provider(str(corpus))
+    assert provider.available
+
+    hits = asyncio.run(provider.search("成都 特色美食 人均消费", "成都", 2))
+    assert hits and "火锅" in hits[0]["body"]
+    assert 0 < hits[0]["score"] <= 1
+
+    # 北京的文档不会出现在成都的结果里，通用文档对所有目的地可见
+    tips = asyncio.run(provider.search("预约 门票 天气", "成都", 5))
+    assert all("故宫" not in hit["body"] for hit in tips)
+    assert any("身份证件" in hit["body"] for hit in tips)
+
+    assert asyncio.run(provider.search("故宫", "不存在的城市", 2)) == []
+
+
+def test_bm25_rebuilds_index_when_corpus_changes(corpus, monkeypatch):
+    monkeypatch.setattr(search_providers, "SIGNATURE_CHECK_INTERVAL", 0)
+    provider = LocalBM25Provider(str(corpus))
+    assert asyncio.run(provider.search("熊猫", "杭州", 1)) == []
+
+    with open(corpus / "杭州.jsonl", "w", encoding="utf-8") as f:
+        f.write(json.dumps({"title": "西湖", "body": "西湖 熊猫 免费"}, ensure_ascii=False) + "\n")
+    assert asyncio.run(provider.search("西湖", "杭州", 1))[0]["title"] == "西湖"
+
+
+def test_empty_corpus_is_unavailable(tmp_path):
+    provider = LocalBM25Provider(str(tmp_path / "missing"))
+    assert not provider.available
+    assert asyncio.run(provider.search("故宫", "北京")) == []
+
+
+def test_composite_prefers_confident_local_hits():
+    local = StaticProvider([{"title": "l", "body": "", "score": 0.9}])
+    web = StaticProvider([{"title": "w", "body": ""}])
+    composite = CompositeSearchProvider(local, web, min_score=0.5)
+    assert asyncio.run(composite.search("q"))[0]["title"] == "l"
+    assert web.calls == 0
+
+
+def test_composite_falls_back_to_web_on_low_score_or_local_error():
+    web = StaticProvider([{"title": "w", "body": ""}])
+    low = CompositeSearchProvider(StaticProvider([{"title": "l", "body": "", "score": 0.1}]), web)
+    assert asyncio.run(low.search("q"))[0]["title"] == "w"
+
+    broken = CompositeSearchProvider(StaticProvider(error=RuntimeError("index broken")), web)
+    assert asyncio.run(broken.search("q"))[0]["title"] == "w"
+    assert broken.stats["web"] == 1
+
+
+def test_search_destination_survives_provider_errors(monkeypatch):
+    monkeypatch.setattr(travel_agent, "get_search_provider", lambda: StaticProvider(error=RuntimeError("boom")))
+    assert asyncio.run(travel_agent.search_destination("上海", "成都", "2026-11-01")) == ""
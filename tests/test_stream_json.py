@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from stream_json import IncrementalJSONParser, consume_json_stream, extract_json, repair_json
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1, "b": "he', {"a": 1, "b": "he"}),  # 未闭合的字符串
+    ('{"a": {"x": [1, 2', {"a": {"x": [1]}}),  # 末尾数字可能不完整，丢弃
+    ('{"a": 1500, "b": 15', {"a": 1500}),
+    ('{"a": 1,', {"a": 1}),  # 尾随逗号
+    ('{"a": 1, "b"', {"a": 1}),  # 孤立的键
+    ('{"a": 1, "b": tr', {"a": 1}),  # 不完整的字面量
+    ('{"a": [1, 2]}', {"a": [1, 2]}),
+])
+def test_repair_json(text, expected):
+    assert repair_json(text) == expected
+
+
+def test_repair_json_gives_up_on_garbage():
+    assert repair_json("not json at all") is None
+
+
+def test_extract_json_skips_fences_and_repairs_truncation():
+    assert extract_json('```json\n{"budget_allocation": {"交通": 1000}, "daily_themes": ["Day1: 城') == {
+        "budget_allocation": {"交通": 1000}, "daily_themes": ["Day1: 城"]
+    }
+    assert extract_json("没有 JSON") is None
+
+
+def test_parser_reports_fields_as_they_close():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"a": {"x": 1}, "b": "{not') == [("a", {"x": 1})]
+    assert parser.feed(' a brace}"}') == [("b", "{not a brace}")]
+    assert parser.complete and parser.snapshot() == {"a": {"x": 1}, "b": "{not a brace}"}
+
+
+def test_consume_stops_once_required_fields_close():
+    pulled = []
+    closed = []
+
+    async def chunks():
+        try:
+            for piece in ['{"a": 1, ', '"b": [2]', ', "c": "long tail', ' never read"}']:
+                pulled.append(piece)
+                yield piece
+        finally:
+            closed.append(True)
+
+    seen = []
+
+    async def on_field(key, value):
+        seen.append(key)
+
+    result = asyncio.run(consume_json_stream(chunks(), required=["a", "b"], on_field=on_field))
+    # "b" 在后面的逗号到达时闭合，随即停止读取并关闭上游；未完成的部分按修复结果返回
+    assert result == {"a": 1, "b": [2], "c": "long tail"}
+    assert seen == ["a", "b"] and len(pulled) == 3 and closed == [True]
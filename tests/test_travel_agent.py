@@ -0,0 +1,88 @@
+import asyncio
+import json
+from contextlib import aclosing
+
+import pytest
+
+import resilience
+import travel_agent
+from fake_llm import Step, install_fake_llm
+
+SKELETON = '{"budget_allocation": {"交通": 1000, "住宿": 1500}, "daily_themes": ["Day1: 城区"]}'
+
+
+@pytest.fixture
+def no_history(monkeypatch):
+    """不查询相似方案 / 知识库，调研直接返回固定结果"""
+    async def research(*args):
+        return '{"transport": "高铁"}'
+
+    monkeypatch.setattr(travel_agent, "_research", research)
+
+
+def events(chunks):
+    return [json.loads(chunk.removeprefix("data: ")) for chunk in chunks]
+
+
+async def collect(gen):
+    return [item async for item in gen]
+
+
+def test_plan_travel_stream_event_sequence(monkeypatch, no_history):
+    install_fake_llm(monkeypatch, Step(content=SKELETON), Step(content="草稿"), Step(chunks=["# 行程", "\n第一天"]))
+    result = events(asyncio.run(collect(travel_agent.plan_travel_stream(
+        5000, "上海", "成都", "2026-11-01", "2026-11-03", "two_pass", reuse_history=False
+    ))))
+    types = [e["type"] for e in result]
+    assert types[0] == "status" and types[-1] == "done"
+    assert {"type": "skeleton", "budget_allocation": {"交通": 1000, "住宿": 1500}} in result
+    assert result[-1]["content"] == "# 行程\n第一天"
+
+
+def test_forward_events_surfaces_real_error(monkeypatch, no_history):
+    async def slow_research(*args):
+        await asyncio.sleep(1)
+
+    async def failing_skeleton(*args, **kwargs):
+        raise ValueError("upstream 502")
+
+    monkeypatch.setattr(travel_agent, "_research", slow_research)
+    monkeypatch.setattr(travel_agent, "_draft_skeleton", failing_skeleton)
+    with pytest.raises(ValueError, match="upstream 502"):
+        asyncio.run(collect(travel_agent.plan_travel_stream(
+            5000, "上海", "成都", "2026-11-01", "2026-11-03", reuse_history=False
+        )))
+
+
+def test_closing_stream_early_releases_llm(monkeypatch, no_history):
+    fake = install_fake_llm(
+        monkeypatch, Step(content=SKELETON), Step(chunks=["a", "b", "c"], chunk_delay=0.01)
+    )
+
+    async def run():
+        stream = travel_agent.plan_travel_stream(5000, "上海", "成都", "2026-11-01", "2026-11-03", "fused",
+                                                 reuse_history=False)
+        async with aclosing(stream):
+            async for chunk in stream:
+                if '"chunk"' in chunk:
+                    break  # 客户端断开
+        return fake.active, resilience._llm_slots._value
+
+    assert asyncio.run(run()) == (0, 4)
+
+
+def test_skeleton_falls_back_to_raw_text(monkeypatch):
+    install_fake_llm(monkeypatch, Step(chunks=["第一天：宽窄巷子；", "预算 3000 元"]))
+    assert asyncio.run(travel_agent._draft_skeleton(3000)) == "第一天：宽窄巷子；预算 3000 元"
+
+
+def test_skeleton_reports_allocation_as_soon_as_it_closes(monkeypatch):
+    install_fake_llm(monkeypatch, Step(chunks=[SKELETON[:60], SKELETON[60:]]))
+    seen = []
+
+    async def on_allocation(value):
+        seen.append(value)
+
+    skeleton = asyncio.run(travel_agent._draft_skeleton(3000, on_allocation))
+    assert seen == [{"交通": 1000, "住宿": 1500}]
+    assert json.loads(skeleton)["daily_themes"] == ["Day1: 城区"]
@@ -1,19 +1,75 @@
-from typing import TypedDict, Literal
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import List, TypedDict, Literal, Optional, Tuple
 from langgraph.graph import StateGraph, END
 
-# 复用现有的 API 配置
-from apiset import llm
+# LLM 调用统一经过韧性层（超时 / 重试 / 熔断）
+import resilience
 from schemas import TravelState
+from load_control import load_controller
+from graph_checkpoint import SqliteCheckpointSaver
+from knowledge_base import get_fresh_research, get_fresh_transport, upsert_transport
+from search_results import build_search_context, compact_research
+from search_providers import get_search_provider
+from stream_json import consume_json_stream
+from database import get_plan_by_id
+from plan_index import find_similar_plan, skeleton_query_text, REUSE_THRESHOLD, REFERENCE_THRESHOLD
 from prompts import (
     RESEARCH_PROMPT, DRAFT_SKELETON_PROMPT, DRAFT_PLAN_PROMPT,
-    BUDGET_REVIEW_PROMPT, REVISE_PLAN_PROMPT, FINALIZE_ITINERARY_PROMPT,
-    CONTENT_REVIEW_PROMPT, POLISH_CONTENT_PROMPT
+    BUDGET_REVIEW_PROMPT, REVISE_PLAN_PROMPT, FINALIZE_ITINERARY_PROMPT, FUSED_ITINERARY_PROMPT,
+    CONTENT_REVIEW_PROMPT, POLISH_CONTENT_PROMPT, ADAPT_PLAN_PROMPT, REFERENCE_PLAN_BLOCK,
+    DEPARTURE_TRANSPORT_BLOCK,
+    RESEARCH_DESTINATION_OLD_PROMPT, CREATE_DRAFT_PLAN_OLD_PROMPT
 )
 
+logger = logging.getLogger(__name__)
+
+# 最近成功的调研结果缓存（熔断期间作为回退）
+_RESEARCH_CACHE_SIZE = 256
+_research_cache: "OrderedDict[tuple, str]" = OrderedDict()
+
+# 骨架 JSON 中后续阶段需要的字段，齐全后即可停止生成
+SKELETON_REQUIRED_KEYS = ("budget_allocation", "daily_themes")
+
+# 流式管线模式：two_pass 先生成方案再定稿；fused 一次生成直接输出定稿行程
+PIPELINE_TWO_PASS = "two_pass"
+PIPELINE_FUSED = "fused"
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", PIPELINE_TWO_PASS)
+
+# 注入提示词的参考方案最大长度（字符）
+REFERENCE_MAX_CHARS = 1500
+
+
+def _research_cache_key(destination: str, start_date: str) -> tuple:
+    """按 (目的地, 出行月份) 缓存调研结果"""
+    return (destination.strip(), start_date[:7])
+
+
+def remember_research(destination: str, start_date: str, research: str):
+    """记录一次成功的调研结果"""
+    key = _research_cache_key(destination, start_date)
+    _research_cache[key] = research
+    _research_cache.move_to_end(key)
+    while len(_research_cache) > _RESEARCH_CACHE_SIZE:
+        _research_cache.popitem(last=False)
+
+
+def cached_research(destination: str, start_date: str) -> str:
+    """获取缓存的调研结果，没有时返回通用提示"""
+    return _research_cache.get(
+        _research_cache_key(destination, start_date),
+        "【调研服务暂不可用】请基于通用知识进行规划。"
+    )
+
 
 # ========== Agent 节点 ==========
 
-def research_destination(state: TravelState) -> dict:
+async def research_destination(state: TravelState) -> dict:
     """调研目的地信息"""
     try:
         from duckduckgo_search import DDGS
@@ -26,17 +82,28 @@ def research_destination(state: TravelState) -> dict:
     except:
         pass
     
+    # 知识库中有新鲜的预计算调研时直接使用
+    record = await get_fresh_research(state['destination'], state['start_date'][5:7])
+    if record:
+        return {"research_result": record}
+    
     # 既然用户只要refactor，我先把这个文件头部改好，然后逐个节点替换prompt。
     prompt = RESEARCH_DESTINATION_OLD_PROMPT.format(
         destination=state['destination'],
         start_date=state['start_date'],
         end_date=state['end_date']
     )
-    response = llm.invoke(prompt)
-    return {"research_result": response.content}
+    if resilience.breaker.is_open:
+        return {"research_result": cached_research(state['destination'], state['start_date'])}
+    try:
+        research = await resilience.ainvoke("research", prompt)
+    except resilience.CircuitOpenError:
+        return {"research_result": cached_research(state['destination'], state['start_date'])}
+    remember_research(state['destination'], state['start_date'], research)
+    return {"research_result": research}
 
 
-def create_draft_plan(state: TravelState) -> dict:
+async def create_draft_plan(state: TravelState) -> dict:
     """制定初步旅行方案"""
     prompt = CREATE_DRAFT_PLAN_OLD_PROMPT.format(
         research_result=state['research_result'],
@@ -45,18 +112,16 @@ def create_draft_plan(state: TravelState) -> dict:
         start_date=state['start_date'],
         end_date=state['end_date']
     )
-    response = llm.invoke(prompt)
-    return {"draft_plan": response.content}
+    return {"draft_plan": await resilience.ainvoke("default", prompt)}
 
 
-def budget_review(state: TravelState) -> dict:
+async def budget_review(state: TravelState) -> dict:
     """预算审核节点"""
     prompt = BUDGET_REVIEW_PROMPT.format(
         budget=state['budget'],
         draft_plan=state['draft_plan']
     )
-    response = llm.invoke(prompt)
-    content = response.content
+    content = await resilience.ainvoke("default", prompt)
     
     # 解析审核结果
     if "approved" in content.lower():
@@ -72,38 +137,37 @@ def budget_review(state: TravelState) -> dict:
         }
 
 
-def revise_plan(state: TravelState) -> dict:
+async def revise_plan(state: TravelState) -> dict:
     """根据预算反馈修改方案"""
     prompt = REVISE_PLAN_PROMPT.format(
         draft_plan=state['draft_plan'],
         budget_feedback=state['budget_feedback'],
         budget=state['budget']
     )
-    response = llm.invoke(prompt)
-    return {"draft_plan": response.content}
+    return {"draft_plan": await resilience.ainvoke("default", prompt)}
 
 
-def finalize_itinerary(state: TravelState) -> dict:
+async def finalize_itinerary(state: TravelState) -> dict:
     """生成最终行程"""
     prompt = FINALIZE_ITINERARY_PROMPT.format(
         draft_plan=state['draft_plan'],
         research_result=state['research_result'],
         destination=state['destination'],
-        departure=state.get('departure', '未知'),
+        departure=state.get('departure') or '未知',
         start_date=state['start_date'],
         end_date=state['end_date'],
         budget=state['budget']
     )
+    if state.get('style'):
+        prompt += f"\n\n文案风格要求：{state['style']}"
     
-    response = llm.invoke(prompt)
-    return {"final_plan": response.content}
+    return {"final_plan": await resilience.ainvoke("default", prompt)}
 
 
-def content_review(state: TravelState) -> dict:
+async def content_review(state: TravelState) -> dict:
     """内容审核节点 - 审核文案质量"""
     prompt = CONTENT_REVIEW_PROMPT.format(final_plan=state['final_plan'])
-    response = llm.invoke(prompt)
-    content = response.content
+    content = await resilience.ainvoke("default", prompt)
     
     # 简单判断是否通过
     is_approved = "通过" in content and "需修改" not in content
@@ -114,14 +178,13 @@ def content_review(state: TravelState) -> dict:
     }
 
 
-def polish_content(state: TravelState) -> dict:
+async def polish_content(state: TravelState) -> dict:
     """根据审核反馈润色内容"""
     prompt = POLISH_CONTENT_PROMPT.format(
         final_plan=state['final_plan'],
         content_review_feedback=state['content_review_feedback']
     )
-    response = llm.invoke(prompt)
-    return {"final_plan": response.content}
+    return {"final_plan": await resilience.ainvoke("default", prompt)}
 
 
 # ========== 条件路由 ==========
@@ -131,12 +194,23 @@ def route_after_review(state: TravelState) -> Literal["finalize_itinerary", "rev
     if state.get("revision_count", 0) >= 3:
         return "finalize_itinerary"
     
+    # 降级模式：不再进行额外的修改轮次
+    if load_controller.degraded:
+        return "finalize_itinerary"
+    
     if state.get("review_status") == "approved":
         return "finalize_itinerary"
     else:
         return "revise_plan"
 
 
+def route_after_finalize(state: TravelState) -> Literal["content_review", "end"]:
+    """生成行程后决定是否进入内容审核（降级模式下跳过审核/润色）"""
+    if load_controller.degraded:
+        return "end"
+    return "content_review"
+
+
 def route_after_content_review(state: TravelState) -> Literal["polish_content", "end"]:
     """根据内容审核结果决定下一步"""
     if state.get("content_approved", False):
@@ -147,8 +221,8 @@ def route_after_content_review(state: TravelState) -> Literal["polish_content",
 
 # ========== 构建图 ==========
 
-def create_travel_agent():
-    """创建旅行规划 Agent"""
+def create_travel_agent(checkpointer=None):
+    """创建旅行规划 Agent（传入 checkpointer 时按 request_id 持久化每个节点的结果）"""
     # 初始化状态图
     workflow = StateGraph(TravelState)
     
@@ -180,8 +254,15 @@ def create_travel_agent():
     
     workflow.add_edge("revise_plan", "budget_review")
     
-    # 生成行程后进行内容审核
-    workflow.add_edge("finalize_itinerary", "content_review")
+    # 生成行程后进行内容审核（降级模式下直接结束）
+    workflow.add_conditional_edges(
+        "finalize_itinerary",
+        route_after_finalize,
+        {
+            "content_review": "content_review",
+            "end": END
+        }
+    )
     
     # 条件边：内容审核
     workflow.add_conditional_edges(
@@ -197,16 +278,18 @@ def create_travel_agent():
     workflow.add_edge("polish_content", END)
     
     # 编译图
-    return workflow.compile()
+    return workflow.compile(checkpointer=checkpointer)
 
 
-# 创建 Agent 实例
-travel_agent = create_travel_agent()
+# 创建 Agent 实例（检查点存储在 SQLite 中，重试时从最后完成的节点继续）
+checkpointer = SqliteCheckpointSaver()
+travel_agent = create_travel_agent(checkpointer)
 
 
 # ========== 运行入口 ==========
 
-async def plan_travel(budget: int, destination: str, start_date: str, end_date: str) -> str:
+async def plan_travel(budget: int, destination: str, start_date: str, end_date: str,
+                      departure: str = "", request_id: Optional[str] = None, style: str = "") -> str:
     """
     生成旅行规划
     
@@ -215,15 +298,32 @@ async def plan_travel(budget: int, destination: str, start_date: str, end_date:
         destination: 目的地
         start_date: 开始日期 (YYYY-MM-DD)
         end_date: 结束日期 (YYYY-MM-DD)
+        departure: 出发地（可选）
+        request_id: 检查点线程 ID；同一 ID 再次调用时从最后完成的节点继续
+        style: 文案风格（可选）
     
     Returns:
         最终旅行规划文本
     """
+    config = {"configurable": {"thread_id": request_id or uuid.uuid4().hex}}
+    
+    # 已有检查点：未完成则从断点继续，已完成则直接返回结果
+    if request_id:
+        snapshot = await travel_agent.aget_state(config)
+        if snapshot.next:
+            logger.info("从检查点继续规划 %s，下一节点: %s", request_id, snapshot.next)
+            result = await travel_agent.ainvoke(None, config)
+            return result["final_plan"]
+        if snapshot.values.get("final_plan"):
+            return snapshot.values["final_plan"]
+    
     initial_state: TravelState = {
         "budget": budget,
+        "departure": departure,
         "destination": destination,
         "start_date": start_date,
         "end_date": end_date,
+        "style": style,
         "research_result": "",
         "draft_plan": "",
         "budget_feedback": "",
@@ -235,95 +335,249 @@ async def plan_travel(budget: int, destination: str, start_date: str, end_date:
     }
     
     # 运行图
-    result = await travel_agent.ainvoke(initial_state)
+    result = await travel_agent.ainvoke(initial_state, config)
     return result["final_plan"]
 
 
+async def refinalize_plan(request_id: str, style: str) -> Optional[str]:
+    """
+    用新的文案风格重新定稿（复用检查点中的调研结果和已审核方案）
+    
+    Returns:
+        新的最终行程；检查点不存在或已过期时返回 None
+    """
+    config = {"configurable": {"thread_id": request_id}}
+    snapshot = await travel_agent.aget_state(config)
+    if not snapshot.values.get("draft_plan"):
+        return None
+    
+    # 以「预算审核已通过」的身份写入新风格，图会从 finalize_itinerary 继续执行
+    await travel_agent.aupdate_state(
+        config,
+        {"style": style, "review_status": "approved", "content_approved": False},
+        as_node="budget_review"
+    )
+    result = await travel_agent.ainvoke(None, config)
+    return result["final_plan"]
+
+
+# ========== 实时调研 ==========
+
+async def _safe_search(provider, query: str, destination: str) -> List[dict]:
+    """单个查询出错时记录日志并视为无结果，不影响其余查询和调研阶段"""
+    try:
+        return await provider.search(query, destination=destination)
+    except Exception as e:
+        logger.warning("搜索出错 %s: %s", query, e)
+        return []
+
+
+async def search_destination(departure: str, destination: str, start_date: str) -> Optional[str]:
+    """搜索目的地信息（本地语料 / 网页，见 SEARCH_BACKEND）并压缩为紧凑的提示词片段，无可用后端时返回 None"""
+    provider = get_search_provider()
+    if not provider.available:
+        return None
+    
+    # 构造搜索查询（出发地为空时只查目的地交通）
+    queries = [
+        f"{departure}到{destination}交通方式 价格 时间" if departure else f"{destination} 交通方式 价格",
+        f"{destination} {start_date} 天气",
+        f"{destination} 必游景点 门票价格",
+        f"{destination} 特色美食 人均消费"
+    ]
+    
+    hits = await asyncio.gather(*(_safe_search(provider, q, destination) for q in queries))
+    return build_search_context(dict(zip(queries, hits)))
+
+
+async def search_transport(departure: str, destination: str) -> Optional[str]:
+    """只查询出发地到目的地的交通（知识库命中时补充），无出发地、无后端或无结果时返回 None"""
+    provider = get_search_provider()
+    if not departure or not provider.available:
+        return None
+    query = f"{departure}到{destination}交通方式 价格 时间"
+    hits = await _safe_search(provider, query, destination)
+    return build_search_context({query: hits}) if hits else None
+
+
+async def _departure_transport(departure: str, destination: str) -> Optional[str]:
+    """出发地交通信息：优先读知识库缓存，未命中时搜索并写回"""
+    if not departure:
+        return None
+    transport = await get_fresh_transport(departure, destination)
+    if transport is None:
+        transport = await search_transport(departure, destination)
+        if transport:
+            try:
+                await upsert_transport(departure, destination, transport)
+            except Exception as e:
+                logger.warning("缓存交通信息失败: %s", e)
+    return transport
+
+
+async def research_live(departure: str, destination: str, start_date: str, end_date: str,
+                        strict: bool = False) -> str:
+    """
+    调研目的地 (优化：Real-Time Search + JSON)
+    
+    strict 为 True 时（知识库刷新）不接受回退结果，搜索或 LLM 不可用时直接抛出异常。
+    """
+    # 熔断期间跳过搜索，直接使用缓存调研
+    if resilience.breaker.is_open:
+        if strict:
+            raise resilience.CircuitOpenError("LLM 服务暂不可用（熔断中）")
+        return cached_research(destination, start_date)
+    
+    search_results = await search_destination(departure, destination, start_date)
+    if search_results is None:
+        if strict:
+            raise RuntimeError("搜索工具不可用")
+        return "【搜索工具不可用】请基于通用知识进行规划。"
+    
+    prompt = RESEARCH_PROMPT.format(
+        departure=departure or "全国各主要城市",
+        destination=destination,
+        start_date=start_date,
+        end_date=end_date,
+        search_results=search_results
+    )
+    try:
+        research = await resilience.ainvoke("research", prompt)
+    except resilience.CircuitOpenError:
+        if strict:
+            raise
+        return cached_research(destination, start_date)
+    research = compact_research(research)
+    remember_research(destination, start_date, research)
+    return research
+
+
 # ========== 流式输出入口 ==========
 
-async def plan_travel_stream(budget: int, departure: str, destination: str, start_date: str, end_date: str):
+def _status_event(step: int, message: str) -> str:
+    """构造 SSE 状态事件（附带当前负载模式 normal / degraded）"""
+    return f"data: {json.dumps({'type': 'status', 'step': step, 'message': message, 'mode': load_controller.snapshot()['mode']})}\n\n"
+
+
+async def _research(departure: str, destination: str, start_date: str, end_date: str) -> str:
+    """调研目的地：优先使用知识库中新鲜的预计算结果，否则实时调研"""
+    record = await get_fresh_research(destination, start_date[5:7])
+    if record:
+        # 知识库不区分出发地，出发地相关的交通信息按 (出发地, 目的地) 缓存，过期才重新搜索（不调用 LLM）
+        transport = await _departure_transport(departure, destination)
+        if transport:
+            return record + DEPARTURE_TRANSPORT_BLOCK.format(departure=departure, search_results=transport)
+        return record
+    return await research_live(departure, destination, start_date, end_date)
+
+
+async def _draft_skeleton(budget: int, on_allocation=None) -> str:
     """
-    流式生成旅行规划 - 用于 SSE
+    制定方案骨架：增量解析 JSON，必需字段齐全后立即停止生成
     
-    Yields:
-        dict: {"type": "status" | "chunk" | "done", "content": str}
+    模型输出不是合法 JSON（解析为空或缺少必需字段）时，原样返回已收到的文本。
+    
+    Args:
+        on_allocation: 预算分配一闭合就回调（async，参数为分配字典）
     """
-    import json
+    prompt = DRAFT_SKELETON_PROMPT.format(budget=budget)
+    received: List[str] = []
+
+    async def chunks():
+        async with aclosing(resilience.astream("skeleton", prompt)) as stream:
+            async for piece in stream:
+                received.append(piece)
+                yield piece
+
+    async def on_field(key, value):
+        if key == "budget_allocation" and isinstance(value, dict) and on_allocation:
+            await on_allocation(value)
+
+    try:
+        skeleton = await consume_json_stream(chunks(), required=SKELETON_REQUIRED_KEYS, on_field=on_field)
+    except resilience.CircuitOpenError:
+        raise
+    except Exception as e:
+        # 流式调用没有重试，失败时退回带重试的整段调用
+        logger.warning("骨架流式生成失败，改用整段调用: %s", e)
+        return await resilience.ainvoke("skeleton", prompt)
+    if not set(SKELETON_REQUIRED_KEYS).issubset(skeleton) and "".join(received).strip():
+        logger.warning("骨架输出无法解析为完整 JSON，按原文传给下游")
+        return "".join(received)
+    return json.dumps(skeleton, ensure_ascii=False, separators=(",", ":"))
+
+
+async def _forward_events(tasks: set, events: asyncio.Queue):
+    """
+    等待一组并发任务，同时按到达顺序转发它们放入队列的中间事件
     
-    # 步骤状态
-    steps = [
-        "🔍 正在调研目的地信息...",
-        "📋 正在制定初步方案...",
-        "💰 正在进行预算审核...",
-        "✨ 正在生成详细行程...",
-        "📝 正在润色优化文案..."
-    ]
+    任一任务失败、全部完成或调用方提前退出（客户端断开）时结束，取消并等待仍在运行的任务；
+    有任务失败时抛出第一个真实异常（与 asyncio.gather 一致），否则由调用方读取各任务的 result()。
+    """
+    try:
+        while True:
+            getter = asyncio.ensure_future(events.get())
+            done, _ = await asyncio.wait(tasks | {getter}, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                yield getter.result()
+                continue
+            getter.cancel()
+            if any(t.done() and not t.cancelled() and t.exception() for t in done) or all(t.done() for t in tasks):
+                break
+        while not events.empty():
+            yield events.get_nowait()
+    finally:
+        for task in tasks:
+            task.cancel()
+        # 等待被取消的任务真正结束，避免调用方读取 result() 时得到 InvalidStateError
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(result, asyncio.CancelledError):
+            raise result
+
+
+async def _final_prompt(
+    research_result: str,
+    draft_skeleton: str,
+    budget: int,
+    departure: str,
+    destination: str,
+    start_date: str,
+    end_date: str,
+    pipeline: Optional[str] = None,
+    reuse_history: bool = True
+) -> Tuple[str, str]:
+    """
+    基于调研和骨架构造最终流式输出的提示词
     
-    # 发送初始状态 - 并行执行调研和方案骨架
-    yield f"data: {json.dumps({'type': 'status', 'step': 1, 'message': '🚀 正在并行调研和规划...'})}\n\n"
+    two_pass 模式下先生成（不可见的）完整方案草稿；fused 模式直接返回定稿提示词。
+    reuse_history 为 False 时不注入相似历史方案作为参考。
     
-    # 定义并行任务
-    # 定义并行任务
-    async def research_task():
-        """调研目的地 (优化：Real-Time Search + JSON)"""
-        try:
-            from duckduckgo_search import DDGS
-        except ImportError:
-            return "【搜索工具不可用】请基于通用知识进行规划。"
-            
-        # 构造搜索查询
-        queries = [
-            f"{departure}到{destination}交通方式 价格 时间",
-            f"{destination} {start_date} 天气",
-            f"{destination} 必游景点 门票价格",
-            f"{destination} 特色美食 人均消费"
-        ]
-        
-        # 执行搜索
-        search_results = ""
-        # 使用 run_in_executor 避免阻塞 async loop
-        import asyncio
-        from functools import partial
-        
-        def run_search(q):
-            try:
-                with DDGS() as ddgs:
-                    # 获取前2条结果
-                    results = list(ddgs.text(q, max_results=2))
-                    return f"【搜索：{q}】\n{str(results)}\n\n"
-            except Exception as e:
-                return f"【搜索出错：{q}】\n{str(e)}\n\n"
-
-        loop = asyncio.get_running_loop()
-        for q in queries:
-            #由于DDGS可能是同步的，在executor中运行
-            res = await loop.run_in_executor(None, partial(run_search, q))
-            search_results += res
-        
-        prompt = RESEARCH_PROMPT.format(
-            departure=departure,
+    Returns:
+        (resilience 阶段名, 提示词)
+    """
+    # 较相似的历史方案作为参考注入提示词（骨架的每日主题与历史方案的每日行程比对），生成更短更快
+    reference_block = ""
+    similar = None
+    if reuse_history:
+        similar = await find_similar_plan(departure, destination, start_date, end_date, budget,
+                                          query_text=skeleton_query_text(draft_skeleton))
+    if similar and similar.score >= REFERENCE_THRESHOLD:
+        reference = await get_plan_by_id(similar.plan_id)
+        if reference:
+            reference_block = REFERENCE_PLAN_BLOCK.format(reference_plan=reference.plan_content[:REFERENCE_MAX_CHARS])
+    
+    if (pipeline or PIPELINE_MODE) == PIPELINE_FUSED:
+        # 融合模式：跳过不可见的中间方案，直接基于调研和骨架流式输出定稿
+        return "fused", FUSED_ITINERARY_PROMPT.format(
+            research_result=research_result,
+            draft_skeleton=draft_skeleton,
             destination=destination,
+            departure=departure,
             start_date=start_date,
             end_date=end_date,
-            search_results=search_results
-        )
-        response = await llm.ainvoke(prompt)
-        return response.content
-    
-    async def draft_skeleton_task():
-        """制定方案骨架 (优化：极简 JSON 输出)"""
-        prompt = DRAFT_SKELETON_PROMPT.format(budget=budget)
-        response = await llm.ainvoke(prompt)
-        return response.content
-    
-    # 🚀 并行执行两个任务
-    import asyncio
-    research_result, draft_skeleton = await asyncio.gather(
-        research_task(),
-        draft_skeleton_task()
-    )
-    
-    yield f"data: {json.dumps({'type': 'status', 'step': 2, 'message': steps[1]})}\n\n"
+            budget=budget
+        ) + reference_block
     
     # 整合调研结果和骨架，制定完整方案
     draft_prompt = DRAFT_PLAN_PROMPT.format(
@@ -334,19 +588,15 @@ async def plan_travel_stream(budget: int, departure: str, destination: str, star
         destination=destination,
         start_date=start_date,
         end_date=end_date
-    )
+    ) + reference_block
     
     draft_plan = ""
-    async for chunk in llm.astream(draft_prompt):
-        draft_plan += chunk.content
-    
-    yield f"data: {json.dumps({'type': 'status', 'step': 3, 'message': steps[2]})}\n\n"
-    
-    # 预算审核（简化版）
-    yield f"data: {json.dumps({'type': 'status', 'step': 4, 'message': steps[3]})}\n\n"
+    async with aclosing(resilience.astream("draft", draft_prompt)) as stream:
+        async for content in stream:
+            draft_plan += content
     
     # 生成最终行程（流式输出）
-    final_prompt = FINALIZE_ITINERARY_PROMPT.format(
+    return "finalize", FINALIZE_ITINERARY_PROMPT.format(
         draft_plan=draft_plan,
         research_result=research_result,
         destination=destination,
@@ -356,16 +606,193 @@ async def plan_travel_stream(budget: int, departure: str, destination: str, star
         budget=budget
     )
 
-    yield f"data: {json.dumps({'type': 'status', 'step': 5, 'message': steps[4]})}\n\n"
+
+async def plan_travel_stream(
+    budget: int,
+    departure: str,
+    destination: str,
+    start_date: str,
+    end_date: str,
+    pipeline: Optional[str] = None,
+    reuse_history: bool = True
+):
+    """
+    流式生成旅行规划 - 用于 SSE
+    
+    Args:
+        pipeline: two_pass（方案 + 定稿两次生成）或 fused（单次生成定稿），默认取 PIPELINE_MODE
+        reuse_history: 是否复用 / 参考相似的历史方案（A/B 对比时关闭，避免缓存方案影响结果）
+    
+    Yields:
+        dict: {"type": "status" | "chunk" | "done", "content": str}
+    """
+    # 步骤状态
+    steps = [
+        "🔍 正在调研目的地信息...",
+        "📋 正在制定初步方案...",
+        "💰 正在进行预算审核...",
+        "✨ 正在生成详细行程...",
+        "📝 正在润色优化文案..."
+    ]
+    
+    # 条件几乎相同的历史方案：一次短的改编调用直接输出，跳过整个流程
+    similar = await find_similar_plan(departure, destination, start_date, end_date, budget) if reuse_history else None
+    reference = await get_plan_by_id(similar.plan_id) if similar and similar.score >= REUSE_THRESHOLD else None
+    if reference:
+        yield _status_event(5, f"♻️ 找到相似的历史方案（相似度 {similar.score:.0%}），正在改编...")
+        adapt_prompt = ADAPT_PLAN_PROMPT.format(
+            reference_plan=reference.plan_content,
+            departure=departure,
+            destination=destination,
+            start_date=start_date,
+            end_date=end_date,
+            budget=budget
+        )
+        full_content = ""
+        async with aclosing(resilience.astream("adapt", adapt_prompt)) as stream:
+            async for content in stream:
+                full_content += content
+                yield f"data: {json.dumps({'type': 'chunk', 'content': content})}\n\n"
+        yield f"data: {json.dumps({'type': 'done', 'content': full_content})}\n\n"
+        return
+    
+    # 发送初始状态 - 并行执行调研和方案骨架
+    yield _status_event(1, '🚀 正在并行调研和规划...')
+    
+    # 骨架流中途产出的事件（预算分配一闭合就推给前端）
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def on_allocation(value):
+        await events.put(f"data: {json.dumps({'type': 'skeleton', 'budget_allocation': value})}\n\n")
+    
+    # 🚀 并行执行两个任务，同时转发骨架流的中间事件
+    research_t = asyncio.create_task(_research(departure, destination, start_date, end_date))
+    skeleton_t = asyncio.create_task(_draft_skeleton(budget, on_allocation))
+    async with aclosing(_forward_events({research_t, skeleton_t}, events)) as forwarded:
+        async for event in forwarded:
+            yield event
+    research_result, draft_skeleton = research_t.result(), skeleton_t.result()
+    
+    yield _status_event(2, steps[1])
+    
+    stage, final_prompt = await _final_prompt(
+        research_result, draft_skeleton, budget, departure, destination, start_date, end_date, pipeline,
+        reuse_history
+    )
+    if stage == "finalize":
+        # 预算审核（简化版）
+        yield _status_event(3, steps[2])
+    yield _status_event(4, steps[3])
+    yield _status_event(5, steps[4])
     
     # 流式输出最终内容
     full_content = ""
-    async for chunk in llm.astream(final_prompt):
-        content = chunk.content
-        if content:
+    async with aclosing(resilience.astream(stage, final_prompt)) as stream:
+        async for content in stream:
             full_content += content
             yield f"data: {json.dumps({'type': 'chunk', 'content': content})}\n\n"
     
     # 完成
     yield f"data: {json.dumps({'type': 'done', 'content': full_content})}\n\n"
 
+
+# ========== 多档位方案对比 ==========
+
+MAX_VARIANTS = 4
+# 按预算从低到高命名
+VARIANT_LABELS = {
+    1: ("标准",),
+    2: ("经济型", "舒适型"),
+    3: ("经济型", "舒适型", "豪华型"),
+}
+
+
+def variant_labels(budgets: List[int]) -> List[str]:
+    """按预算高低为各档位命名（与 budgets 顺序一致）"""
+    order = sorted(range(len(budgets)), key=lambda i: budgets[i])
+    names = VARIANT_LABELS.get(len(budgets)) or tuple(f"方案 {rank + 1}" for rank in range(len(budgets)))
+    labels = [""] * len(budgets)
+    for rank, index in enumerate(order):
+        labels[index] = names[rank]
+    return labels
+
+
+async def plan_variants_stream(
+    budgets: List[int],
+    departure: str,
+    destination: str,
+    start_date: str,
+    end_date: str,
+    pipeline: Optional[str] = None,
+    on_complete=None
+):
+    """
+    多个预算档位共用一次调研，并行生成多份方案，通过同一个 SSE 连接输出
+    
+    除 status 外的事件都带 variant（档位序号，对应 budgets 下标），各档位的 chunk 交错到达。
+    某个档位失败只发送该档位的 error 事件，不影响其它档位。
+    多档位模式不走「相似方案直接改编」的捷径，但仍会注入相似的参考方案。
+    
+    Args:
+        on_complete: 单个档位生成完成后的回调 async (budget, content) -> List[dict]，
+            返回的事件（例如保存结果、预算解析）会带上 variant 后随流输出
+    
+    Yields:
+        str: SSE 事件
+    """
+    def event(payload: dict, variant: Optional[int] = None) -> str:
+        if variant is not None:
+            payload = {**payload, "variant": variant}
+        return f"data: {json.dumps(payload)}\n\n"
+    
+    labels = variant_labels(budgets)
+    yield event({
+        "type": "variants",
+        "variants": [{"variant": i, "budget": b, "label": labels[i]} for i, b in enumerate(budgets)]
+    })
+    yield _status_event(1, f'🚀 正在调研目的地，并行规划 {len(budgets)} 个预算档位...')
+    
+    events: asyncio.Queue = asyncio.Queue()
+
+    def allocation_sink(variant: int):
+        async def on_allocation(value):
+            await events.put(event({"type": "skeleton", "budget_allocation": value}, variant))
+        return on_allocation
+    
+    # 调研只做一次，各档位骨架与调研并行
+    research_t = asyncio.create_task(_research(departure, destination, start_date, end_date))
+    skeleton_ts = [asyncio.create_task(_draft_skeleton(b, allocation_sink(i))) for i, b in enumerate(budgets)]
+    async with aclosing(_forward_events({research_t, *skeleton_ts}, events)) as forwarded:
+        async for item in forwarded:
+            yield item
+    research_result = research_t.result()
+    skeletons = [t.result() for t in skeleton_ts]
+    
+    yield _status_event(4, f"✨ 正在并行生成 {len(budgets)} 份行程...")
+    
+    async def generate(variant: int, budget: int, skeleton: str) -> bool:
+        try:
+            stage, prompt = await _final_prompt(
+                research_result, skeleton, budget, departure, destination, start_date, end_date, pipeline
+            )
+            content = ""
+            async with aclosing(resilience.astream(stage, prompt)) as stream:
+                async for piece in stream:
+                    content += piece
+                    await events.put(event({"type": "chunk", "content": piece}, variant))
+            await events.put(event({"type": "done", "content": content}, variant))
+            if on_complete and content:
+                for payload in await on_complete(budget, content):
+                    await events.put(event(payload, variant))
+            return True
+        except Exception as e:
+            logger.warning("档位 %d（预算 %d）生成失败: %s", variant, budget, e)
+            await events.put(event({"type": "error", "message": str(e)}, variant))
+            return False
+    
+    tasks = [asyncio.create_task(generate(i, b, skeletons[i])) for i, b in enumerate(budgets)]
+    async with aclosing(_forward_events(set(tasks), events)) as forwarded:
+        async for item in forwarded:
+            yield item
+    
+    yield event({"type": "variants_done", "succeeded": sum(t.result() for t in tasks)})